@@ -0,0 +1,261 @@
+"""
+End-to-end load benchmark for the qualtrix request paths.
+
+The app runs in-process against the fake Qualtrics server in
+tests/fake_qualtrics.py (also in-process unless --base-url points at a running
+one), so every request goes through the real client, transport, rate limiting,
+caches and outbox. Each scenario sends --requests requests with --concurrency
+in flight and reports throughput and p50/p95/p99 latency.
+
+    python -m benchmarks.load --scenario redirect response --requests 500 \\
+        --concurrency 20 --latency 0.05 --throttle-rate 0.02
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+FAKE_BASE_URL = "http://qualtrics.test/API/v3"
+# Longer than any request deadline, so the app's own 504s are measured instead
+BENCH_TIMEOUT = 600
+
+_workdir = tempfile.mkdtemp(prefix="qualtrix-bench-")
+for name, value in {
+    "QUALTRIX_BASE_URL": FAKE_BASE_URL,
+    "QUALTRIX_API_TOKEN": "bench",  # nosec B105 - dummy token for the fake server
+    "QUALTRIX_DIRECTORY_ID": "POOL_1",
+    "QUALTRIX_MAILING_LIST_ID": "CG_1",
+    "QUALTRIX_LIBRARY_ID": "UR_1",
+    "QUALTRIX_INVITE_MESSAGE_ID": "MS_1",
+    "QUALTRIX_REMINDER_MESSAGE_ID": "MS_2",
+    "OUTBOX_PATH": os.path.join(_workdir, "outbox.db"),
+    "CONTACT_INDEX_PATH": os.path.join(_workdir, "contacts.db"),
+    "EXPORT_CACHE_PATH": os.path.join(_workdir, "exports.db"),
+    "CONTACT_INDEX_WARM": "False",
+    "LOG_LEVEL": "WARNING",
+}.items():
+    os.environ.setdefault(name, value)
+
+# pylint: disable=wrong-import-position
+import httpx
+
+from qualtrix import main as qualtrix_main, settings, transport
+from tests.fake_qualtrics import FakeQualtrics
+
+SCENARIOS = {}
+
+
+def scenario(name: str):
+    def register(fn):
+        SCENARIOS[name] = fn
+        return fn
+
+    return register
+
+
+def _participant(i: int) -> dict:
+    return {
+        "surveyId": "SV_1",
+        "targetSurveyId": "SV_2",
+        "RulesConsentID": f"FS_{i}",
+        "SurveyswapID": "1",
+        "SurveyswapGroup": "A",
+        "utm_campaign": "bench",
+        "utm_medium": "bench",
+        "utm_source": "bench",
+        "email": f"participant{i}-{uuid.uuid4().hex[:8]}@example.com",
+        "firstName": "First",
+        "lastName": "Last",
+    }
+
+
+@scenario("redirect")
+async def redirect(app: httpx.AsyncClient, i: int) -> httpx.Response:
+    return await app.post(
+        "/redirect",
+        headers={"Idempotency-Key": uuid.uuid4().hex},
+        json=_participant(i),
+    )
+
+
+@scenario("redirect-batch")
+async def redirect_batch(app: httpx.AsyncClient, i: int) -> httpx.Response:
+    return await app.post(
+        "/redirect-batch",
+        json={"participants": [_participant(i * 50 + j) for j in range(50)]},
+    )
+
+
+@scenario("response")
+async def response(app: httpx.AsyncClient, i: int) -> httpx.Response:
+    # A pool of ids, so repeat lookups exercise the response cache
+    return await app.post(
+        "/response", json={"surveyId": "SV_1", "responseId": f"R_{i % 1000:08d}"}
+    )
+
+
+@scenario("responses")
+async def responses(app: httpx.AsyncClient, i: int) -> httpx.Response:
+    return await app.post(
+        "/responses",
+        json={
+            "responses": [
+                {"surveyId": "SV_1", "responseId": f"R_{i:05d}{j:03d}"}
+                for j in range(20)
+            ]
+        },
+    )
+
+
+@scenario("contact-response-ids")
+async def contact_response_ids(app: httpx.AsyncClient, i: int) -> httpx.Response:
+    return await app.get(f"/contact/CID_{i:08d}/responseIds")
+
+
+@scenario("dist-response-ids")
+async def dist_response_ids(app: httpx.AsyncClient, i: int) -> httpx.Response:
+    return await app.get(f"/dist/{i:08d}_x/responseIds")
+
+
+@scenario("bulk-responses")
+async def bulk_responses(app: httpx.AsyncClient, i: int) -> httpx.Response:
+    """
+    Submit an export job, poll it and download the result
+    """
+    submitted = await app.post("/bulk-responses", json={"surveyId": f"SV_{i}"})
+    job_id = submitted.json()["jobId"]
+    while True:
+        status = (await app.get(f"/bulk-responses/{job_id}")).json()["status"]
+        if status != "inProgress":
+            break
+        await asyncio.sleep(0.05)
+    return await app.get(f"/bulk-responses/{job_id}/result")
+
+
+def percentile(latencies: list[float], percent: float) -> float:
+    ordered = sorted(latencies)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(
+    app: httpx.AsyncClient, name: str, requests: int, concurrency: int
+) -> dict:
+    send = SCENARIOS[name]
+    counter = itertools.count()
+    latencies, statuses = [], {}
+
+    async def worker():
+        for i in iter(lambda: next(counter), None):
+            if i >= requests:
+                return
+            start = time.perf_counter()
+            try:
+                status = (await send(app, i)).status_code
+            except Exception as e:  # pylint: disable=broad-except
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1),
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+
+
+async def benchmark(args) -> list[dict]:
+    fake = FakeQualtrics(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        link_delay=args.link_delay,
+        export_duration=args.export_duration,
+        export_size=args.export_size,
+        seed=args.seed,
+    )
+    if args.base_url:
+        settings.BASE_URL = args.base_url
+    else:
+        transport._client = httpx.AsyncClient(  # pylint: disable=protected-access
+            transport=httpx.ASGITransport(app=fake.app), timeout=settings.TIMEOUT
+        )
+
+    results = []
+    async with qualtrix_main.lifespan(qualtrix_main.app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=qualtrix_main.app),
+            base_url="http://qualtrix.test",
+            timeout=BENCH_TIMEOUT,
+        ) as app:
+            for name in args.scenario:
+                requests = args.requests
+                if name == "bulk-responses":
+                    requests = min(requests, args.export_jobs)
+                result = await run_scenario(app, name, requests, args.concurrency)
+                result["upstream_requests"] = fake.requests
+                result["injected"] = dict(fake.injected)
+                results.append(result)
+                print(_format(result), file=sys.stderr)
+    return results
+
+
+def _format(result: dict) -> str:
+    return (
+        f"{result['scenario']:<22} {result['requests']:>6} req "
+        f"{result['throughput']:>8} req/s  p50 {result['p50_ms']:>8} ms  "
+        f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+        f"{result['statuses']}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--scenario",
+        nargs="+",
+        choices=sorted(SCENARIOS),
+        default=["redirect", "response", "contact-response-ids", "bulk-responses"],
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--export-jobs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--link-delay", type=float, default=0.0)
+    parser.add_argument("--export-duration", type=float, default=0.5)
+    parser.add_argument("--export-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--base-url", help="Qualtrics API base URL of an already running fake"
+    )
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
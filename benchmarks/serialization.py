@@ -0,0 +1,65 @@
+"""
+Serialization benchmark for the bulk export path.
+
+Compares encoding an export result with FastAPI's default path
+(jsonable_encoder + JSONResponse) against ORJSONResponse, and decoding a raw
+Qualtrics response body with the stdlib json module against orjson.
+
+    python -m benchmarks.serialization --answers 10000
+"""
+
+import argparse
+import json
+import timeit
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from qualtrix import extract
+from tests.fake_qualtrics import FakeQualtrics
+
+
+def _answers(count: int) -> list[dict]:
+    fake = FakeQualtrics()
+    results = [
+        fake.response(f"R_{i:08d}", "quality_test" if i % 2 else None)
+        for i in range(count)
+    ]
+    return extract.extract_batch(results)
+
+
+def _time(fn, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--answers", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    answers = _answers(args.answers)
+    body = json.dumps(
+        {"meta": {"httpStatus": "200 - OK"}, "result": {"responses": answers}}
+    ).encode()
+
+    timings = {
+        "encode default": _time(
+            lambda: JSONResponse(jsonable_encoder(answers)).body, args.repeat
+        ),
+        "encode orjson": _time(lambda: ORJSONResponse(answers).body, args.repeat),
+        "decode json": _time(lambda: json.loads(body), args.repeat),
+        "decode orjson": _time(lambda: orjson.loads(body), args.repeat),
+    }
+    for name, seconds in timings.items():
+        print(f"{name:<16} {seconds * 1000:>9.1f} ms")
+    print(
+        f"encode speedup {timings['encode default'] / timings['encode orjson']:.1f}x,"
+        f" decode speedup {timings['decode json'] / timings['decode orjson']:.1f}x"
+        f" ({args.answers} answers, {len(body) / 1e6:.1f} MB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
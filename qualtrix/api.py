@@ -2,32 +2,74 @@
 qualtrix rest api
 """
 
-from asyncio import create_task
+import asyncio
 from datetime import datetime, timedelta
+import hmac
 import logging
 import time
+import urllib.parse
 from zoneinfo import ZoneInfo
 
 import fastapi
 from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+import orjson
 from pydantic import BaseModel
 
-from qualtrix import client, error, settings
+from qualtrix import (
+    client,
+    contacts,
+    deadline,
+    error,
+    export_cache,
+    idempotency,
+    jobs,
+    outbox,
+    settings,
+    tabular,
+    tracing,
+)
 
 log = logging.getLogger(__name__)
 
 router = fastapi.APIRouter()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+PARTIAL_RESULTS_HEADER = "X-Partial-Results"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    JSON encoded with orjson, falling back to the standard encoder for content
+    orjson rejects (integers beyond 64 bits) so it renders like JSONResponse
+    """
+
+    def render(self, content) -> bytes:
+        try:
+            return super().render(content)
+        except TypeError:
+            return JSONResponse.render(self, jsonable_encoder(content))
+
 
 class SurveyModel(BaseModel):
     surveyId: str
 
 
+class ExportModel(SurveyModel):
+    incremental: bool | None = False
+
+
 class ResponseModel(SurveyModel):
     responseId: str
     raw: bool | None = False
 
 
+class ResponsesModel(BaseModel):
+    responses: list[ResponseModel]
+
+
 class SessionModel(SurveyModel):
     sessionId: str
 
@@ -45,61 +87,307 @@ class RedirectModel(SurveyModel):
     lastName: str
 
 
-@router.post("/bulk-responses")
-async def get_bulk_responses(request: SurveyModel):
-    return client.result_export(request.surveyId)
+class RedirectBatchModel(BaseModel):
+    participants: list[RedirectModel]
 
 
-@router.post("/response")
-async def get_response(request: ResponseModel):
+@router.post("/bulk-responses", status_code=202)
+async def get_bulk_responses(request: ExportModel):
+    """
+    Submit a bulk response export job, returning its job id. Incremental jobs
+    only export responses collected since the survey's previous incremental
+    export and merge them into the local export cache.
+    """
+    return jobs.submit_export(request.surveyId, request.incremental).to_dict()
+
+
+@router.get("/bulk-responses/{jobId}")
+async def get_bulk_responses_status(jobId: str):
+    return (await _get_export_job(jobId)).to_dict()
+
+
+@router.get("/bulk-responses/{jobId}/result")
+async def get_bulk_responses_result(jobId: str, request: fastapi.Request):
+    """
+    Fetch the answers of a completed export. Clients sending
+    "Accept: application/x-ndjson" receive one answer per line as the export
+    file is parsed instead of a single JSON list. Arrow, Parquet and CSV tables
+    are streamed the same way when accepted, see tabular.py.
+    """
+    job = await _get_export_job(jobId)
+    if job.status != jobs.COMPLETE:
+        raise HTTPException(
+            status_code=409, detail=f"Export job is {job.status}, result unavailable"
+        )
+
+    if job.incremental:
+        if not jobs.is_local(job):
+            raise HTTPException(
+                status_code=404,
+                detail="Incremental export results are only available from the"
+                " instance that ran the job",
+            )
+        answers = export_cache.iter_answers(job.survey_id)
+    else:
+        answers = jobs.iter_file(job)
+
+    accept = request.headers.get("accept", "")
+    if NDJSON_MEDIA_TYPE in accept:
+        return StreamingResponse(
+            _until_error(_ndjson(answers)), media_type=NDJSON_MEDIA_TYPE
+        )
+
+    media_type = tabular.negotiate(accept)
+    if media_type is not None:
+        return StreamingResponse(
+            _until_error(tabular.encode(answers, media_type)), media_type=media_type
+        )
+
     try:
-        return client.get_response(request.surveyId, request.responseId, request.raw)
+        return FastJSONResponse([answer async for answer in answers])
     except error.QualtricsError as e:
         raise HTTPException(status_code=400, detail=e.args)
 
 
-@router.post("/redirect")
-async def intake_redirect(request: RedirectModel):
-    start_time = time.time()
+async def _ndjson(answers):
+    async for answer in answers:
+        yield orjson.dumps(answer) + b"\n"
+
+
+async def _until_error(chunks):
     try:
-        directory_entry = client.create_directory_entry(
-            request.email,
-            request.firstName,
-            request.lastName,
-            settings.DIRECTORY_ID,
-            settings.MAILING_LIST_ID,
+        async for chunk in chunks:
+            yield chunk
+    except error.QualtricsError as e:
+        # Headers are already sent, so the stream can only be cut short
+        log.error(e)
+
+
+async def _get_export_job(job_id: str) -> jobs.ExportJob:
+    job = await jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Export job not found, jobs are only shared between instances"
+            " with CACHE_BACKEND set to redis",
         )
+    return job
 
-        email_distribution = client.create_email_distribution(
-            directory_entry["contactLookupId"],
-            settings.LIBRARY_ID,
-            settings.INVITE_MESSAGE_ID,
-            settings.MAILING_LIST_ID,
-            request.targetSurveyId,
+
+@router.post(
+    "/response",
+    dependencies=[fastapi.Depends(deadline.budget(settings.DEADLINES["response"]))],
+)
+async def get_response(request: ResponseModel):
+    try:
+        return FastJSONResponse(
+            await client.get_response(request.surveyId, request.responseId, request.raw)
         )
+    except error.QualtricsError as e:
+        raise HTTPException(status_code=400, detail=e.args)
 
-        link = client.get_link(request.targetSurveyId, email_distribution["id"])
-
-        # If link creation succeeds, create reminders while the link is returned
-        create_task(create_reminder_distributions(email_distribution["id"]))
-        create_task(
-            add_user_to_contact_list(
-                link["link"],
-                directory_entry["id"],
-                request.RulesConsentID,
-                request.SurveyswapID,
-                request.SurveyswapGroup,
-                request.utm_campaign,
-                request.utm_medium,
-                request.utm_source,
-                request.firstName,
-                request.lastName,
-                # https://stackoverflow.com/questions/10997577/python-timezone-conversion
-                # Consumers to this data require mountain time
-                datetime.now(tz=ZoneInfo("MST")),
-            )
+
+@router.post(
+    "/responses",
+    dependencies=[fastapi.Depends(deadline.budget(settings.DEADLINES["responses"]))],
+)
+async def get_responses(request: ResponsesModel, http_request: fastapi.Request):
+    """
+    Fetch many responses concurrently, at most RESPONSE_BATCH_CONCURRENCY at a
+    time. Each item reports its own status: 200 with the response, 400 if
+    Qualtrics could not return it, 502 if fetching it failed unexpectedly or
+    504 if the request deadline passed first.
+    Items are returned in request order, or streamed one per line as they
+    complete with "Accept: application/x-ndjson".
+    """
+    if len(request.responses) > settings.RESPONSE_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.RESPONSE_BATCH_MAX_SIZE} responses per batch",
+        )
+
+    results = _fetch_responses(request.responses)
+    if NDJSON_MEDIA_TYPE in http_request.headers.get("accept", ""):
+        return StreamingResponse(
+            _ndjson(result async for _, result in results),
+            media_type=NDJSON_MEDIA_TYPE,
         )
 
+    ordered = [None] * len(request.responses)
+    async for index, result in results:
+        ordered[index] = result
+    return FastJSONResponse(ordered)
+
+
+async def _fetch_responses(items: list[ResponseModel]):
+    """
+    Yield (index, result) for each item as soon as it is fetched
+    """
+    semaphore = asyncio.Semaphore(settings.RESPONSE_BATCH_CONCURRENCY)
+
+    async def fetch(index: int, item: ResponseModel):
+        result = {"surveyId": item.surveyId, "responseId": item.responseId}
+        async with semaphore:
+            try:
+                result["response"] = await client.get_response(
+                    item.surveyId, item.responseId, item.raw
+                )
+                result["status"] = 200
+            except error.DeadlineExceeded:
+                result["status"], result["detail"] = 504, "Request deadline exceeded"
+            except error.QualtricsError as e:
+                result["status"], result["detail"] = 400, e.args
+            except Exception as e:  # pylint: disable=broad-except
+                # One failed item must not fail the rest of the batch
+                log.exception(e)
+                result["status"] = 502
+                result["detail"] = "Unexpected error while fetching the response"
+        return index, result
+
+    tasks = [asyncio.create_task(fetch(i, item)) for i, item in enumerate(items)]
+    try:
+        for done in asyncio.as_completed(tasks):
+            yield await done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@router.post("/events", status_code=202)
+async def receive_event(request: fastapi.Request, token: str = ""):
+    """
+    Receive a Qualtrics event subscription callback. Callbacks must carry the
+    EVENT_SECRET as their token query parameter. Responses of EVENT_TOPICS
+    events are fetched and stored in the response cache by the outbox, so
+    /response serves them without calling Qualtrics. Other events are
+    acknowledged and ignored.
+    """
+    if not settings.EVENT_SECRET or not hmac.compare_digest(
+        token.encode(), settings.EVENT_SECRET.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Invalid event token")
+
+    event = await _event_fields(request)
+    # Topics look like surveyengine.completedResponse.SV_1234
+    topic = event.get("Topic", "").split(".")
+    if len(topic) != 3 or topic[1] not in settings.EVENT_TOPICS:
+        log.info("Ignoring event %s", event.get("Topic"))
+        return {"accepted": False}
+
+    survey_id, response_id = event.get("SurveyID"), event.get("ResponseID")
+    if not response_id or survey_id != topic[2]:
+        raise HTTPException(status_code=422, detail="Event has no matching response")
+
+    await outbox.enqueue(
+        "store_response", {"survey_id": survey_id, "response_id": response_id}
+    )
+    return {"accepted": True}
+
+
+async def _event_fields(request: fastapi.Request) -> dict:
+    """
+    The fields of an event, which Qualtrics posts form encoded
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            fields = orjson.loads(body)
+        else:
+            fields = dict(urllib.parse.parse_qsl(body.decode()))
+    except (orjson.JSONDecodeError, UnicodeDecodeError):
+        fields = None
+    if not isinstance(fields, dict):
+        raise HTTPException(status_code=422, detail="Malformed event")
+    return fields
+
+
+@outbox.handler("store_response")
+async def store_response(survey_id: str, response_id: str):
+    return await client.store_response(survey_id, response_id)
+
+
+@router.post(
+    "/redirect",
+    dependencies=[fastapi.Depends(deadline.budget(settings.DEADLINES["redirect"]))],
+)
+async def intake_redirect(
+    request: RedirectModel,
+    response: fastapi.Response,
+    idempotency_key: str | None = fastapi.Header(None),
+):
+    """
+    Create a contact and invite distribution, returning the survey link.
+    Retries with the same Idempotency-Key header, or the same email, target
+    survey and RulesConsentID when no key is sent, replay the first link. A key
+    reused with a different email, target survey or RulesConsentID is rejected
+    with a 422.
+    """
+    fingerprint = idempotency.redirect_fingerprint(
+        request.email, request.targetSurveyId, request.RulesConsentID
+    )
+    key = idempotency_key or f"redirect:{fingerprint}"
+    try:
+        link, replayed = await idempotency.run(
+            key, lambda: _redirect(request), fingerprint
+        )
+    except error.IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=e.args)
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return link
+
+
+async def _redirect(request: RedirectModel):
+    start_time = time.time()
+    try:
+        # Returning participants already have a contact in the mailing list,
+        # their embedded data is updated with the rest of the side effects
+        with tracing.span("redirect.contact_lookup") as span:
+            directory_entry = await contacts.lookup(request.email)
+            span.set("hit", directory_entry is not None)
+        email_distribution = None
+        if directory_entry is not None:
+            try:
+                email_distribution = await _create_email_distribution(
+                    directory_entry, request
+                )
+            except error.QualtricsError as e:
+                log.warning("Indexed contact rejected, creating a new one: %s", e)
+                await contacts.forget(request.email)
+
+        if email_distribution is None:
+            with tracing.span("redirect.contact"):
+                directory_entry = await client.create_directory_entry(
+                    request.email,
+                    request.firstName,
+                    request.lastName,
+                    settings.DIRECTORY_ID,
+                    settings.MAILING_LIST_ID,
+                )
+                await contacts.remember(
+                    request.email,
+                    directory_entry["id"],
+                    directory_entry["contactLookupId"],
+                )
+            email_distribution = await _create_email_distribution(
+                directory_entry, request
+            )
+
+        with tracing.span("redirect.link"):
+            link = await client.get_link(
+                request.targetSurveyId, email_distribution["id"]
+            )
+
+        # If link creation succeeds, create reminders while the link is returned.
+        # Both side effects go through the outbox so they are retried and
+        # survive a restart.
+        with tracing.span("redirect.enqueue"):
+            await create_reminder_distributions(email_distribution["id"])
+            await outbox.enqueue(
+                "add_user_to_contact_list",
+                _contact_list_task(request, link["link"], directory_entry["id"]),
+            )
+
         log.info("Redirect link created in %.2f seconds" % (time.time() - start_time))
         return link
     except error.QualtricsError as e:
@@ -108,22 +396,224 @@ async def intake_redirect(request: RedirectModel):
         raise HTTPException(status_code=422, detail=e.args)
 
 
+def _contact_list_task(
+    request: RedirectModel, survey_link: str, contact_id: str, timestamp=None
+) -> dict:
+    """
+    Payload of the add_user_to_contact_list outbox task for a participant
+    """
+    # https://stackoverflow.com/questions/10997577/python-timezone-conversion
+    # Consumers to this data require mountain time
+    timestamp = timestamp or datetime.now(tz=ZoneInfo("MST"))
+    return {
+        "survey_link": survey_link,
+        "contact_id": contact_id,
+        "rules_consent_id": request.RulesConsentID,
+        "survey_swap_id": request.SurveyswapID,
+        "survey_swap_group": request.SurveyswapGroup,
+        "utm_campaign": request.utm_campaign,
+        "utm_medium": request.utm_medium,
+        "utm_source": request.utm_source,
+        "first_name": request.firstName,
+        "last_name": request.lastName,
+        "timestamp": timestamp.isoformat(),
+    }
+
+
+@router.post(
+    "/redirect-batch",
+    dependencies=[
+        fastapi.Depends(deadline.budget(settings.DEADLINES["redirect_batch"]))
+    ],
+)
+async def intake_redirect_batch(request: RedirectBatchModel):
+    """
+    Intake many participants at once. Contacts missing from the contact index
+    are created by a single mailing list contact import carrying their
+    embedded data. Distributions and links are then created at most
+    REDIRECT_BATCH_CONCURRENCY at a time. A participant with the same email
+    and target survey as an earlier one is not invited again. Returns one
+    result per participant, in request order: 200 with the link, or 422, 502
+    or 504 with the error.
+    """
+    participants = request.participants
+    if len(participants) > settings.REDIRECT_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.REDIRECT_BATCH_MAX_SIZE} participants per batch",
+        )
+
+    start_time = time.time()
+    timestamp = datetime.now(tz=ZoneInfo("MST"))
+    entries = await contacts.lookup_many([p.email for p in participants])
+    import_error = None
+
+    new, invited, duplicates = {}, set(), set()
+    for index, participant in enumerate(participants):
+        email = contacts.normalize(participant.email)
+        new.setdefault(email, participant)
+        # Each distribution sends an invite email, so only send one per survey
+        if (email, participant.targetSurveyId) in invited:
+            duplicates.add(index)
+        invited.add((email, participant.targetSurveyId))
+    for email in entries:
+        new.pop(email, None)
+
+    if new:
+        with tracing.span("redirect_batch.import", contacts=len(new)):
+            try:
+                imported = await client.import_contacts(
+                    settings.DIRECTORY_ID,
+                    settings.MAILING_LIST_ID,
+                    [_import_row(p, timestamp) for p in new.values()],
+                )
+            except error.QualtricsError as e:
+                log.error("Contact import failed: %s", e)
+                imported, import_error = [], e.args
+            indexed = [
+                (contact["email"], contact["id"], contact["contactLookupId"])
+                for contact in imported
+                if contact.get("email") and contact.get("contactLookupId")
+            ]
+            await contacts.remember_many(indexed)
+            entries.update(
+                {
+                    contacts.normalize(email): {
+                        "id": contact_id,
+                        "contactLookupId": contact_lookup_id,
+                    }
+                    for email, contact_id, contact_lookup_id in indexed
+                }
+            )
+
+    semaphore = asyncio.Semaphore(settings.REDIRECT_BATCH_CONCURRENCY)
+
+    async def invite(index: int, participant: RedirectModel) -> dict:
+        result = {"email": participant.email}
+        if index in duplicates:
+            result["status"] = 422
+            result["detail"] = "Duplicate of an earlier participant in the batch"
+            return result
+
+        directory_entry = entries.get(contacts.normalize(participant.email))
+        if directory_entry is None:
+            result["status"] = 422
+            result["detail"] = import_error or "Contact was not imported"
+            return result
+
+        async with semaphore:
+            try:
+                email_distribution = await _create_email_distribution(
+                    directory_entry, participant
+                )
+                link = await client.get_link(
+                    participant.targetSurveyId, email_distribution["id"]
+                )
+                await create_reminder_distributions(email_distribution["id"])
+                await outbox.enqueue(
+                    "add_user_to_contact_list",
+                    _contact_list_task(
+                        participant, link["link"], directory_entry["id"], timestamp
+                    ),
+                )
+            except error.DeadlineExceeded:
+                result["status"], result["detail"] = 504, "Request deadline exceeded"
+                return result
+            except error.QualtricsError as e:
+                result["status"], result["detail"] = 422, e.args
+                return result
+            except Exception as e:  # pylint: disable=broad-except
+                # Other participants may already have been sent their invites
+                log.exception(e)
+                result["status"] = 502
+                result["detail"] = "Unexpected error while inviting the participant"
+                return result
+
+        result["status"], result["link"] = 200, link["link"]
+        return result
+
+    with tracing.span("redirect_batch.distributions", participants=len(participants)):
+        results = await asyncio.gather(
+            *[invite(i, p) for i, p in enumerate(participants)]
+        )
+
+    log.info(
+        "Redirect batch of %s participants done in %.2f seconds"
+        % (len(participants), time.time() - start_time)
+    )
+    return results
+
+
+def _import_row(request: RedirectModel, timestamp: datetime) -> dict:
+    """
+    Contact import row with the embedded data add_user_to_contact_list would
+    set, except the survey link which is not created yet
+    """
+    return {
+        "firstName": request.firstName,
+        "lastName": request.lastName,
+        "email": request.email,
+        "embeddedData": client.participant_embedded_data(
+            settings.DEMOGRAPHICS_SURVEY_LABEL,
+            None,
+            settings.RULES_CONSENT_ID_LABEL,
+            client.modify_prefix("FS", "R", request.RulesConsentID),
+            settings.SURVEY_SWAP_ID_LABEL,
+            request.SurveyswapID,
+            settings.SURVEY_SWAP_GROUP_LABEL,
+            request.SurveyswapGroup,
+            request.utm_campaign,
+            request.utm_medium,
+            request.utm_source,
+            request.firstName,
+            request.lastName,
+            timestamp,
+        ),
+    }
+
+
+async def _create_email_distribution(directory_entry: dict, request: RedirectModel):
+    with tracing.span("redirect.distribution"):
+        return await client.create_email_distribution(
+            directory_entry["contactLookupId"],
+            settings.LIBRARY_ID,
+            settings.INVITE_MESSAGE_ID,
+            settings.MAILING_LIST_ID,
+            request.targetSurveyId,
+        )
+
+
+@outbox.handler("create_reminder_distributions")
 async def create_reminder_distributions(distribution_id: str):
-    distribution = client.create_reminder_distribution(
-        settings.LIBRARY_ID,
-        settings.REMINDER_MESSAGE_ID,
-        distribution_id,
-        (datetime.utcnow() + timedelta(days=1)),
+    """
+    Schedule one reminder per entry of REMINDER_OFFSETS_DAYS. Each reminder is
+    its own outbox task, so the workers create them concurrently and a failed
+    reminder is retried without re-sending the others.
+    """
+    calltime = datetime.utcnow()
+    return await outbox.enqueue_many(
+        "create_reminder_distribution",
+        [
+            {
+                "distribution_id": distribution_id,
+                "reminder_date": (calltime + timedelta(days=offset)).isoformat(),
+            }
+            for offset in settings.REMINDER_OFFSETS_DAYS
+        ],
     )
 
-    distribution = client.create_reminder_distribution(
+
+@outbox.handler("create_reminder_distribution")
+async def create_reminder_distribution(distribution_id: str, reminder_date: str):
+    return await client.create_reminder_distribution(
         settings.LIBRARY_ID,
         settings.REMINDER_MESSAGE_ID,
         distribution_id,
-        (datetime.utcnow() + timedelta(days=3)),
+        datetime.fromisoformat(reminder_date),
     )
 
 
+@outbox.handler("add_user_to_contact_list")
 async def add_user_to_contact_list(
     survey_link: str,
     contact_id: str,
@@ -135,9 +625,9 @@ async def add_user_to_contact_list(
     utm_source: str,
     first_name: str,
     last_name: str,
-    timestamp: datetime,
+    timestamp: str,
 ):
-    return client.add_participant_to_contact_list(
+    return await client.add_participant_to_contact_list(
         settings.DEMOGRAPHICS_SURVEY_LABEL,
         survey_link,
         settings.RULES_CONSENT_ID_LABEL,
@@ -152,36 +642,72 @@ async def add_user_to_contact_list(
         utm_source,
         first_name,
         last_name,
-        timestamp,
+        datetime.fromisoformat(timestamp),
     )
 
 
-@router.post("/survey-schema")
+@router.post(
+    "/survey-schema",
+    dependencies=[fastapi.Depends(deadline.budget(settings.DEADLINES["schema"]))],
+)
 async def get_schema(request: SurveyModel):
-    return client.get_survey_schema(request.surveyId)
+    return await client.get_survey_schema(request.surveyId)
 
 
-@router.post("/delete-session")
+@router.post("/survey-schema/invalidate")
+async def invalidate_schema(request: SurveyModel):
+    """
+    Drop a cached survey schema so the next request fetches it again
+    """
+    await client.invalidate_survey_schema(request.surveyId)
+    return {"surveyId": request.surveyId}
+
+
+@router.post(
+    "/delete-session",
+    dependencies=[fastapi.Depends(deadline.budget(settings.DEADLINES["session"]))],
+)
 async def session(request: SessionModel):
     """
     Router for ending a session, pulling response
     """
     try:
-        return client.delete_session(request.surveyId, request.sessionId)
+        return await client.delete_session(request.surveyId, request.sessionId)
     except error.QualtricsError as e:
         raise HTTPException(status_code=400, detail=e.args)
 
 
-@router.get("/contact/{contactId}")
+@router.get(
+    "/contact/{contactId}",
+    dependencies=[fastapi.Depends(deadline.budget(settings.DEADLINES["contact"]))],
+)
 async def contact(contactId: str):
-    return client.get_contact_by_id(contactId)
+    directory_contact = await client.get_contact_by_id(contactId)
+    if isinstance(directory_contact.get("result"), dict):
+        await contacts.remember_contact(directory_contact["result"])
+    return directory_contact
+
 
+@router.get(
+    "/contact/{contactId}/responseIds",
+    dependencies=[fastapi.Depends(deadline.budget(settings.DEADLINES["response_ids"]))],
+)
+async def dist(contactId: str, response: fastapi.Response):
+    return _response_ids(await client.get_responseIds_by_contact(contactId), response)
 
-@router.get("/contact/{contactId}/responseIds")
-async def dist(contactId: str):
-    return client.get_responseIds_by_contact(contactId)
 
+@router.get(
+    "/dist/{distId}/responseIds",
+    dependencies=[fastapi.Depends(deadline.budget(settings.DEADLINES["response_ids"]))],
+)
+async def dist(distId: str, response: fastapi.Response):
+    return _response_ids(await client.get_responseIds_by_dist(distId), response)
 
-@router.get("/dist/{distId}/responseIds")
-async def dist(distId: str):
-    return client.get_responseIds_by_dist(distId)
+
+def _response_ids(result: dict, response: fastapi.Response) -> list:
+    """
+    Flag responseId lists missing distributions that failed or timed out
+    """
+    if result["partial"]:
+        response.headers[PARTIAL_RESULTS_HEADER] = "true"
+    return result["responseIds"]
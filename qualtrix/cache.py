@@ -0,0 +1,94 @@
+"""
+In-process caches for Qualtrics lookups.
+"""
+
+import asyncio
+import collections
+import time
+
+from qualtrix import deadline, error, metrics
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Least recently used cache whose entries each expire after their own TTL
+    """
+
+    def __init__(self, name: str, maxsize: int) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        """
+        Return the cached value for key, or MISSING
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            metrics.CACHE_REQUESTS.labels(self.name, "hit").inc()
+            return entry[1]
+
+        if entry is not None:
+            del self._entries[key]
+        metrics.CACHE_REQUESTS.labels(self.name, "miss").inc()
+        return MISSING
+
+    def set(self, key, value, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one in-flight call whose
+    result (or exception) is shared by every caller. The call runs without the
+    request deadline of the caller that started it, each caller only waits for
+    it until its own deadline.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict = {}
+
+    async def do(self, key, fn):
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._call(fn))
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        # A cancelled caller must not cancel the call the others are waiting on
+        try:
+            async with asyncio.timeout_at(deadline.at()):
+                return await asyncio.shield(future)
+        except TimeoutError as e:
+            if deadline.expired():
+                raise error.DeadlineExceeded() from e
+            raise
+
+    @staticmethod
+    async def _call(fn):
+        deadline.clear()
+        return await fn()
+
+    def _forget(self, key, future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # Mark the exception retrieved even if every caller went away
+            future.exception()
+
+    def __contains__(self, key) -> bool:
+        return key in self._calls
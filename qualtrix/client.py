@@ -1,14 +1,29 @@
 import copy
-from enum import Enum
+import functools
 
 import logging
-import requests
+import asyncio
+import itertools
+import tempfile
 import time
 import datetime
 from datetime import datetime, timedelta
 
 
-from qualtrix import settings, error
+from qualtrix import (
+    cache,
+    deadline,
+    settings,
+    error,
+    export,
+    extract,
+    metrics,
+    ratelimit,
+    shared_cache,
+    tracing,
+    transport,
+    workers,
+)
 
 log = logging.getLogger(__name__)
 
@@ -28,51 +43,7 @@ class Participant:
         self.language = lang
 
 
-class IBetaSurveyQuestion(Enum):
-    TESTER_ID = 1
-    TEST_TYPE = 2
-    DOCUMENT_MODIFICATION = 4
-    IMAGE_MODIFICATION = 5
-    SELFIE_TEST_TYPE = 6
-    DEVICE_TYPE = 7
-    DEVICE_MODEL_APPLE = 8
-    DEVICE_MODEL_SAMSUNG = 9
-    DEVICE_MODEL_GOOGLE = 10
-    FAKE_ID_TYPE = 12
-    SPOOF_ARTIFACT_TYPE = 13
-    DOCUMENT_TYPE = 15
-    SUBJECT_ALTERATIONS = 17
-    MASK_TYPE = 18
-
-    def QID_text_list(self, qx_data: dict) -> str or None:
-        choice_raw = qx_data.get(f"QID{self.value}", None)
-        if choice_raw is None:
-            return choice_raw
-
-        # Build list of text responses, assuming the worst case that every choice has a
-        # user-entered plaintext response
-        responses = []
-
-        for val in choice_raw:
-            resp = qx_data.get(f"QID{self.value}_{val}_TEXT", None)
-            if resp is not None:
-                responses.append(resp)
-        return responses
-
-    def QID_text(self, qx_data: dict) -> str or None:
-        choice_raw = qx_data.get(f"QID{self.value}", None)
-        # Get plaintext responses
-        response = qx_data.get(f"QID{self.value}_{choice_raw}_TEXT", None)
-        return response
-
-    def QID_label(self, qx_labels: dict) -> str or None:
-        return qx_labels.get(f"QID{self.value}", None)
-
-    def __eq__(self, other):
-        return self.value == other
-
-
-def get_participant(survey_id: str, response_id: str):
+async def get_participant(survey_id: str, response_id: str):
     header = copy.deepcopy(auth_header)
     header["Accept"] = "application/json"
 
@@ -81,13 +52,14 @@ def get_participant(survey_id: str, response_id: str):
     )
 
     # ResponseId -> Email
-    r = requests.get(
+    r = await transport.get(
         settings.BASE_URL + f"/surveys/{survey_id}/responses/{response_id}",
+        operation="get_participant",
         headers=auth_header,
         timeout=settings.TIMEOUT,
     )
 
-    response_id_to_participant = r.json()
+    response_id_to_participant = transport.decode(r)
 
     if "error" in response_id_to_participant["meta"]:
         raise error.QualtricsError(response_id_to_participant["meta"]["error"])
@@ -106,7 +78,7 @@ def get_participant(survey_id: str, response_id: str):
     return Participant(response_id, f_name, l_name, email, lang)
 
 
-def create_directory_entry(
+async def create_directory_entry(
     email: str, first_name: str, last_name: str, directory_id: str, mailing_list_id: str
 ):
     header = copy.deepcopy(auth_header)
@@ -121,16 +93,17 @@ def create_directory_entry(
     }
 
     # Create contact
-    r = requests.post(
+    r = await transport.post(
         settings.BASE_URL
         + f"/directories/{directory_id}/mailinglists/{mailing_list_id}/contacts",
+        operation="create_directory_entry",
         headers=header,
         params={"includeEmbedded": "true"},
         json=directory_payload,
         timeout=settings.TIMEOUT,
     )
 
-    create_directory_entry_response = r.json()
+    create_directory_entry_response = transport.decode(r)
     if "error" in create_directory_entry_response["meta"]:
         raise error.QualtricsError(create_directory_entry_response["meta"]["error"])
 
@@ -141,16 +114,107 @@ def create_directory_entry(
     return directory_entry
 
 
-def create_reminder_distribution(
-    library_id: str,
-    reminder_message_id: str,
-    distribution_id: str,
-    reminder_date: datetime,
-):
+async def iter_mailing_list_contacts(directory_id: str, mailing_list_id: str):
+    """
+    Yield the contacts of a mailing list one page at a time
+    """
+    url = (
+        settings.BASE_URL
+        + f"/directories/{directory_id}/mailinglists/{mailing_list_id}/contacts"
+    )
+
+    while url:
+        r = await transport.get(
+            url,
+            operation="iter_mailing_list_contacts",
+            headers=auth_header,
+            timeout=settings.TIMEOUT,
+        )
+
+        mailing_list_contacts = transport.decode(r)
+        if "error" in mailing_list_contacts["meta"]:
+            raise error.QualtricsError(mailing_list_contacts["meta"]["error"])
+
+        yield mailing_list_contacts["result"]["elements"]
+        url = mailing_list_contacts["result"].get("nextPage")
+
+
+async def import_contacts(
+    directory_id: str, mailing_list_id: str, contacts: list[dict]
+) -> list[dict]:
+    """
+    Create contacts in a mailing list with one contact import job and return
+    the imported contacts (id, contactLookupId and email of each) once the
+    job has completed. The job is polled like an export, between
+    EXPORT_POLL_MIN_WAIT and EXPORT_POLL_MAX_WAIT apart.
+    """
     header = copy.deepcopy(auth_header)
     header["Accept"] = "application/json"
+    url = (
+        settings.BASE_URL
+        + f"/directories/{directory_id}/mailinglists/{mailing_list_id}/contactimports"
+    )
 
-    create_reminder_distribution_payload = {
+    logging.info(f"Importing {len(contacts)} contacts into {mailing_list_id}")
+
+    r = await transport.post(
+        url,
+        operation="contact_import_start",
+        headers=header,
+        json={"contacts": contacts},
+        timeout=settings.TIMEOUT,
+    )
+    import_response = transport.decode(r)
+    if "error" in import_response["meta"]:
+        raise error.QualtricsError(import_response["meta"]["error"])
+    import_id = import_response["result"]["id"]
+
+    wait = settings.EXPORT_POLL_MIN_WAIT
+    while True:
+        r = await transport.get(
+            f"{url}/{import_id}",
+            operation="contact_import_poll",
+            headers=header,
+            timeout=settings.TIMEOUT,
+        )
+        progress = transport.decode(r)
+        if "error" in progress["meta"]:
+            raise error.QualtricsError(progress["meta"]["error"])
+
+        status = progress["result"]["status"]
+        if status == "complete":
+            break
+        if status == "failed":
+            raise error.QualtricsError(f"Contact import {import_id} failed")
+
+        await asyncio.sleep(wait)
+        wait = min(wait * 2, settings.EXPORT_POLL_MAX_WAIT)
+
+    imported = []
+    summary_url = f"{url}/{import_id}/summary"
+    while summary_url:
+        r = await transport.get(
+            summary_url,
+            operation="contact_import_summary",
+            headers=header,
+            timeout=settings.TIMEOUT,
+        )
+        summary = transport.decode(r)
+        if "error" in summary["meta"]:
+            raise error.QualtricsError(summary["meta"]["error"])
+
+        imported.extend(summary["result"]["contacts"])
+        summary_url = summary["result"].get("nextPage")
+
+    return imported
+
+
+@functools.cache
+def _reminder_payload_template(library_id: str, reminder_message_id: str) -> dict:
+    """
+    Reminder payload shared by every reminder of a message, without sendDate
+    """
+    return {
         "message": {"libraryId": library_id, "messageId": reminder_message_id},
         "header": {
             "fromEmail": settings.FROM_EMAIL,
@@ -159,17 +223,32 @@ def create_reminder_distribution(
             "subject": settings.REMINDER_SUBJECT,
         },
         "embeddedData": {"property1": "string", "property2": "string"},
+    }
+
+
+async def create_reminder_distribution(
+    library_id: str,
+    reminder_message_id: str,
+    distribution_id: str,
+    reminder_date: datetime,
+):
+    header = copy.deepcopy(auth_header)
+    header["Accept"] = "application/json"
+
+    create_reminder_distribution_payload = {
+        **_reminder_payload_template(library_id, reminder_message_id),
         "sendDate": reminder_date.isoformat() + "Z",
     }
 
-    r = requests.post(
+    r = await transport.post(
         settings.BASE_URL + f"/distributions/{distribution_id}/reminders",
+        operation="create_reminder_distribution",
         headers=header,
         json=create_reminder_distribution_payload,
         timeout=settings.TIMEOUT,
     )
 
-    create_reminder_distribution_response = r.json()
+    create_reminder_distribution_response = transport.decode(r)
     if "error" in create_reminder_distribution_response["meta"]:
         raise error.QualtricsError(
             create_reminder_distribution_response["meta"]["error"]
@@ -190,7 +269,45 @@ def modify_prefix(current: str, desired: str, content: str) -> str:
     return content.replace(f"{current}_", f"{desired}_", 1)
 
 
-def add_participant_to_contact_list(
+def participant_embedded_data(
+    survey_label: str,
+    survey_link: str | None,
+    rules_consent_id_label,
+    rules_consent_id: str,
+    survey_swap_id_label: str,
+    survey_swap_id,
+    survey_swap_group_label: str,
+    survey_swap_group: str,
+    utm_campaign: str,
+    utm_medium: str,
+    utm_source: str,
+    first_name: str,
+    last_name: str,
+    timestamp: datetime,
+) -> dict:
+    """
+    Embedded data recorded on a participant's contact. The survey link is
+    left out while it is not known yet.
+    """
+    embedded_data = {
+        survey_label: survey_link,
+        rules_consent_id_label: rules_consent_id,
+        survey_swap_id_label: survey_swap_id,
+        survey_swap_group_label: survey_swap_group,
+        "utm_campaign": utm_campaign,
+        "utm_medium": utm_medium,
+        "utm_source": utm_source,
+        "firstName": first_name,
+        "lastName": last_name,
+        "Date": timestamp.strftime("%m/%d/%Y"),
+        "time": timestamp.strftime("%H:%M:%S"),
+    }
+    if survey_link is None:
+        del embedded_data[survey_label]
+    return embedded_data
+
+
+async def add_participant_to_contact_list(
     survey_label: str,
     survey_link: str,
     rules_consent_id_label,
@@ -211,41 +328,45 @@ def add_participant_to_contact_list(
     header["Accept"] = "application/json"
 
     add_particpant_payload = {
-        "embeddedData": {
-            survey_label: survey_link,
-            rules_consent_id_label: rules_consent_id,
-            survey_swap_id_label: survey_swap_id,
-            survey_swap_group_label: survey_swap_group,
-            "utm_campaign": utm_campaign,
-            "utm_medium": utm_medium,
-            "utm_source": utm_source,
-            "firstName": first_name,
-            "lastName": last_name,
-            "Date": timestamp.strftime("%m/%d/%Y"),
-            "time": timestamp.strftime("%H:%M:%S"),
-        }
+        "embeddedData": participant_embedded_data(
+            survey_label,
+            survey_link,
+            rules_consent_id_label,
+            rules_consent_id,
+            survey_swap_id_label,
+            survey_swap_id,
+            survey_swap_group_label,
+            survey_swap_group,
+            utm_campaign,
+            utm_medium,
+            utm_source,
+            first_name,
+            last_name,
+            timestamp,
+        )
     }
 
     logging.info(
         f"Contact ({contact_id}) -> Directory ({settings.DIRECTORY_ID}), Mailing List ({settings.MAILING_LIST_ID}), Rules Consent ({rules_consent_id})"
     )
 
-    r = requests.put(
+    r = await transport.put(
         settings.BASE_URL
         + f"/directories/{settings.DIRECTORY_ID}/mailinglists/{settings.MAILING_LIST_ID}/contacts/{contact_id}",
+        operation="add_participant_to_contact_list",
         headers=header,
         json=add_particpant_payload,
         timeout=settings.TIMEOUT,
     )
 
-    add_to_contact_list_response = r.json()
+    add_to_contact_list_response = transport.decode(r)
     if "error" in add_to_contact_list_response["meta"]:
         raise error.QualtricsError(add_to_contact_list_response["meta"]["error"])
 
     return contact_id
 
 
-def create_email_distribution(
+async def create_email_distribution(
     contact_id: str,
     library_id: str,
     message_id: str,
@@ -277,14 +398,15 @@ def create_email_distribution(
         "sendDate": (calltime + timedelta(seconds=10)).isoformat() + "Z",
     }
 
-    r = requests.post(
+    r = await transport.post(
         settings.BASE_URL + f"/distributions",
+        operation="create_email_distribution",
         headers=header,
         json=create_distribution_payload,
         timeout=settings.TIMEOUT,
     )
 
-    create_distribution_response = r.json()
+    create_distribution_response = transport.decode(r)
     if "error" in create_distribution_response["meta"]:
         raise error.QualtricsError(create_distribution_response["meta"]["error"])
 
@@ -295,7 +417,7 @@ def create_email_distribution(
     return email_distribution
 
 
-def get_email(survey_id: str, response_id: str):
+async def get_email(survey_id: str, response_id: str):
     header = copy.deepcopy(auth_header)
     header["Accept"] = "application/json"
 
@@ -304,13 +426,14 @@ def get_email(survey_id: str, response_id: str):
     )
 
     # ResponseId -> Email
-    r = requests.get(
+    r = await transport.get(
         settings.BASE_URL + f"/surveys/{survey_id}/responses/{response_id}",
+        operation="get_email",
         headers=auth_header,
         timeout=settings.TIMEOUT,
     )
 
-    response_id_to_email = r.json()
+    response_id_to_email = transport.decode(r)
 
     if "error" in response_id_to_email["meta"]:
         raise error.QualtricsError(response_id_to_email["meta"]["error"])
@@ -324,7 +447,7 @@ def get_email(survey_id: str, response_id: str):
     return email
 
 
-def get_contact(directory_id: str, email: str):
+async def get_contact(directory_id: str, email: str):
     header = copy.deepcopy(auth_header)
     header["Accept"] = "application/json"
 
@@ -335,15 +458,16 @@ def get_contact(directory_id: str, email: str):
 
     logging.info(f"Email -> Contact (DirectoryId={directory_id})")
 
-    r = requests.post(
+    r = await transport.post(
         settings.BASE_URL + f"/directories/{directory_id}/contacts/search",
+        operation="get_contact",
         headers=header,
         params={"includeEmbedded": "true"},
         json=email_to_contact_payload,
         timeout=settings.TIMEOUT,
     )
 
-    email_to_contact_resp = r.json()
+    email_to_contact_resp = transport.decode(r)
 
     if "error" in email_to_contact_resp["meta"]:
         raise error.QualtricsError(email_to_contact_resp["meta"]["error"])
@@ -357,7 +481,7 @@ def get_contact(directory_id: str, email: str):
     return contact
 
 
-def get_distribution(directory_id: str, contact_id: str):
+async def get_distribution(directory_id: str, contact_id: str):
     header = copy.deepcopy(auth_header)
     header["Accept"] = "application/json"
 
@@ -365,15 +489,16 @@ def get_distribution(directory_id: str, contact_id: str):
         f"Directory, Contact -> Distribution (Directory={directory_id}, Contact={contact_id})"
     )
     # Contact ID -> Distribution ID https://api.qualtrics.com/f30cf65c90b7a-get-directory-contact-history
-    r = requests.get(
+    r = await transport.get(
         settings.BASE_URL
         + f"/directories/{directory_id}/contacts/{contact_id}/history",
+        operation="get_distribution",
         headers=header,
         params={"type": "email"},
         timeout=settings.TIMEOUT,
     )
 
-    contact_to_distribution_resp = r.json()
+    contact_to_distribution_resp = transport.decode(r)
 
     if "error" in contact_to_distribution_resp["meta"]:
         raise error.QualtricsError(contact_to_distribution_resp["meta"]["error"])
@@ -397,7 +522,43 @@ def get_distribution(directory_id: str, contact_id: str):
     return distribution
 
 
-def get_link(target_survey_id: str, distribution_id: str):
+_link_flight = cache.SingleFlight()
+
+
+async def get_link(target_survey_id: str, distribution_id: str):
+    """
+    Return the distribution's survey link, polling with growing intervals
+    until it is populated or LINK_READY_BUDGET seconds have passed. Concurrent
+    waiters for the same distribution share one poll loop.
+    """
+    return await _link_flight.do(
+        (target_survey_id, distribution_id),
+        lambda: _wait_for_link(target_survey_id, distribution_id),
+    )
+
+
+async def _wait_for_link(target_survey_id: str, distribution_id: str):
+    start_time = time.monotonic()
+    give_up_at = start_time + settings.LINK_READY_BUDGET
+    wait = settings.LINK_POLL_MIN_WAIT
+
+    while True:
+        link = await _get_link(target_survey_id, distribution_id)
+        if link is not None:
+            metrics.LINK_READY_SECONDS.observe(time.monotonic() - start_time)
+            return link
+
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0:
+            metrics.LINK_READY_TIMEOUTS.inc()
+            raise error.QualtricsError("Link was not yet populated")
+
+        log.info(f"Link for distribution {distribution_id} not yet populated")
+        await asyncio.sleep(min(wait, remaining))
+        wait = min(wait * 2, settings.LINK_POLL_MAX_WAIT)
+
+
+async def _get_link(target_survey_id: str, distribution_id: str):
     header = copy.deepcopy(auth_header)
     header["Accept"] = "application/json"
 
@@ -406,48 +567,90 @@ def get_link(target_survey_id: str, distribution_id: str):
     )
 
     # Distribution ID -> Link https://api.qualtrics.com/437447486af95-list-distribution-links
-    r = requests.get(
+    r = await transport.get(
         settings.BASE_URL + f"/distributions/{distribution_id}/links",
+        operation="get_link",
         headers=header,
         params={"surveyId": target_survey_id},
         timeout=settings.TIMEOUT,
     )
 
-    distribution_to_link_resp = r.json()
+    distribution_to_link_resp = transport.decode(r)
 
     if "error" in distribution_to_link_resp["meta"]:
         raise error.QualtricsError(distribution_to_link_resp["meta"]["error"])
 
-    link = next(iter(x for x in distribution_to_link_resp["result"]["elements"]), None)
-    if link is None:
-        raise error.QualtricsError("Link was not yet populated")
+    return next(iter(x for x in distribution_to_link_resp["result"]["elements"]), None)
 
-    return link
 
+# Survey responses keyed on (survey_id, response_id, raw). Finished responses are
+# effectively immutable and kept long term, in-progress responses and responses
+# that could not be found are only kept briefly.
+response_cache = shared_cache.Cache("responses", settings.RESPONSE_CACHE_SIZE)
+_RESPONSE_NOT_FOUND = "Survey response not found"
 
-def get_response(survey_id: str, response_id: str, raw: bool):
-    for i in range(settings.RETRY_ATTEMPTS):
-        r = requests.get(
-            settings.BASE_URL + f"/surveys/{survey_id}/responses/{response_id}",
-            headers=auth_header,
-            timeout=settings.TIMEOUT,
-        )
-        if r:
-            break
-        else:
-            log.warn(f"Response from id {response_id} not found, trying again.")
-        time.sleep(settings.RETRY_WAIT)
+
+async def get_response(survey_id: str, response_id: str, raw: bool):
+    survey_answers = await response_cache.fetch(
+        (survey_id, response_id, bool(raw)),
+        lambda: _load_response(survey_id, response_id, raw),
+    )
+    if survey_answers == _RESPONSE_NOT_FOUND:
+        raise error.QualtricsError(_RESPONSE_NOT_FOUND)
+    return survey_answers
+
+
+async def store_response(survey_id: str, response_id: str) -> str:
+    """
+    Fetch a response and store it, raw and not, in the response cache for
+    get_response to serve. Returns the status of the response.
+    """
+    survey_answers = await _get_response(survey_id, response_id, True)
+    answers = {key: value for key, value in survey_answers.items() if key != "raw"}
+    ttl = settings.RESPONSE_CACHE_IN_PROGRESS_TTL
+    if survey_answers["status"] == "Complete":
+        ttl = settings.RESPONSE_CACHE_FINISHED_TTL
+    await response_cache.set_many(
+        [
+            ((survey_id, response_id, True), survey_answers),
+            ((survey_id, response_id, False), answers),
+        ],
+        ttl,
+    )
+    return survey_answers["status"]
+
+
+async def _load_response(survey_id: str, response_id: str, raw: bool):
+    try:
+        survey_answers = await _get_response(survey_id, response_id, raw)
+    except error.QualtricsError:
+        return _RESPONSE_NOT_FOUND, settings.RESPONSE_CACHE_MISS_TTL
+
+    if survey_answers["status"] == "Complete":
+        return survey_answers, settings.RESPONSE_CACHE_FINISHED_TTL
+    return survey_answers, settings.RESPONSE_CACHE_IN_PROGRESS_TTL
+
+
+async def _get_response(survey_id: str, response_id: str, raw: bool):
+    # A just-finished response can take a moment to become available
+    r = await transport.get(
+        settings.BASE_URL + f"/surveys/{survey_id}/responses/{response_id}",
+        operation="get_response",
+        headers=auth_header,
+        timeout=settings.TIMEOUT,
+        retry_on=(404,),
+    )
 
     survey_answers = {"status": "", "response": {}}
 
-    response = r.json()
+    response = transport.decode(r)
 
     if (
         r.status_code != 200
         or not response
         or not response["meta"]["httpStatus"] == "200 - OK"
     ):
-        raise error.QualtricsError("Survey response not found")
+        raise error.QualtricsError(_RESPONSE_NOT_FOUND)
 
     result = response["result"]
     values = result["values"]
@@ -472,12 +675,13 @@ def get_response(survey_id: str, response_id: str, raw: bool):
     return survey_answers
 
 
-def get_contact_by_id(contact_id: str):
+async def get_contact_by_id(contact_id: str):
     logging.info(f"get_contact_by_id {contact_id}")
 
-    r = requests.get(
+    r = await transport.get(
         settings.BASE_URL
         + f"/directories/{settings.DIRECTORY_ID}/contacts/{contact_id}",
+        operation="get_contact_by_id",
         headers=auth_header,
         timeout=settings.TIMEOUT,
     )
@@ -485,15 +689,16 @@ def get_contact_by_id(contact_id: str):
     logging.info(f"get_contact_by_id {contact_id} {r.status_code}")
     logging.debug(f"get_contact_by_id {contact_id} {r.text}")
 
-    return r.json()
+    return transport.decode(r)
 
 
-def get_contact_history(contact_id: str):
+async def get_contact_history(contact_id: str):
     logging.info(f"get_contact_history {contact_id}")
 
-    r = requests.get(
+    r = await transport.get(
         settings.BASE_URL
         + f"/directories/{settings.DIRECTORY_ID}/contacts/{contact_id}/history",
+        operation="get_contact_history",
         headers=auth_header,
         timeout=settings.TIMEOUT,
         params={"type": "response"},
@@ -502,48 +707,71 @@ def get_contact_history(contact_id: str):
     logging.info(f"get_contact_history {contact_id} {r.status_code}")
     logging.debug(f"get_contact_history {contact_id} {r.text}")
 
-    return r.json()
+    return transport.decode(r)
 
 
-def get_distribution_history(distributionId: str):
+async def get_distribution_history(distributionId: str):
     logging.info(f"get_distribution_history {distributionId}")
 
     url = settings.BASE_URL + f"/distributions/{distributionId}/history"
-    r = requests.get(url, headers=auth_header, timeout=settings.TIMEOUT)
+    r = await transport.get(
+        url,
+        operation="get_distribution_history",
+        headers=auth_header,
+        timeout=settings.TIMEOUT,
+    )
 
     logging.info(f"get_distribution_history {distributionId} {r.status_code}")
     logging.debug(f"get_distribution_history {distributionId} {r.text}")
 
-    data = r.json()
+    data = transport.decode(r)
 
     return data
 
 
-def get_responseIds_by_dist(dist_string: str):
+async def get_responseIds_by_dist(dist_string: str):
     """
     returns a list of responseIds starting from a dist string. A dist string has three parts.
     The first part is a distribution id that can be used to get the contactId.
     """
 
     logging.info(f"get_responseIds_by_dist {dist_string}")
+    wait_until = asyncio.get_running_loop().time() + settings.RESPONSE_IDS_DEADLINE
 
     dist_parts = dist_string.split("_")
     distributionId = "EMD_" + dist_parts[0]
 
-    data = get_distribution_history(distributionId)
+    data = await get_distribution_history(distributionId)
     contactId = data["result"]["elements"][0]["contactId"]
 
-    return get_responseIds_by_contact(contactId)
+    return await get_responseIds_by_contact(contactId, wait_until)
 
 
-def get_responseIds_by_contact(contactId: str):
+async def get_responseIds_by_contact(contactId: str, wait_until: float = None):
     """
-    get list of responeIds from contact history
+    get list of responeIds from contact history.
+
+    Distribution histories are fetched concurrently, at most
+    DISTRIBUTION_HISTORY_CONCURRENCY at a time. Distributions that fail or are
+    still pending after RESPONSE_IDS_DEADLINE, or the request deadline if that
+    comes first, are skipped and the result is flagged as partial. The contact
+    history itself must arrive within the same deadline.
     """
 
     logging.info(f"get_responseIds_by_contact {contactId}")
+    loop = asyncio.get_running_loop()
+    if wait_until is None:
+        wait_until = loop.time() + settings.RESPONSE_IDS_DEADLINE
+    if deadline.at() is not None:
+        wait_until = min(wait_until, deadline.at())
 
-    contacthist = get_contact_history(contactId)
+    try:
+        contacthist = await asyncio.wait_for(
+            get_contact_history(contactId), max(wait_until - loop.time(), 0)
+        )
+    except asyncio.TimeoutError as e:
+        # Without the distributions there is no partial result to return
+        raise error.DeadlineExceeded() from e
     dist_Id_list = list(
         filter(
             lambda y: y != None,
@@ -551,26 +779,101 @@ def get_responseIds_by_contact(contactId: str):
         )
     )
 
+    semaphore = asyncio.Semaphore(settings.DISTRIBUTION_HISTORY_CONCURRENCY)
+
+    async def fetch_response_ids(distributionId: str):
+        async with semaphore:
+            data = await get_distribution_history(distributionId)
+        return [
+            "R_" + x["surveySessionId"].split("_")[1]
+            for x in data["result"]["elements"]
+        ]
+
+    tasks = [asyncio.create_task(fetch_response_ids(id)) for id in dist_Id_list]
+    pending = set()
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=max(wait_until - loop.time(), 0))
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
     response_ids = []
+    failed = []
+    for id, task in zip(dist_Id_list, tasks):
+        if task in pending or task.exception() is not None:
+            failed.append(id)
+            continue
+        response_ids.extend(task.result())
+
+    if failed:
+        log.warning(
+            f"get_responseIds_by_contact {contactId} partial, failed distributions {failed}"
+        )
+
+    return {
+        "responseIds": response_ids,
+        "partial": bool(failed),
+        "failedDistributions": failed,
+    }
 
-    for id in dist_Id_list:
-        data = get_distribution_history(id)
 
-        response_ids.extend(
-            map(
-                lambda x: "R_" + x["surveySessionId"].split("_")[1],
-                data["result"]["elements"],
-            )
+# Survey schemas keyed on survey id, stored with the time they were fetched.
+# Schemas older than SCHEMA_CACHE_TTL are still served while one background
+# refresh per survey runs, until SCHEMA_CACHE_STALE_TTL has also passed.
+schema_cache = shared_cache.Cache("schemas", settings.SCHEMA_CACHE_SIZE)
+_schema_refreshes = {}
+
+
+async def get_survey_schema(survey_id: str):
+    cached = await schema_cache.get(survey_id)
+    if cached is shared_cache.MISSING:
+        _, schema = await schema_cache.fetch(
+            survey_id, lambda: _load_survey_schema(survey_id)
+        )
+        return schema
+
+    fetched_at, schema = cached
+    stale = time.time() - fetched_at > settings.SCHEMA_CACHE_TTL
+    refreshing = survey_id in _schema_refreshes or schema_cache.loading(survey_id)
+    if stale and not refreshing:
+        task = asyncio.create_task(
+            _refresh_survey_schema(survey_id, tracing.current_traceparent())
+        )
+        _schema_refreshes[survey_id] = task
+        task.add_done_callback(functools.partial(_schema_refresh_done, survey_id))
+        metrics.BACKGROUND_TASKS.labels("schema_refresh").inc()
+    return schema
+
+
+async def _refresh_survey_schema(survey_id: str, traceparent: str | None):
+    # The task inherits the request's context, the refresh must not be limited
+    # by its deadline or take interactive rate limit tokens
+    deadline.clear()
+    ratelimit.set_background()
+    with tracing.span("schema_refresh", link=traceparent, survey=survey_id):
+        return await schema_cache.fetch(
+            survey_id, lambda: _load_survey_schema(survey_id), refresh=True
         )
 
-    return response_ids
+
+def _schema_refresh_done(survey_id: str, task) -> None:
+    del _schema_refreshes[survey_id]
+    metrics.BACKGROUND_TASKS.labels("schema_refresh").dec()
+    if not task.cancelled() and task.exception() is not None:
+        log.warning("Survey schema refresh failed: %r", task.exception())
+        metrics.BACKGROUND_TASK_FAILURES.labels("schema_refresh").inc()
+
+
+async def invalidate_survey_schema(survey_id: str):
+    await schema_cache.delete(survey_id)
 
 
-def get_survey_schema(survey_id: str):
+async def _load_survey_schema(survey_id: str):
     logging.info(f"get_survey_schema {survey_id}")
 
-    r = requests.get(
+    r = await transport.get(
         settings.BASE_URL + f"/surveys/{survey_id}/response-schema",
+        operation="get_survey_schema",
         headers=auth_header,
         timeout=settings.TIMEOUT,
     )
@@ -578,63 +881,189 @@ def get_survey_schema(survey_id: str):
     logging.info(f"get_survey_schema {survey_id} {r.status_code}")
     logging.debug(f"get_survey_schema {survey_id} {r.text}")
 
-    return r.json()
+    # Wall clock time, so instances sharing the cache agree on the schema's age
+    fetched = (time.time(), transport.decode(r))
+    if r.status_code == 200:
+        return fetched, settings.SCHEMA_CACHE_TTL + settings.SCHEMA_CACHE_STALE_TTL
+    return fetched, None
 
 
-def result_export(survey_id: str):
+async def start_export(
+    survey_id: str, continuation_token: str = None, allow_continuation: bool = False
+) -> str:
+    """
+    Start a response export, returning the Qualtrics progress id.
+
+    allow_continuation asks Qualtrics for a continuationToken once the export
+    completes; passing that token to a later export only exports responses
+    collected since.
+    """
     r_body = {
         "format": "json",
-        "compress": False,
+        "compress": True,
         "sortByLastModifiedDate": True,
     }
+    if continuation_token:
+        r_body["continuationToken"] = continuation_token
+    elif allow_continuation:
+        r_body["allowContinuation"] = True
 
-    r = requests.post(
+    r = await transport.post(
         settings.BASE_URL + f"/surveys/{survey_id}/export-responses",
+        operation="export_start",
         headers=auth_header,
         json=r_body,
         timeout=settings.TIMEOUT,
     )
 
     if r.status_code != 200:
-        return
+        raise error.QualtricsError(f"Unable to start export for survey {survey_id}")
+
+    return transport.decode(r)["result"]["progressId"]
+
+
+async def get_export_progress(survey_id: str, progress_id: str) -> dict:
+    """
+    Returns the export progress result (status, percentComplete and, once
+    complete, fileId)
+    """
+    r = await transport.get(
+        settings.BASE_URL + f"/surveys/{survey_id}/export-responses/{progress_id}",
+        operation="export_poll",
+        headers=auth_header,
+        timeout=settings.TIMEOUT,
+    )
+
+    return transport.decode(r)["result"]
 
-    progress_id = r.json()["result"]["progressId"]
+
+async def wait_for_export(survey_id: str, progress_id: str, on_progress=None) -> str:
+    """
+    Poll an export until it completes and return its file id. While the export
+    reports progress the next poll is scheduled from the observed completion
+    rate, otherwise the wait doubles, bounded by EXPORT_POLL_MIN_WAIT and
+    EXPORT_POLL_MAX_WAIT.
+    """
+    wait = settings.EXPORT_POLL_MIN_WAIT
+    last_percent, last_time = 0.0, time.monotonic()
 
     while True:
-        r = requests.get(
-            settings.BASE_URL + f"/surveys/{survey_id}/export-responses/{progress_id}",
-            headers=auth_header,
-            timeout=settings.TIMEOUT,
-        )
-        status = r.json()["result"]["status"]
+        progress = await get_export_progress(survey_id, progress_id)
+        metrics.EXPORT_POLLS.inc()
+        if on_progress is not None:
+            on_progress(progress)
 
+        status = progress["status"]
         if status == "complete":
-            file_id = r.json()["result"]["fileId"]
-            break
+            return progress["fileId"]
         if status == "failed":
-            break
-        if status == "inProgress":
-            time.sleep(1)
+            raise error.QualtricsError(f"Export {progress_id} failed")
 
-    r = requests.get(
-        settings.BASE_URL + f"/surveys/{survey_id}/export-responses/{file_id}/file",
-        headers=auth_header,
-        timeout=settings.TIMEOUT,
-    )
+        percent = float(progress.get("percentComplete", 0))
+        now = time.monotonic()
+        if percent > last_percent and now > last_time:
+            rate = (percent - last_percent) / (now - last_time)
+            wait = (100 - percent) / rate
+        else:
+            wait *= 2
+        wait = min(
+            max(wait, settings.EXPORT_POLL_MIN_WAIT), settings.EXPORT_POLL_MAX_WAIT
+        )
+        last_percent, last_time = percent, now
+
+        await asyncio.sleep(wait)
+
+
+async def iter_export_batches(survey_id: str, file_id: str):
+    """
+    Download a compressed export file and yield its raw responses in batches of
+    EXPORT_BATCH_SIZE.
+
+    The file is spooled to disk past EXPORT_SPOOL_SIZE and responses are
+    decompressed and parsed in batches off the event loop, so memory stays
+    flat regardless of the number of responses in the survey.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_SIZE) as spool:
+        async with transport.stream(
+            "GET",
+            settings.BASE_URL + f"/surveys/{survey_id}/export-responses/{file_id}/file",
+            operation="export_download",
+            headers=auth_header,
+            timeout=settings.TIMEOUT,
+        ) as r:
+            if r.status_code != 200:
+                raise error.QualtricsError(f"Unable to download export file {file_id}")
+            async for chunk in r.aiter_bytes():
+                spool.write(chunk)
+        spool.seek(0)
+
+        results = export.iter_responses(spool)
+        while True:
+            batch = await asyncio.to_thread(
+                list, itertools.islice(results, settings.EXPORT_BATCH_SIZE)
+            )
+            if not batch:
+                break
+            yield batch
 
-    results = r.json()["responses"]
-    answers = []
-    for result in results:
-        try:
-            answer = get_answer_from_result(result)
-            answers.append(answer)
-        except KeyError:
-            pass
 
+async def extract_answers(batch: list) -> list:
+    """
+    The answer of each response in an export batch, None for malformed ones.
+    Chunks of EXPORT_CHUNK_SIZE responses are extracted on the worker pool.
+    """
+    size = settings.EXPORT_CHUNK_SIZE
+    chunks = await asyncio.gather(
+        *[
+            workers.run(extract.extract_batch, batch[start : start + size])
+            for start in range(0, len(batch), size)
+        ]
+    )
+    answers = [answer for chunk in chunks for answer in chunk]
+    malformed = answers.count(None)
+    metrics.EXPORT_RESPONSES.labels("extracted").inc(len(answers) - malformed)
+    metrics.EXPORT_RESPONSES.labels("malformed").inc(malformed)
     return answers
 
 
-def delete_session(survey_id: str, session_id: str):
+async def iter_export_file(survey_id: str, file_id: str, report: dict = None):
+    """
+    Yield the answer for each response in an export file. Malformed responses
+    are skipped and counted in report["malformed"], next to the number of
+    report["responses"] read.
+    """
+    if report is None:
+        report = {}
+    report.update(responses=0, malformed=0)
+    async for batch in iter_export_batches(survey_id, file_id):
+        answers = await extract_answers(batch)
+        report["responses"] += len(answers)
+        for answer in answers:
+            if answer is None:
+                report["malformed"] += 1
+            else:
+                yield answer
+
+    if report["malformed"]:
+        log.warning(
+            "Skipped %s malformed of %s responses exported from %s",
+            report["malformed"],
+            report["responses"],
+            survey_id,
+        )
+
+
+async def get_export_file(survey_id: str, file_id: str):
+    return [answer async for answer in iter_export_file(survey_id, file_id)]
+
+
+async def result_export(survey_id: str):
+    progress_id = await start_export(survey_id)
+    file_id = await wait_for_export(survey_id, progress_id)
+    return await get_export_file(survey_id, file_id)
+
+
+async def delete_session(survey_id: str, session_id: str):
     """
     POST /surveys/{surveyId}/sessions/{sessionId}
     body {
@@ -644,97 +1073,19 @@ def delete_session(survey_id: str, session_id: str):
     r_body = {"close": "true"}
 
     url = settings.BASE_URL + f"/surveys/{survey_id}/sessions/{session_id}"
-    r = requests.post(url, headers=auth_header, json=r_body, timeout=settings.TIMEOUT)
+    r = await transport.post(
+        url,
+        operation="delete_session",
+        headers=auth_header,
+        json=r_body,
+        timeout=settings.TIMEOUT,
+    )
 
-    return r.json()
+    return transport.decode(r)
 
 
 def get_answer_from_result(result):
     """
     Helper function to get desired values from a result
     """
-    labels = result["labels"]
-    values = result["values"]
-
-    # Data sometimes has labels missing, so return null if val isnt found
-    if values.get("survey_type", None) == "quality_test":
-        # Device type -> values returns the integer choice of the user. Casting that to the Enum
-        # will convert to one of the specific device types (Apple, Google, Samsung)
-        device_type_choice = IBetaSurveyQuestion.DEVICE_TYPE.QID_label(values)
-        device_response = {
-            "device_group": IBetaSurveyQuestion.DEVICE_TYPE.QID_label(labels),
-            "device_model": None,
-            # If the user has "Other" device group, (not Apple, Google, or Samsung) the
-            # self identification field will be here
-            "device_details": IBetaSurveyQuestion.DEVICE_TYPE.QID_text(values),
-        }
-
-        if device_type_choice == 1:  # Iphone or Ipad
-            device_response["device_model"] = (
-                IBetaSurveyQuestion.DEVICE_MODEL_APPLE.QID_label(labels)
-            )
-            device_response["device_details"] = (
-                IBetaSurveyQuestion.DEVICE_MODEL_APPLE.QID_text(values)
-            )
-        elif device_type_choice == 2:  # Samsung Galaxy Phone or Tablet
-            device_response["device_model"] = (
-                IBetaSurveyQuestion.DEVICE_MODEL_SAMSUNG.QID_label(labels)
-            )
-            device_response["device_details"] = (
-                IBetaSurveyQuestion.DEVICE_MODEL_SAMSUNG.QID_text(values)
-            )
-        elif device_type_choice == 3:  # Google Phone or Tablet
-            device_response["device_model"] = (
-                IBetaSurveyQuestion.DEVICE_MODEL_GOOGLE.QID_label(labels)
-            )
-            device_response["device_details"] = (
-                IBetaSurveyQuestion.DEVICE_MODEL_GOOGLE.QID_text(values)
-            )
-
-        return {
-            "tester_id": IBetaSurveyQuestion.TESTER_ID.QID_label(labels),
-            "test_type": IBetaSurveyQuestion.TEST_TYPE.QID_label(labels),
-            "document_modification": {
-                "modifications": IBetaSurveyQuestion.DOCUMENT_MODIFICATION.QID_label(
-                    labels
-                ),
-                "descriptions": IBetaSurveyQuestion.DOCUMENT_MODIFICATION.QID_text_list(
-                    values
-                ),
-            },
-            "image_modification": IBetaSurveyQuestion.IMAGE_MODIFICATION.QID_label(
-                labels
-            ),
-            "selfie_test_type": IBetaSurveyQuestion.SELFIE_TEST_TYPE.QID_label(labels),
-            "device": device_response,
-            "fake_id_type": IBetaSurveyQuestion.FAKE_ID_TYPE.QID_label(labels),
-            "spoof_artifact_type": IBetaSurveyQuestion.SPOOF_ARTIFACT_TYPE.QID_label(
-                labels
-            ),
-            "document_type": IBetaSurveyQuestion.DOCUMENT_TYPE.QID_label(labels),
-            "subject_alteration": {
-                "alterations": IBetaSurveyQuestion.SUBJECT_ALTERATIONS.QID_label(
-                    labels
-                ),
-                "descriptions": IBetaSurveyQuestion.SUBJECT_ALTERATIONS.QID_text_list(
-                    values
-                ),
-            },
-            "mask": {
-                "type": IBetaSurveyQuestion.MASK_TYPE.QID_label(labels),
-                "description": IBetaSurveyQuestion.MASK_TYPE.QID_text(values),
-            },
-        }
-    else:
-        return {
-            "rules_consent_id": values.get("RulesConsentID", None),
-            "ethnicity": labels.get("QID12", None),
-            "race": labels.get("QID36", None),
-            "gender": labels.get("QID14", None),
-            "age": values.get("QID15_TEXT", None),
-            "income": labels.get("QID24", None),
-            "education": labels.get("QID25", None),
-            "skin_tone": labels.get("QID67", None),
-            "image_redacted_request": labels.get("QID53", None),
-            "comments": values.get("QID38_TEXT", None),
-        }
+    return extract.extract(result)
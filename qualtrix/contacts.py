@@ -0,0 +1,174 @@
+"""
+Local index from participant email to their Qualtrics contact in the mailing
+list, so /redirect can skip creating contacts for returning participants.
+
+The index is populated as contacts are created or looked up, and warmed in the
+background from the mailing list when the app starts, unless the last warm-up
+finished less than CONTACT_INDEX_WARM_INTERVAL seconds ago. Created contacts
+are also kept in the shared cache, so other instances find them before their
+own index has.
+"""
+
+import logging
+import time
+
+from qualtrix import client, ratelimit, settings, shared_cache, storage
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contact_index (
+    email TEXT PRIMARY KEY,
+    contact_id TEXT NOT NULL,
+    contact_lookup_id TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contact_index_warm (
+    mailing_list_id TEXT PRIMARY KEY,
+    warmed_at REAL NOT NULL
+);
+"""
+
+db = storage.Database(settings.CONTACT_INDEX_PATH, SCHEMA)
+contact_cache = shared_cache.Cache("contacts", settings.CONTACT_CACHE_SIZE)
+
+
+def normalize(email: str) -> str:
+    return email.strip().lower()
+
+
+async def lookup(email: str) -> dict | None:
+    """
+    Return the known directory entry ({"id", "contactLookupId"}) for an email
+    """
+    row = await db.fetchone(
+        "SELECT contact_id, contact_lookup_id FROM contact_index WHERE email = ?",
+        (normalize(email),),
+    )
+    if row is None:
+        cached = await contact_cache.get(normalize(email))
+        return None if cached is shared_cache.MISSING else cached
+    return {"id": row[0], "contactLookupId": row[1]}
+
+
+async def remember(email: str, contact_id: str, contact_lookup_id: str) -> None:
+    await db.execute(
+        "INSERT OR REPLACE INTO contact_index"
+        " (email, contact_id, contact_lookup_id, updated_at) VALUES (?, ?, ?, ?)",
+        (normalize(email), contact_id, contact_lookup_id, time.time()),
+    )
+    await contact_cache.set(
+        normalize(email),
+        {"id": contact_id, "contactLookupId": contact_lookup_id},
+        settings.CONTACT_CACHE_TTL,
+    )
+
+
+async def remember_contact(contact: dict) -> None:
+    """
+    Index a directory contact returned by Qualtrics, if it is in the mailing list
+    """
+    membership = (contact.get("mailingListMembership") or {}).get(
+        settings.MAILING_LIST_ID
+    ) or {}
+    contact_id = contact.get("contactId") or contact.get("id")
+    if contact.get("email") and contact_id and membership.get("contactLookupId"):
+        await remember(contact["email"], contact_id, membership["contactLookupId"])
+
+
+async def lookup_many(emails: list[str]) -> dict:
+    """
+    Return the known directory entries of emails, keyed on normalized email
+    """
+    normalized = list({normalize(email) for email in emails})
+    rows = await db.fetchall(
+        "SELECT email, contact_id, contact_lookup_id FROM contact_index"
+        f" WHERE email IN ({', '.join('?' * len(normalized))})",  # nosec B608
+        normalized,
+    )
+    found = {
+        email: {"id": contact_id, "contactLookupId": contact_lookup_id}
+        for email, contact_id, contact_lookup_id in rows
+    }
+    unknown = [email for email in normalized if email not in found]
+    if unknown:
+        for email, cached in zip(unknown, await contact_cache.get_many(unknown)):
+            if cached is not shared_cache.MISSING:
+                found[email] = cached
+    return found
+
+
+async def remember_many(entries: list[tuple[str, str, str]]) -> None:
+    """
+    Index (email, contact_id, contact_lookup_id) entries in one transaction
+    """
+    now = time.time()
+    await db.executemany(
+        "INSERT OR REPLACE INTO contact_index"
+        " (email, contact_id, contact_lookup_id, updated_at) VALUES (?, ?, ?, ?)",
+        [(normalize(email), cid, lookup_id, now) for email, cid, lookup_id in entries],
+    )
+    await contact_cache.set_many(
+        [
+            (normalize(email), {"id": cid, "contactLookupId": lookup_id})
+            for email, cid, lookup_id in entries
+        ],
+        settings.CONTACT_CACHE_TTL,
+    )
+
+
+async def forget(email: str) -> None:
+    await db.execute("DELETE FROM contact_index WHERE email = ?", (normalize(email),))
+    await contact_cache.delete(normalize(email))
+
+
+async def warm() -> None:
+    """
+    Load every contact of the mailing list into the index
+    """
+    ratelimit.set_background()
+    start_time = time.time()
+    row = await db.fetchone(
+        "SELECT warmed_at FROM contact_index_warm WHERE mailing_list_id = ?",
+        (settings.MAILING_LIST_ID,),
+    )
+    if row is not None and row[0] > start_time - settings.CONTACT_INDEX_WARM_INTERVAL:
+        log.info("Contact index is fresh, skipping warm-up")
+        return
+
+    loaded = 0
+    try:
+        async for page in client.iter_mailing_list_contacts(
+            settings.DIRECTORY_ID, settings.MAILING_LIST_ID
+        ):
+            rows = [
+                (
+                    normalize(contact["email"]),
+                    contact.get("contactId") or contact["id"],
+                    contact["contactLookupId"],
+                    time.time(),
+                )
+                for contact in page
+                if contact.get("email") and contact.get("contactLookupId")
+            ]
+            await db.executemany(
+                "INSERT OR REPLACE INTO contact_index"
+                " (email, contact_id, contact_lookup_id, updated_at)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            loaded += len(rows)
+    except Exception as e:  # pylint: disable=broad-except
+        log.exception(e)
+        log.warning("Contact index warm-up stopped after %s contacts", loaded)
+        return
+
+    await db.execute(
+        "INSERT OR REPLACE INTO contact_index_warm (mailing_list_id, warmed_at)"
+        " VALUES (?, ?)",
+        (settings.MAILING_LIST_ID, time.time()),
+    )
+    log.info(
+        "Contact index warmed with %s contacts in %.2f seconds"
+        % (loaded, time.time() - start_time)
+    )
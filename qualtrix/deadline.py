@@ -0,0 +1,66 @@
+"""
+Per-request deadlines carried into every outbound Qualtrics call.
+
+Each endpoint declares a time budget. Callers may shorten it with the
+X-Request-Timeout header (seconds). The deadline is stored in a context
+variable so every client call made while serving the request, including
+retries and polling, only gets the time that remains. Once it has passed,
+outstanding calls are cancelled and the request fails with a 504.
+"""
+
+import asyncio
+import contextvars
+import logging
+
+import fastapi
+
+log = logging.getLogger(__name__)
+
+TIMEOUT_HEADER = "X-Request-Timeout"
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+def budget(seconds: float):
+    """
+    FastAPI dependency giving the request a deadline of at most seconds
+    """
+
+    async def set_deadline(request: fastapi.Request):
+        timeout = seconds
+        header = request.headers.get(TIMEOUT_HEADER)
+        if header:
+            try:
+                timeout = min(timeout, float(header))
+            except ValueError:
+                log.warning("Ignoring invalid %s header: %s", TIMEOUT_HEADER, header)
+        _deadline.set(asyncio.get_running_loop().time() + timeout)
+
+    return set_deadline
+
+
+def clear() -> None:
+    """
+    Run the current task without a deadline, e.g. background work started
+    while serving a request
+    """
+    _deadline.set(None)
+
+
+def at() -> float | None:
+    """
+    Event loop time of the current deadline, if any
+    """
+    return _deadline.get()
+
+
+def remaining() -> float | None:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
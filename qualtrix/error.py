@@ -6,3 +6,13 @@ Custom Qualtrics Error. For specific raise/catch use.
 class QualtricsError(Exception):
     def __init__(self, message):
         super().__init__(message)
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, message="Request deadline exceeded"):
+        super().__init__(message)
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, message="Idempotency key was used for a different request"):
+        super().__init__(message)
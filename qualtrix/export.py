@@ -0,0 +1,82 @@
+"""
+Incremental reader for compressed Qualtrics response export files.
+
+Export files are zip archives holding one JSON document of the form
+{"responses": [...]}. Responses are decoded one at a time from the
+decompressed stream so memory use does not grow with the size of the export.
+"""
+
+import io
+import json
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+
+def iter_responses(fileobj, key: str = "responses", chunk_size: int = CHUNK_SIZE):
+    """
+    Yield each response from a zipped export file object
+    """
+    with zipfile.ZipFile(fileobj) as archive:
+        name = next(n for n in archive.namelist() if n.endswith(".json"))
+        with archive.open(name) as member:
+            text = io.TextIOWrapper(member, encoding="utf-8")
+            yield from iter_json_array(text, key, chunk_size)
+
+
+def iter_json_array(text, key: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Yield the items of the array stored under key in a JSON object read from
+    the text stream, without loading the whole document
+    """
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = text.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        # Drop consumed input once per chunk, so the buffer only holds the
+        # items not yet yielded
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    # Find the opening bracket of the array
+    marker = f'"{key}"'
+    while True:
+        found = buffer.find(marker)
+        if found != -1:
+            start = buffer.find("[", found + len(marker))
+            if start != -1:
+                pos = start + 1
+                break
+        if not fill():
+            raise ValueError(f"Export file does not contain a {key} array")
+
+    while True:
+        while True:
+            while pos < len(buffer) and buffer[pos] in _whitespace + ",":
+                pos += 1
+            if pos < len(buffer) or not fill():
+                break
+        if pos >= len(buffer):
+            raise ValueError("Export file ended before the array was closed")
+        if buffer[pos] == "]":
+            return
+
+        try:
+            item, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof or not fill():
+                raise
+            continue
+
+        yield item
+        pos = end
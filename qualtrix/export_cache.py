@@ -0,0 +1,97 @@
+"""
+Local per-survey cache of exported answers for incremental exports.
+
+Each survey keeps the Qualtrics continuation token from its last export next to
+the answers parsed so far. Incremental exports only download responses
+collected since that token and merge them into the cache.
+"""
+
+import time
+
+import orjson
+
+from qualtrix import settings, storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS export_cursor (
+    survey_id TEXT PRIMARY KEY,
+    continuation_token TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS export_answer (
+    survey_id TEXT NOT NULL,
+    response_id TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    PRIMARY KEY (survey_id, response_id)
+);
+"""
+
+db = storage.Database(settings.EXPORT_CACHE_PATH, SCHEMA)
+
+
+async def get_token(survey_id: str) -> str | None:
+    row = await db.fetchone(
+        "SELECT continuation_token FROM export_cursor WHERE survey_id = ?",
+        (survey_id,),
+    )
+    return row[0] if row else None
+
+
+async def clear(survey_id: str) -> None:
+    def _clear(connection):
+        connection.execute(
+            "DELETE FROM export_answer WHERE survey_id = ?", (survey_id,)
+        )
+        connection.execute(
+            "DELETE FROM export_cursor WHERE survey_id = ?", (survey_id,)
+        )
+
+    await db.transaction(_clear)
+
+
+async def merge(survey_id: str, answers: list[tuple[str, dict]]) -> None:
+    """
+    Insert or replace (response_id, answer) pairs. Replaced answers move to the
+    end of the cache, keeping it ordered by last modification.
+    """
+
+    def _merge(connection):
+        connection.executemany(
+            "DELETE FROM export_answer WHERE survey_id = ? AND response_id = ?",
+            [(survey_id, response_id) for response_id, _ in answers],
+        )
+        connection.executemany(
+            "INSERT INTO export_answer (survey_id, response_id, answer) VALUES (?, ?, ?)",
+            [
+                (survey_id, response_id, orjson.dumps(answer).decode())
+                for response_id, answer in answers
+            ],
+        )
+
+    await db.transaction(_merge)
+
+
+async def set_token(survey_id: str, token: str | None) -> None:
+    await db.execute(
+        "INSERT OR REPLACE INTO export_cursor (survey_id, continuation_token, updated_at)"
+        " VALUES (?, ?, ?)",
+        (survey_id, token, time.time()),
+    )
+
+
+async def iter_answers(survey_id: str, page_size: int = 500):
+    """
+    Yield the cached answers for a survey, reading one page at a time
+    """
+    last_rowid = 0
+    while True:
+        rows = await db.fetchall(
+            "SELECT rowid, answer FROM export_answer"
+            " WHERE survey_id = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+            (survey_id, last_rowid, page_size),
+        )
+        if not rows:
+            return
+        for rowid, answer in rows:
+            last_rowid = rowid
+            yield orjson.loads(answer)
@@ -0,0 +1,259 @@
+"""
+Declarative extraction of answers from survey results.
+
+Each survey type maps output fields to where the answer is found in a result:
+
+* {"label": "QID12"} - the choice label of a question
+* {"value": "RulesConsentID"} - a raw value, e.g. embedded data
+* {"text": "QID7"} - the free text entered for the selected choice
+* {"text_list": "QID4"} - the free text entered for each selected choice
+* {"switch": "QID7", "cases": {1: spec, ...}, "default": spec} - a spec
+  chosen by the raw value of a question, None if no case matches
+* a dict of fields - a nested object
+
+Mappings are compiled once into extractor closures with their keys precomputed.
+The mapping is chosen by the survey_type embedded data of each result, falling
+back to "default". Mappings from the JSON file at ANSWER_MAPPINGS_PATH replace
+the built-in ones of the same survey type.
+"""
+
+import functools
+import json
+import logging
+
+from qualtrix import settings
+
+log = logging.getLogger(__name__)
+
+DEFAULT = "default"
+
+MAPPINGS = {
+    "quality_test": {
+        "tester_id": {"label": "QID1"},
+        "test_type": {"label": "QID2"},
+        "document_modification": {
+            "modifications": {"label": "QID4"},
+            "descriptions": {"text_list": "QID4"},
+        },
+        "image_modification": {"label": "QID5"},
+        "selfie_test_type": {"label": "QID6"},
+        "device": {
+            "device_group": {"label": "QID7"},
+            # Apple, Samsung and Google devices pick a model, any other device
+            # group describes the device in the group's text field
+            "device_model": {
+                "switch": "QID7",
+                "cases": {
+                    1: {"label": "QID8"},
+                    2: {"label": "QID9"},
+                    3: {"label": "QID10"},
+                },
+            },
+            "device_details": {
+                "switch": "QID7",
+                "cases": {
+                    1: {"text": "QID8"},
+                    2: {"text": "QID9"},
+                    3: {"text": "QID10"},
+                },
+                "default": {"text": "QID7"},
+            },
+        },
+        "fake_id_type": {"label": "QID12"},
+        "spoof_artifact_type": {"label": "QID13"},
+        "document_type": {"label": "QID15"},
+        "subject_alteration": {
+            "alterations": {"label": "QID17"},
+            "descriptions": {"text_list": "QID17"},
+        },
+        "mask": {
+            "type": {"label": "QID18"},
+            "description": {"text": "QID18"},
+        },
+    },
+    DEFAULT: {
+        "rules_consent_id": {"value": "RulesConsentID"},
+        "ethnicity": {"label": "QID12"},
+        "race": {"label": "QID36"},
+        "gender": {"label": "QID14"},
+        "age": {"value": "QID15_TEXT"},
+        "income": {"label": "QID24"},
+        "education": {"label": "QID25"},
+        "skin_tone": {"label": "QID67"},
+        "image_redacted_request": {"label": "QID53"},
+        "comments": {"value": "QID38_TEXT"},
+    },
+}
+
+FIELD_SEPARATOR = "."
+
+_SPECS = {"label", "value", "text", "text_list", "switch"}
+
+# Choices seen per question are few, text keys are cached up to this many
+_MAX_TEXT_KEYS = 64
+
+
+def _text_key(question: str):
+    keys = {}
+
+    def key(choice) -> str:
+        try:
+            return keys[choice]
+        except KeyError:
+            text_key = f"{question}_{choice}_TEXT"
+            if len(keys) < _MAX_TEXT_KEYS:
+                keys[choice] = text_key
+            return text_key
+        except TypeError:
+            return f"{question}_{choice}_TEXT"
+
+    return key
+
+
+def _case(choice):
+    # JSON object keys are strings, Qualtrics choices are integers
+    return int(choice) if isinstance(choice, str) and choice.isdigit() else choice
+
+
+def compile_mapping(mapping: dict):
+    """
+    Compile a mapping into a function of (values, labels) returning the answer
+    """
+    if "label" in mapping:
+        question = mapping["label"]
+        return lambda values, labels: labels.get(question)
+
+    if "value" in mapping:
+        field = mapping["value"]
+        return lambda values, labels: values.get(field)
+
+    if "text" in mapping:
+        question, key = mapping["text"], _text_key(mapping["text"])
+        return lambda values, labels: values.get(key(values.get(question)))
+
+    if "text_list" in mapping:
+        question, key = mapping["text_list"], _text_key(mapping["text_list"])
+
+        def text_list(values, labels):
+            choices = values.get(question)
+            if choices is None:
+                return None
+            texts = [values.get(key(choice)) for choice in choices]
+            return [text for text in texts if text is not None]
+
+        return text_list
+
+    if "switch" in mapping:
+        question = mapping["switch"]
+        cases = {
+            _case(choice): compile_mapping(spec)
+            for choice, spec in mapping["cases"].items()
+        }
+        default = mapping.get("default")
+        otherwise = (
+            compile_mapping(default)
+            if default is not None
+            else (lambda values, labels: None)
+        )
+
+        def switch(values, labels):
+            choice = values.get(question)
+            try:
+                extractor = cases.get(choice, otherwise)
+            except TypeError:
+                extractor = otherwise
+            return extractor(values, labels)
+
+        return switch
+
+    nested = tuple((name, compile_mapping(spec)) for name, spec in mapping.items())
+    return lambda values, labels: {
+        name: extractor(values, labels) for name, extractor in nested
+    }
+
+
+@functools.cache
+def mappings() -> dict:
+    """
+    The built-in mappings updated from ANSWER_MAPPINGS_PATH
+    """
+    loaded = dict(MAPPINGS)
+    if settings.ANSWER_MAPPINGS_PATH:
+        with open(settings.ANSWER_MAPPINGS_PATH, encoding="utf-8") as f:
+            loaded.update(json.load(f))
+        log.info("Loaded answer mappings from %s", settings.ANSWER_MAPPINGS_PATH)
+    return loaded
+
+
+@functools.cache
+def extractors() -> dict:
+    """
+    Compiled extractor for each survey type
+    """
+    return {
+        survey_type: compile_mapping(mapping)
+        for survey_type, mapping in mappings().items()
+    }
+
+
+def _fields(mapping: dict, prefix: str = "") -> list[str]:
+    if _SPECS.intersection(mapping):
+        return [prefix]
+    return [
+        field
+        for name, spec in mapping.items()
+        for field in _fields(spec, f"{prefix}{name}{FIELD_SEPARATOR}")
+    ]
+
+
+@functools.cache
+def fields() -> dict:
+    """
+    Flattened answer fields of each survey type, nested fields joined with
+    FIELD_SEPARATOR
+    """
+    return {
+        survey_type: tuple(field[: -len(FIELD_SEPARATOR)] for field in _fields(mapping))
+        for survey_type, mapping in mappings().items()
+    }
+
+
+def clear() -> None:
+    """
+    Reload mappings on next use
+    """
+    for cached in (mappings, extractors, fields):
+        cached.cache_clear()
+
+
+def extract(result: dict) -> dict:
+    """
+    The answer of a result, raising KeyError if it has no values or labels
+    """
+    values = result["values"]
+    compiled = extractors()
+    return compiled.get(values.get("survey_type"), compiled[DEFAULT])(
+        values, result["labels"]
+    )
+
+
+def extract_batch(results: list) -> list:
+    """
+    The answer of each result in one pass, None for malformed results (without
+    values or labels, or with values of unexpected types)
+    """
+    compiled = extractors()
+    default = compiled[DEFAULT]
+    answers = []
+    append = answers.append
+    for result in results:
+        try:
+            values = result["values"]
+            append(
+                compiled.get(values.get("survey_type"), default)(
+                    values, result["labels"]
+                )
+            )
+        except (KeyError, TypeError, AttributeError):
+            append(None)
+    return answers
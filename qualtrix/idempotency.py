@@ -0,0 +1,47 @@
+"""
+Idempotent replay of /redirect.
+
+The first successful result for an idempotency key is kept in the shared cache
+for IDEMPOTENCY_WINDOW seconds and replayed to retries, so with a shared
+CACHE_BACKEND a retry routed to another instance is replayed too. Duplicates
+that arrive while the first request is still running wait for its result
+instead of starting their own. Results are bound to a fingerprint of the
+request, so a key reused for a different request is rejected instead of
+replaying another participant's result.
+"""
+
+import hashlib
+
+from qualtrix import error, settings, shared_cache
+
+_results = shared_cache.Cache("idempotency", settings.IDEMPOTENCY_CACHE_SIZE)
+
+
+def redirect_fingerprint(
+    email: str, target_survey_id: str, rules_consent_id: str
+) -> str:
+    """
+    Digest of the fields that decide the result of a redirect, also the key of
+    requests that do not send one
+    """
+    return hashlib.sha256(
+        f"{email.strip().lower()}|{target_survey_id}|{rules_consent_id}".encode()
+    ).hexdigest()
+
+
+async def run(key: str, fn, fingerprint: str) -> tuple:
+    """
+    Return (result, replayed) for key, calling fn only if no result is stored
+    or in flight. Failures are not stored so they can be retried. Raises
+    IdempotencyConflict if key was first used with a different fingerprint.
+    """
+    called = []
+
+    async def call():
+        called.append(fingerprint)
+        return (fingerprint, await fn()), settings.IDEMPOTENCY_WINDOW
+
+    stored_fingerprint, result = await _results.fetch(key, call)
+    if stored_fingerprint != fingerprint:
+        raise error.IdempotencyConflict()
+    return result, not called
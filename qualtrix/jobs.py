@@ -0,0 +1,246 @@
+"""
+Background export jobs for /bulk-responses.
+
+Submitting an export returns immediately with a job id. The Qualtrics export is
+polled on the event loop by a background task and the job records its status and
+progress until the export file is ready to be fetched.
+
+Incremental jobs resume from the survey's last continuation token and merge the
+new responses into the local export cache, which then serves the result.
+
+Jobs are also kept in the shared cache when they start and finish, so any
+instance can report their status. Any instance can stream the result of other
+jobs from Qualtrics, while incremental results are only served by the instance
+that ran the job.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+
+from qualtrix import (
+    client,
+    error,
+    export_cache,
+    metrics,
+    ratelimit,
+    settings,
+    shared_cache,
+    tracing,
+)
+
+log = logging.getLogger(__name__)
+
+IN_PROGRESS = "inProgress"
+COMPLETE = "complete"
+FAILED = "failed"
+
+
+class ExportJob:
+    def __init__(self, survey_id: str, incremental: bool = False) -> None:
+        self.id = uuid.uuid4().hex
+        self.survey_id = survey_id
+        self.incremental = incremental
+        self.status = IN_PROGRESS
+        self.percent_complete = 0.0
+        self.progress_id = None
+        self.file_id = None
+        self.continuation_token = None
+        self.error = None
+        self.created = time.time()
+        self.task = None
+        # Responses post-processed, and those without an answer (malformed) or
+        # response id (skipped, incremental jobs only). Other jobs only count
+        # them once their export file has been read, see iter_file().
+        self.report = (
+            {"responses": 0, "malformed": 0, "skipped": 0} if incremental else None
+        )
+
+    def update(self, progress: dict) -> None:
+        self.percent_complete = float(progress.get("percentComplete", 0))
+        self.continuation_token = progress.get(
+            "continuationToken", self.continuation_token
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "jobId": self.id,
+            "surveyId": self.survey_id,
+            "incremental": self.incremental,
+            "status": self.status,
+            "percentComplete": self.percent_complete,
+            "error": self.error,
+            "report": None if self.report is None else dict(self.report),
+        }
+
+    def to_state(self) -> dict:
+        return {**self.to_dict(), "fileId": self.file_id, "created": self.created}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "ExportJob":
+        job = cls(state["surveyId"], state["incremental"])
+        job.id = state["jobId"]
+        job.status = state["status"]
+        job.percent_complete = state["percentComplete"]
+        job.error = state["error"]
+        job.file_id = state["fileId"]
+        job.created = state["created"]
+        job.report = state.get("report", job.report)
+        return job
+
+
+_jobs: dict[str, ExportJob] = {}
+job_cache = shared_cache.Cache("export_jobs", settings.EXPORT_JOB_CACHE_SIZE)
+
+
+def submit_export(survey_id: str, incremental: bool = False) -> ExportJob:
+    _prune()
+    job = ExportJob(survey_id, incremental)
+    _jobs[job.id] = job
+    job.task = asyncio.create_task(_run(job, tracing.current_traceparent()))
+    log.info("Export job %s submitted for survey %s", job.id, survey_id)
+    return job
+
+
+async def get_job(job_id: str) -> ExportJob | None:
+    """
+    The job submitted to this instance, or as last stored by another one
+    """
+    job = _jobs.get(job_id)
+    if job is not None:
+        return job
+    state = await job_cache.get(job_id)
+    return None if state is shared_cache.MISSING else ExportJob.from_state(state)
+
+
+async def _publish(job: ExportJob) -> None:
+    await job_cache.set(job.id, job.to_state(), settings.EXPORT_JOB_TTL)
+
+
+def is_local(job: ExportJob) -> bool:
+    """
+    Whether the job was submitted to this instance
+    """
+    return job.id in _jobs
+
+
+async def iter_file(job: ExportJob):
+    """
+    Yield the answers in the export file of a completed job. Its report is
+    filled in and published when a download first reads the whole file.
+    """
+    report = {}
+    async for answer in client.iter_export_file(job.survey_id, job.file_id, report):
+        yield answer
+    if job.report is None:
+        job.report = {**report, "skipped": 0}
+        await _publish(job)
+
+
+async def _run(job: ExportJob, traceparent: str | None = None) -> None:
+    ratelimit.set_background()
+    start_time = time.time()
+    await _publish(job)
+    try:
+        with (
+            tracing.span("export_job", link=traceparent, survey=job.survey_id),
+            metrics.BACKGROUND_TASKS.labels("export_job").track_inprogress(),
+        ):
+            if job.incremental:
+                await _run_incremental(job)
+            else:
+                job.progress_id = await client.start_export(job.survey_id)
+                job.file_id = await client.wait_for_export(
+                    job.survey_id, job.progress_id, on_progress=job.update
+                )
+        job.status = COMPLETE
+        log.info(
+            "Export job %s completed in %.2f seconds"
+            % (job.id, time.time() - start_time)
+        )
+    except error.QualtricsError as e:
+        log.error(e)
+        job.status = FAILED
+        job.error = str(e)
+    except Exception as e:  # pylint: disable=broad-except
+        log.exception(e)
+        job.status = FAILED
+        job.error = "Unexpected error while exporting responses"
+    await _publish(job)
+
+
+async def _run_incremental(job: ExportJob) -> None:
+    token = await export_cache.get_token(job.survey_id)
+    try:
+        job.progress_id = await client.start_export(
+            job.survey_id, continuation_token=token, allow_continuation=True
+        )
+    except error.QualtricsError:
+        if token is None:
+            raise
+        # Continuation tokens expire, start over with a full export
+        log.warning("Continuation token rejected for survey %s", job.survey_id)
+        token = None
+        job.progress_id = await client.start_export(
+            job.survey_id, allow_continuation=True
+        )
+
+    job.file_id = await client.wait_for_export(
+        job.survey_id, job.progress_id, on_progress=job.update
+    )
+
+    if token is None:
+        await export_cache.clear(job.survey_id)
+
+    report = job.report
+    async for batch in client.iter_export_batches(job.survey_id, job.file_id):
+        answers = []
+        for result, answer in zip(batch, await client.extract_answers(batch)):
+            if answer is None:
+                report["malformed"] += 1
+            elif "responseId" not in result:
+                report["skipped"] += 1
+            else:
+                answers.append((result["responseId"], answer))
+        await export_cache.merge(job.survey_id, answers)
+        report["responses"] += len(batch)
+
+    # Only advance the cursor once every new response has been stored
+    await export_cache.set_token(job.survey_id, job.continuation_token)
+    log.info(
+        "Merged %s responses into export cache for %s, skipped %s malformed"
+        " and %s without a response id",
+        report["responses"] - report["malformed"] - report["skipped"],
+        job.survey_id,
+        report["malformed"],
+        report["skipped"],
+    )
+
+
+def _prune() -> None:
+    """
+    Drop finished jobs older than EXPORT_JOB_TTL
+    """
+    expiry = time.time() - settings.EXPORT_JOB_TTL
+    for job_id in [
+        job.id
+        for job in _jobs.values()
+        if job.created < expiry and job.status != IN_PROGRESS
+    ]:
+        del _jobs[job_id]
+
+
+async def shutdown() -> None:
+    """
+    Cancel export jobs that are still polling and mark them failed
+    """
+    running = [job for job in _jobs.values() if job.task and not job.task.done()]
+    for job in running:
+        job.task.cancel()
+    await asyncio.gather(*[job.task for job in running], return_exceptions=True)
+    # Other instances would otherwise report them in progress until they expire
+    for job in running:
+        job.status = FAILED
+        job.error = "Export job was interrupted"
+        await _publish(job)
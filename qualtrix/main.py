@@ -2,17 +2,77 @@
 Qualtrix Microservice FastAPI Web App.
 """
 
+import asyncio
+import contextlib
 import logging
+import re
 
 import fastapi
+from fastapi.responses import JSONResponse
 import starlette_prometheus
 
-from . import api, settings
+from . import (
+    api,
+    contacts,
+    error,
+    export_cache,
+    jobs,
+    outbox,
+    settings,
+    shared_cache,
+    tracing,
+    transport,
+    workers,
+)
 
 logging.basicConfig(level=settings.LOG_LEVEL)
 
-app = fastapi.FastAPI()
+_TOKEN_PARAM = re.compile(r"([?&]token=)[^&]*")
 
+
+def redact_tokens(record: logging.LogRecord) -> bool:
+    """
+    Hide token query parameters, e.g. the EVENT_SECRET of /events callbacks,
+    from uvicorn access log lines
+    """
+    if isinstance(record.args, tuple):
+        record.args = tuple(
+            _TOKEN_PARAM.sub(r"\1[redacted]", arg) if isinstance(arg, str) else arg
+            for arg in record.args
+        )
+    return True
+
+
+logging.getLogger("uvicorn.access").addFilter(redact_tokens)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app: fastapi.FastAPI):
+    await outbox.start()
+    warm_contacts = None
+    if settings.CONTACT_INDEX_WARM:
+        warm_contacts = asyncio.create_task(contacts.warm())
+    yield
+    if warm_contacts is not None:
+        warm_contacts.cancel()
+    await outbox.stop()
+    await jobs.shutdown()
+    workers.shutdown()
+    await shared_cache.close()
+    await transport.close()
+    export_cache.db.close()
+    outbox.db.close()
+    contacts.db.close()
+
+
+async def deadline_exceeded(_request: fastapi.Request, e: error.DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": e.args})
+
+
+app = fastapi.FastAPI(lifespan=lifespan, default_response_class=api.FastJSONResponse)
+app.add_exception_handler(error.DeadlineExceeded, deadline_exceeded)
+
+app.middleware("http")(tracing.middleware)
 app.add_middleware(starlette_prometheus.PrometheusMiddleware)
 app.add_route("/metrics/", starlette_prometheus.metrics)
 
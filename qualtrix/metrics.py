@@ -0,0 +1,72 @@
+"""
+Prometheus metrics for the qualtrix microservice, exposed on /metrics with the
+starlette_prometheus request metrics.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+CACHE_REQUESTS = Counter(
+    "qualtrix_cache_requests_total",
+    "Lookups in local Qualtrics caches",
+    ["cache", "result"],
+)
+
+OUTBOX_DEPTH = Gauge(
+    "qualtrix_outbox_depth",
+    "Outbox tasks by status",
+    ["status"],
+)
+OUTBOX_OLDEST_AGE = Gauge(
+    "qualtrix_outbox_oldest_age_seconds",
+    "Age of the oldest outbox task still waiting to complete",
+)
+
+LINK_READY_SECONDS = Histogram(
+    "qualtrix_link_ready_seconds",
+    "Time from the first distribution link poll until the link is populated",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10),
+)
+LINK_READY_TIMEOUTS = Counter(
+    "qualtrix_link_ready_timeouts_total",
+    "Distribution links not populated within LINK_READY_BUDGET",
+)
+
+UPSTREAM_LATENCY = Histogram(
+    "qualtrix_upstream_request_seconds",
+    "Latency of each outbound Qualtrics request attempt",
+    ["operation"],
+)
+UPSTREAM_RESPONSES = Counter(
+    "qualtrix_upstream_responses_total",
+    "Outbound Qualtrics responses by status code, or error if none was received",
+    ["operation", "status"],
+)
+UPSTREAM_RETRIES = Counter(
+    "qualtrix_upstream_retries_total",
+    "Outbound Qualtrics requests retried",
+    ["operation"],
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "qualtrix_upstream_requests_in_flight",
+    "Outbound Qualtrics requests awaiting a response",
+    ["operation"],
+)
+EXPORT_RESPONSES = Counter(
+    "qualtrix_export_responses_total",
+    "Exported responses post-processed, by whether an answer was extracted",
+    ["result"],
+)
+EXPORT_POLLS = Counter(
+    "qualtrix_export_polls_total",
+    "Export progress polls made while waiting for exports to complete",
+)
+BACKGROUND_TASKS = Gauge(
+    "qualtrix_background_tasks",
+    "Background tasks currently running",
+    ["kind"],
+)
+BACKGROUND_TASK_FAILURES = Counter(
+    "qualtrix_background_task_failures_total",
+    "Background tasks that ended with an exception",
+    ["kind"],
+)
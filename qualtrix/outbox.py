@@ -0,0 +1,252 @@
+"""
+Durable outbox for side effects that run after a request has returned.
+
+Tasks are persisted to SQLite before the request returns and are served by a
+bounded pool of async workers. Failed tasks are retried with exponential
+backoff and dead-lettered after OUTBOX_MAX_ATTEMPTS. On shutdown the workers
+drain due tasks for up to OUTBOX_DRAIN_TIMEOUT seconds; anything left is picked
+up again when the app next starts.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+
+from qualtrix import metrics, ratelimit, settings, storage, tracing
+
+log = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_error TEXT,
+    result TEXT,
+    traceparent TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, available_at);
+"""
+
+db = storage.Database(settings.OUTBOX_PATH, SCHEMA)
+
+_handlers = {}
+_workers = []
+_wakeup: asyncio.Event | None = None
+_stopping = False
+_metrics_refreshed = 0.0
+
+
+def handler(kind: str):
+    """
+    Register an async function as the handler for tasks of a kind. The task
+    payload is passed as keyword arguments.
+    """
+
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+
+    return register
+
+
+async def enqueue(kind: str, payload: dict) -> int:
+    return (await enqueue_many(kind, [payload]))[0]
+
+
+async def enqueue_many(kind: str, payloads: list[dict]) -> list[int]:
+    """
+    Persist one task per payload in a single transaction, returning their ids
+    """
+    if kind not in _handlers:
+        raise ValueError(f"No outbox handler registered for {kind}")
+
+    now = time.time()
+    traceparent = tracing.current_traceparent()
+    rows = [
+        (kind, json.dumps(payload), PENDING, now, now, traceparent)
+        for payload in payloads
+    ]
+    task_ids = await db.transaction(
+        lambda c: [
+            c.execute(
+                "INSERT INTO outbox"
+                " (kind, payload, status, available_at, created_at, traceparent)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                row,
+            ).lastrowid
+            for row in rows
+        ]
+    )
+    if _wakeup is not None:
+        _wakeup.set()
+    return task_ids
+
+
+async def start() -> None:
+    global _wakeup, _stopping
+    _wakeup = asyncio.Event()
+    _stopping = False
+
+    # Outboxes created before tasks recorded the trace that scheduled them
+    columns = [row[1] for row in await db.fetchall("PRAGMA table_info(outbox)")]
+    if "traceparent" not in columns:
+        await db.execute("ALTER TABLE outbox ADD COLUMN traceparent TEXT")
+
+    # Tasks left running by a previous process never finished
+    recovered = await db.execute(
+        "UPDATE outbox SET status = ? WHERE status = ?", (PENDING, RUNNING)
+    )
+    if recovered:
+        log.warning("Recovered %s interrupted outbox tasks", recovered)
+
+    await db.execute(
+        "DELETE FROM outbox WHERE status = ? AND created_at < ?",
+        (DONE, time.time() - settings.OUTBOX_RETENTION),
+    )
+
+    for i in range(settings.OUTBOX_WORKERS):
+        _workers.append(asyncio.create_task(_work(i)))
+    log.info("Started %s outbox workers", settings.OUTBOX_WORKERS)
+
+
+async def stop() -> None:
+    """
+    Drain due tasks, then stop the workers
+    """
+    global _stopping
+    if not _workers:
+        return
+
+    _stopping = True
+    _wakeup.set()
+    _, pending = await asyncio.wait(_workers, timeout=settings.OUTBOX_DRAIN_TIMEOUT)
+    for worker in pending:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+    if pending:
+        log.warning("Outbox drain timed out, remaining tasks resume on next start")
+
+
+async def _work(worker: int) -> None:
+    ratelimit.set_background()
+    while True:
+        task = await db.transaction(_claim)
+        await _refresh_metrics()
+
+        if task is None:
+            if _stopping:
+                return
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    _wakeup.wait(), timeout=settings.OUTBOX_POLL_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        await _run(worker, *task)
+
+
+def _claim(connection):
+    row = connection.execute(
+        "SELECT id, kind, payload, attempts, traceparent FROM outbox"
+        " WHERE status = ? AND available_at <= ? ORDER BY id LIMIT 1",
+        (PENDING, time.time()),
+    ).fetchone()
+    if row is not None:
+        connection.execute(
+            "UPDATE outbox SET status = ?, attempts = attempts + 1 WHERE id = ?",
+            (RUNNING, row[0]),
+        )
+    return row
+
+
+async def _run(
+    worker: int,
+    task_id: int,
+    kind: str,
+    payload: str,
+    attempts: int,
+    traceparent: str | None = None,
+):
+    attempts += 1
+    try:
+        with (
+            tracing.span(
+                f"outbox {kind}", link=traceparent, task=task_id, attempt=attempts
+            ),
+            metrics.BACKGROUND_TASKS.labels("outbox").track_inprogress(),
+        ):
+            result = await _handlers[kind](**json.loads(payload))
+    except asyncio.CancelledError:
+        await db.execute(
+            "UPDATE outbox SET status = ? WHERE id = ?", (PENDING, task_id)
+        )
+        raise
+    except Exception as e:  # pylint: disable=broad-except
+        if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            log.error("Outbox task %s (%s) dead-lettered: %s", task_id, kind, e)
+            status, available_at = DEAD, time.time()
+        else:
+            delay = min(
+                settings.OUTBOX_BACKOFF * 2 ** (attempts - 1),
+                settings.OUTBOX_MAX_BACKOFF,
+            )
+            delay *= random.uniform(0.5, 1.5)  # nosec B311 jitter, not crypto
+            log.warning(
+                "Outbox task %s (%s) failed, retrying in %.1f seconds: %s",
+                task_id,
+                kind,
+                delay,
+                e,
+            )
+            status, available_at = PENDING, time.time() + delay
+
+        await db.execute(
+            "UPDATE outbox SET status = ?, available_at = ?, last_error = ?"
+            " WHERE id = ?",
+            (status, available_at, str(e), task_id),
+        )
+        return
+
+    log.debug("Outbox worker %s completed task %s (%s)", worker, task_id, kind)
+    await db.execute(
+        "UPDATE outbox SET status = ?, result = ?, last_error = NULL WHERE id = ?",
+        (DONE, json.dumps(result, default=str), task_id),
+    )
+
+
+async def _refresh_metrics() -> None:
+    global _metrics_refreshed
+    now = time.time()
+    if now - _metrics_refreshed < 1:
+        return
+    _metrics_refreshed = now
+
+    rows = await db.fetchall(
+        "SELECT status, COUNT(*), MIN(created_at) FROM outbox"
+        " WHERE status != ? GROUP BY status",
+        (DONE,),
+    )
+    counts = {status: (count, oldest) for status, count, oldest in rows}
+    for status in (PENDING, RUNNING, DEAD):
+        count, _ = counts.get(status, (0, None))
+        metrics.OUTBOX_DEPTH.labels(status).set(count)
+
+    oldest = [counts[s][1] for s in (PENDING, RUNNING) if s in counts]
+    metrics.OUTBOX_OLDEST_AGE.set(now - min(oldest) if oldest else 0)
@@ -0,0 +1,93 @@
+"""
+Token buckets limiting outbound Qualtrics calls per endpoint family.
+
+Interactive calls (made while serving a request) take priority over background
+work such as reminders, contact index warm-up and exports: background callers
+wait while any interactive caller is waiting on the same bucket.
+"""
+
+import asyncio
+import contextvars
+import time
+
+from qualtrix import settings
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_priority = contextvars.ContextVar("priority", default=INTERACTIVE)
+
+
+def set_background() -> None:
+    """
+    Mark outbound calls made from the current task as background work
+    """
+    _priority.set(BACKGROUND)
+
+
+def is_interactive() -> bool:
+    return _priority.get() == INTERACTIVE
+
+
+def endpoint_family(path: str) -> str:
+    if "/export-responses" in path:
+        return "exports"
+    if "/distributions" in path:
+        return "distributions"
+    if "/directories/" in path:
+        return "contacts"
+    if "/surveys/" in path:
+        return "responses"
+    return "other"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._interactive_waiting = 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold every caller for seconds, e.g. after a 429 with Retry-After
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, interactive: bool = True) -> None:
+        if interactive:
+            self._interactive_waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                yielding = not interactive and self._interactive_waiting > 0
+                if now >= self.paused_until and self.tokens >= 1 and not yielding:
+                    self.tokens -= 1
+                    return
+
+                wait = max(
+                    self.paused_until - now,
+                    (1 - self.tokens) / self.rate,
+                    1 / self.rate if yielding else 0,
+                )
+                await asyncio.sleep(wait)
+        finally:
+            if interactive:
+                self._interactive_waiting -= 1
+
+
+_buckets: dict[str, TokenBucket] = {}
+
+
+def bucket(family: str) -> TokenBucket:
+    if family not in _buckets:
+        rate = settings.RATE_LIMITS.get(family, settings.RATE_LIMITS["other"])
+        _buckets[family] = TokenBucket(rate, max(rate, 1))
+    return _buckets[family]
@@ -6,6 +6,7 @@ Context is switched based on if the app is in debug mode.
 import json
 import logging
 import os
+import tempfile
 
 log = logging.getLogger(__name__)
 
@@ -92,5 +93,157 @@ except (json.JSONDecodeError, KeyError, FileNotFoundError) as err:
     log.debug("Error: %s", str(err))
 
 RETRY_ATTEMPTS = 5
-RETRY_WAIT = 2
+# Base and cap in seconds of the exponential backoff between retries
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "0.5"))
+RETRY_MAX_WAIT = float(os.getenv("RETRY_MAX_WAIT", "8"))
 TIMEOUT = 5
+
+# Time budget in seconds for serving each endpoint, including every Qualtrics
+# call it makes. Callers can shorten it with the X-Request-Timeout header.
+DEADLINES = {
+    endpoint: float(os.getenv(f"DEADLINE_{endpoint.upper()}", default))
+    for endpoint, default in {
+        "redirect": "15",
+        "redirect_batch": "300",
+        "response": "15",
+        "responses": "30",
+        "schema": "10",
+        "session": "10",
+        "contact": "10",
+        "response_ids": "15",
+    }.items()
+}
+
+# Outbound requests per second for each Qualtrics endpoint family
+RATE_LIMITS = {
+    family: float(os.getenv(f"RATE_LIMIT_{family.upper()}", default))
+    for family, default in {
+        "contacts": "20",
+        "distributions": "20",
+        "responses": "20",
+        "exports": "5",
+        "other": "20",
+    }.items()
+}
+
+# Outbound HTTP connection pool
+HTTP2 = os.getenv("HTTP2", "True") == "True"
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# Backend of the response, schema, contact and export job caches: "memory"
+# (per process), "sqlite" (CACHE_PATH, per host) or "redis" (CACHE_REDIS_URL,
+# shared by every instance). See shared_cache.py.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv(
+    "CACHE_PATH", os.path.join(tempfile.gettempdir(), "qualtrix-cache.db")
+)
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "qualtrix:")
+CACHE_TIMEOUT = float(os.getenv("CACHE_TIMEOUT", "1"))
+# A load holds its stampede lock for at most CACHE_LOCK_TTL seconds, other
+# instances poll for its value every CACHE_LOCK_POLL for up to CACHE_LOCK_WAIT
+CACHE_LOCK_TTL = float(os.getenv("CACHE_LOCK_TTL", "15"))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", "10"))
+CACHE_LOCK_POLL = float(os.getenv("CACHE_LOCK_POLL", "0.05"))
+
+# /response cache, TTLs in seconds
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_FINISHED_TTL = int(os.getenv("RESPONSE_CACHE_FINISHED_TTL", "86400"))
+RESPONSE_CACHE_IN_PROGRESS_TTL = int(os.getenv("RESPONSE_CACHE_IN_PROGRESS_TTL", "30"))
+RESPONSE_CACHE_MISS_TTL = int(os.getenv("RESPONSE_CACHE_MISS_TTL", "5"))
+
+# /survey-schema cache, TTLs in seconds
+SCHEMA_CACHE_SIZE = int(os.getenv("SCHEMA_CACHE_SIZE", "256"))
+SCHEMA_CACHE_TTL = int(os.getenv("SCHEMA_CACHE_TTL", "3600"))
+SCHEMA_CACHE_STALE_TTL = int(os.getenv("SCHEMA_CACHE_STALE_TTL", "86400"))
+
+# responseId lookups by contact or distribution
+DISTRIBUTION_HISTORY_CONCURRENCY = int(
+    os.getenv("DISTRIBUTION_HISTORY_CONCURRENCY", "5")
+)
+RESPONSE_IDS_DEADLINE = float(os.getenv("RESPONSE_IDS_DEADLINE", "10"))
+
+# Batch response fetches with /responses
+RESPONSE_BATCH_MAX_SIZE = int(os.getenv("RESPONSE_BATCH_MAX_SIZE", "100"))
+RESPONSE_BATCH_CONCURRENCY = int(os.getenv("RESPONSE_BATCH_CONCURRENCY", "8"))
+
+# Qualtrics event subscription callbacks on /events must carry EVENT_SECRET as
+# their token. Responses of EVENT_TOPICS events (e.g. completedResponse,
+# partialResponse) are stored in the response cache, other events are ignored.
+EVENT_SECRET = os.getenv("EVENT_SECRET", "")
+EVENT_TOPICS = os.getenv("EVENT_TOPICS", "completedResponse").split(",")
+
+# Polling for distribution links right after the distribution is created
+LINK_READY_BUDGET = float(os.getenv("LINK_READY_BUDGET", "3"))
+LINK_POLL_MIN_WAIT = float(os.getenv("LINK_POLL_MIN_WAIT", "0.1"))
+LINK_POLL_MAX_WAIT = float(os.getenv("LINK_POLL_MAX_WAIT", "1"))
+
+# /redirect idempotency window in seconds
+IDEMPOTENCY_WINDOW = int(os.getenv("IDEMPOTENCY_WINDOW", "600"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+# Local email -> contact index for returning participants
+CONTACT_INDEX_PATH = os.getenv(
+    "CONTACT_INDEX_PATH", os.path.join(tempfile.gettempdir(), "qualtrix-contacts.db")
+)
+CONTACT_INDEX_WARM = os.getenv("CONTACT_INDEX_WARM", "True") == "True"
+# Startup warm-ups are skipped while the last complete one is younger than this
+CONTACT_INDEX_WARM_INTERVAL = int(os.getenv("CONTACT_INDEX_WARM_INTERVAL", "86400"))
+# Contacts are also kept in the shared cache for other instances
+CONTACT_CACHE_SIZE = int(os.getenv("CONTACT_CACHE_SIZE", "10000"))
+CONTACT_CACHE_TTL = int(os.getenv("CONTACT_CACHE_TTL", "604800"))
+
+# Participants per /redirect-batch call, and how many of them get their
+# distribution and link concurrently once their contacts are imported
+REDIRECT_BATCH_MAX_SIZE = int(os.getenv("REDIRECT_BATCH_MAX_SIZE", "1000"))
+REDIRECT_BATCH_CONCURRENCY = int(os.getenv("REDIRECT_BATCH_CONCURRENCY", "8"))
+
+# Days after the invite each reminder distribution is sent
+# An empty value sends no reminders
+REMINDER_OFFSETS_DAYS = [
+    float(offset)
+    for offset in os.getenv("REMINDER_OFFSETS_DAYS", "1,3").split(",")
+    if offset.strip()
+]
+
+# Outbox for side effects of /redirect (reminders, contact embedded data)
+OUTBOX_PATH = os.getenv(
+    "OUTBOX_PATH", os.path.join(tempfile.gettempdir(), "qualtrix-outbox.db")
+)
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF = float(os.getenv("OUTBOX_BACKOFF", "2"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_DRAIN_TIMEOUT = float(os.getenv("OUTBOX_DRAIN_TIMEOUT", "8"))
+OUTBOX_RETENTION = int(os.getenv("OUTBOX_RETENTION", "86400"))
+
+# Bulk response export jobs
+EXPORT_POLL_MIN_WAIT = float(os.getenv("EXPORT_POLL_MIN_WAIT", "0.5"))
+EXPORT_POLL_MAX_WAIT = float(os.getenv("EXPORT_POLL_MAX_WAIT", "10"))
+EXPORT_JOB_TTL = int(os.getenv("EXPORT_JOB_TTL", "3600"))
+EXPORT_JOB_CACHE_SIZE = int(os.getenv("EXPORT_JOB_CACHE_SIZE", "1000"))
+# Export files larger than this many bytes are spooled to disk while parsing
+EXPORT_SPOOL_SIZE = int(os.getenv("EXPORT_SPOOL_SIZE", str(1024 * 1024)))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+# Answers are extracted from each batch in chunks of EXPORT_CHUNK_SIZE responses
+# by EXPORT_WORKERS processes, or in a thread when 0. Shipping responses to
+# processes costs about as much as the built-in mappings, so the pool only pays
+# off for heavy custom mappings or many concurrent exports.
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "0"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "250"))
+# SQLite file holding answers and continuation tokens for incremental exports
+EXPORT_CACHE_PATH = os.getenv(
+    "EXPORT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "qualtrix-exports.db")
+)
+
+# Span tracing: "none", "console" (stdout) or "file" (JSON lines in TRACE_FILE)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv(
+    "TRACE_FILE", os.path.join(tempfile.gettempdir(), "qualtrix-traces.jsonl")
+)
+
+# JSON file of answer mappings by survey type, see extract.py
+ANSWER_MAPPINGS_PATH = os.getenv("ANSWER_MAPPINGS_PATH", "")
@@ -0,0 +1,423 @@
+"""
+Cache tier for Qualtrics lookups that can be shared between instances.
+
+Values are serialized with orjson, so they must be JSON types (tuples come
+back as lists). Each cache stores its entries in the backend chosen by
+CACHE_BACKEND:
+
+* "memory" - an LRU per cache in this process, bounded by its size setting
+* "sqlite" - the SQLite file at CACHE_PATH, shared by processes on one host
+* "redis" - the Redis (or Redis protocol) server at CACHE_REDIS_URL, shared by
+  every instance
+
+Every backend expires an entry once its own TTL has passed and never returns
+it after that. Loads through fetch() are protected from stampedes: concurrent
+callers in one process share a single load, and across instances the first
+caller takes a lock entry in the backend while the others wait for the value
+it stores. A backend that cannot be reached is treated as a miss.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+import urllib.parse
+import uuid
+
+import orjson
+
+from qualtrix import cache, metrics, settings, storage
+
+log = logging.getLogger(__name__)
+
+MISSING = cache.MISSING
+
+# Deletes KEYS[1] only while it still holds ARGV[1]
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class CacheError(Exception):
+    pass
+
+
+class MemoryBackend:
+    """
+    Least recently used entries of this process
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+
+    def _get(self, key: str, now: float) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        now = time.monotonic()
+        return [self._get(key, now) for key in keys]
+
+    async def set_many(self, items: list[tuple[str, bytes]], ttl: float) -> None:
+        expires_at = time.monotonic() + ttl
+        for key, value in items:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        if self._get(key, time.monotonic()) is not None:
+            return False
+        await self.set_many([(key, value)], ttl)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def release(self, key: str, value: bytes) -> None:
+        if self._get(key, time.monotonic()) == value:
+            del self._entries[key]
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteBackend:
+    """
+    Entries in a local SQLite file, expired rows are purged as new ones are set
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache_entry (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS cache_entry_expires_at ON cache_entry (expires_at);
+    """
+
+    def __init__(self, path: str) -> None:
+        self.db = storage.Database(path, self.SCHEMA)
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        rows = await self.db.fetchall(
+            "SELECT key, value FROM cache_entry"
+            f" WHERE key IN ({', '.join('?' * len(keys))}) AND expires_at > ?",  # nosec B608
+            [*keys, time.time()],
+        )
+        values = dict(rows)
+        return [values.get(key) for key in keys]
+
+    async def set_many(self, items: list[tuple[str, bytes]], ttl: float) -> None:
+        now = time.time()
+
+        def _set(connection):
+            connection.execute("DELETE FROM cache_entry WHERE expires_at <= ?", (now,))
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache_entry (key, value, expires_at)"
+                " VALUES (?, ?, ?)",
+                [(key, value, now + ttl) for key, value in items],
+            )
+
+        await self.db.transaction(_set)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        now = time.time()
+
+        def _add(connection):
+            connection.execute(
+                "DELETE FROM cache_entry WHERE key = ? AND expires_at <= ?", (key, now)
+            )
+            return connection.execute(
+                "INSERT OR IGNORE INTO cache_entry (key, value, expires_at)"
+                " VALUES (?, ?, ?)",
+                (key, value, now + ttl),
+            ).rowcount
+
+        return await self.db.transaction(_add) == 1
+
+    async def delete(self, key: str) -> None:
+        await self.db.execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+
+    async def release(self, key: str, value: bytes) -> None:
+        await self.db.execute(
+            "DELETE FROM cache_entry WHERE key = ? AND value = ?", (key, value)
+        )
+
+    async def close(self) -> None:
+        self.db.close()
+
+
+class RedisBackend:
+    """
+    Entries on a Redis protocol server, e.g. redis://:password@host:6379/0.
+    Commands are pipelined over a small pool of connections.
+    """
+
+    def __init__(self, url: str) -> None:
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.database = int(parsed.path.lstrip("/") or 0)
+        self.ssl = parsed.scheme == "rediss"
+        self._idle = []
+
+    async def _connect(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl or None),
+            settings.CACHE_TIMEOUT,
+        )
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.database:
+            setup.append(("SELECT", self.database))
+        if setup:
+            await self._pipeline(reader, writer, setup)
+        return reader, writer
+
+    async def execute(self, *commands: tuple) -> list:
+        """
+        Send commands in one round trip, returning their replies
+        """
+        connection = self._idle.pop() if self._idle else await self._connect()
+        try:
+            replies = await asyncio.wait_for(
+                self._pipeline(*connection, commands), settings.CACHE_TIMEOUT
+            )
+        except BaseException:
+            connection[1].close()
+            raise
+        self._idle.append(connection)
+        errors = [reply for reply in replies if isinstance(reply, CacheError)]
+        if errors:
+            raise errors[0]
+        return replies
+
+    @staticmethod
+    async def _pipeline(reader, writer, commands) -> list:
+        writer.write(b"".join(_encode(command) for command in commands))
+        await writer.drain()
+        return [await _read_reply(reader) for _ in commands]
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        return (await self.execute(("MGET", *keys)))[0]
+
+    async def set_many(self, items: list[tuple[str, bytes]], ttl: float) -> None:
+        milliseconds = max(1, int(ttl * 1000))
+        await self.execute(
+            *[("SET", key, value, "PX", milliseconds) for key, value in items]
+        )
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        milliseconds = max(1, int(ttl * 1000))
+        reply = await self.execute(("SET", key, value, "NX", "PX", milliseconds))
+        return reply[0] is not None
+
+    async def delete(self, key: str) -> None:
+        await self.execute(("DEL", key))
+
+    async def release(self, key: str, value: bytes) -> None:
+        await self.execute(("EVAL", RELEASE_SCRIPT, 1, key, value))
+
+    async def close(self) -> None:
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+
+def _encode(command: tuple) -> bytes:
+    parts = [b"*%d\r\n" % len(command)]
+    for arg in command:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def _read_reply(reader):
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise CacheError("Connection closed by the cache server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        # Returned rather than raised so the other pipelined replies are read
+        return CacheError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        length = int(rest)
+        if length < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+    raise CacheError(f"Unexpected reply from the cache server: {line!r}")
+
+
+_shared_backend = None
+
+
+def backend(maxsize: int):
+    """
+    The CACHE_BACKEND for a cache, maxsize only bounds the memory backend
+    """
+    global _shared_backend  # pylint: disable=global-statement
+    if settings.CACHE_BACKEND == "memory":
+        return MemoryBackend(maxsize)
+    if _shared_backend is None:
+        if settings.CACHE_BACKEND == "sqlite":
+            _shared_backend = SQLiteBackend(settings.CACHE_PATH)
+        elif settings.CACHE_BACKEND == "redis":
+            _shared_backend = RedisBackend(settings.CACHE_REDIS_URL)
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND {settings.CACHE_BACKEND}")
+        log.info("Using %s cache backend", settings.CACHE_BACKEND)
+    return _shared_backend
+
+
+async def close() -> None:
+    if _shared_backend is not None:
+        await _shared_backend.close()
+
+
+class Cache:
+    """
+    A named cache of JSON values in a backend. Keys are strings or tuples of
+    values joined with ":".
+    """
+
+    def __init__(self, name: str, maxsize: int, store=None) -> None:
+        self.name = name
+        self.store = store if store is not None else backend(maxsize)
+        self._prefix = f"{settings.CACHE_KEY_PREFIX}{name}:"
+        self._flight = cache.SingleFlight()
+
+    def _key(self, key) -> str:
+        if isinstance(key, tuple):
+            key = ":".join(str(part) for part in key)
+        return self._prefix + key
+
+    async def get(self, key):
+        """
+        Return the cached value for key, or MISSING
+        """
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys: list) -> list:
+        try:
+            values = await self.store.get_many([self._key(key) for key in keys])
+        except (CacheError, OSError, asyncio.TimeoutError) as e:
+            log.warning("%s cache lookup failed: %r", self.name, e)
+            metrics.CACHE_REQUESTS.labels(self.name, "error").inc(len(keys))
+            return [MISSING] * len(keys)
+
+        results = []
+        for value in values:
+            metrics.CACHE_REQUESTS.labels(
+                self.name, "miss" if value is None else "hit"
+            ).inc()
+            results.append(MISSING if value is None else orjson.loads(value))
+        return results
+
+    async def set(self, key, value, ttl: float) -> None:
+        await self.set_many([(key, value)], ttl)
+
+    async def set_many(self, items: list[tuple], ttl: float) -> None:
+        if not items:
+            return
+        try:
+            await self.store.set_many(
+                [(self._key(key), orjson.dumps(value)) for key, value in items], ttl
+            )
+        except (CacheError, OSError, asyncio.TimeoutError) as e:
+            log.warning("%s cache update failed: %r", self.name, e)
+
+    async def delete(self, key) -> None:
+        try:
+            await self.store.delete(self._key(key))
+        except (CacheError, OSError, asyncio.TimeoutError) as e:
+            log.warning("%s cache delete failed: %r", self.name, e)
+
+    def loading(self, key) -> bool:
+        """
+        Whether a fetch() of key is in flight in this process
+        """
+        return self._key(key) in self._flight
+
+    async def fetch(self, key, load, refresh: bool = False):
+        """
+        Return the cached value for key, or call load() for a (value, ttl) pair
+        and store the value for ttl seconds (not at all if ttl is None).
+        refresh skips the cached value and loads a new one, unless another
+        instance is already loading it.
+        """
+        if not refresh:
+            cached = await self.get(key)
+            if cached is not MISSING:
+                return cached
+        return await self._flight.do(
+            self._key(key), lambda: self._load(key, load, refresh)
+        )
+
+    async def _load(self, key, load, refresh: bool):
+        lock_key = self._key(key) + ":lock"
+        token = uuid.uuid4().hex.encode()
+        try:
+            locked = await self.store.add(lock_key, token, settings.CACHE_LOCK_TTL)
+        except (CacheError, OSError, asyncio.TimeoutError) as e:
+            log.warning("%s cache lock failed: %r", self.name, e)
+            locked = None
+
+        if locked is False:
+            cached = await self._wait(key, lock_key)
+            if cached is not MISSING:
+                return cached
+
+        try:
+            value, ttl = await load()
+            if ttl is not None:
+                await self.set(key, value, ttl)
+            return value
+        finally:
+            if locked:
+                # The lock may have expired and been taken by another instance
+                try:
+                    await self.store.release(lock_key, token)
+                except (CacheError, OSError, asyncio.TimeoutError) as e:
+                    log.warning("%s cache unlock failed: %r", self.name, e)
+
+    async def _wait(self, key, lock_key: str):
+        """
+        Wait for the instance holding the lock to store the value, returning
+        MISSING if it gives up or CACHE_LOCK_WAIT seconds pass
+        """
+        give_up_at = time.monotonic() + settings.CACHE_LOCK_WAIT
+        while True:
+            cached = await self.get(key)
+            if cached is not MISSING or time.monotonic() >= give_up_at:
+                return cached
+            try:
+                [held] = await self.store.get_many([lock_key])
+            except (CacheError, OSError, asyncio.TimeoutError):
+                return MISSING
+            if held is None:
+                return await self.get(key)
+            await asyncio.sleep(settings.CACHE_LOCK_POLL)
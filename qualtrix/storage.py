@@ -0,0 +1,68 @@
+"""
+Minimal asyncio wrapper around a local SQLite database.
+
+Statements run in a worker thread so disk I/O never blocks the event loop.
+A lock serializes access to the single shared connection.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class Database:
+    def __init__(self, path: str, schema: str = "") -> None:
+        self.path = path
+        self.schema = schema
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            log.info("Opening SQLite database %s", self.path)
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            if self.schema:
+                self._connection.executescript(self.schema)
+        return self._connection
+
+    def _run(self, fn):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN")
+            try:
+                result = fn(connection)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result
+
+    async def transaction(self, fn):
+        """
+        Run fn(connection) in a single transaction, returning its result
+        """
+        return await asyncio.to_thread(self._run, fn)
+
+    async def execute(self, sql: str, params=()) -> int:
+        return await self.transaction(lambda c: c.execute(sql, params).rowcount)
+
+    async def executemany(self, sql: str, seq_of_params) -> None:
+        await self.transaction(lambda c: c.executemany(sql, seq_of_params))
+
+    async def fetchone(self, sql: str, params=()):
+        return await self.transaction(lambda c: c.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()) -> list:
+        return await self.transaction(lambda c: c.execute(sql, params).fetchall())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
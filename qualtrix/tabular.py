@@ -0,0 +1,193 @@
+"""
+Columnar encodings of exported answers for /bulk-responses.
+
+Answers are flattened into one column per extractor field of every survey
+type (see extract.fields), so exports mixing survey types keep all of their
+answers and every export has the same columns in the same order. Fields of
+other survey types are left empty. Every column is a string; lists and numbers are JSON encoded. Rows are
+encoded and streamed EXPORT_BATCH_SIZE at a time (one Arrow record batch or
+Parquet row group per batch) so large exports stay memory bounded.
+
+Arrow and Parquet need pyarrow. Without it those requests are served as CSV.
+It is only imported once an Arrow or Parquet export is encoded, as it adds
+about 30 MB to the memory of every instance.
+"""
+
+import asyncio
+import csv
+import importlib.util
+import io
+import json
+import logging
+
+from qualtrix import extract, settings
+
+log = logging.getLogger(__name__)
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+CSV_MEDIA_TYPE = "text/csv"
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+def _pyarrow():
+    # pylint: disable=import-outside-toplevel
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    return pyarrow
+
+
+def negotiate(accept: str) -> str | None:
+    """
+    The first columnar media type listed in an Accept header, None if there is
+    none
+    """
+    for media_range in accept.split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        if media_type in (ARROW_MEDIA_TYPE, PARQUET_MEDIA_TYPE):
+            if not HAS_PYARROW:
+                log.warning("pyarrow is not installed, serving %s as CSV", media_type)
+                return CSV_MEDIA_TYPE
+            return media_type
+        if media_type == CSV_MEDIA_TYPE:
+            return media_type
+    return None
+
+
+def flatten(answer: dict, prefix: str = "") -> dict:
+    row = {}
+    for name, value in answer.items():
+        if isinstance(value, dict):
+            row.update(flatten(value, f"{prefix}{name}{extract.FIELD_SEPARATOR}"))
+        else:
+            row[prefix + name] = value
+    return row
+
+
+def columns() -> tuple:
+    """
+    The fields of every survey type, the default survey type's first
+    """
+    fields = extract.fields()
+    names = dict.fromkeys(fields[extract.DEFAULT])
+    for survey_fields in fields.values():
+        names.update(dict.fromkeys(survey_fields))
+    return tuple(names)
+
+
+def _cell(value) -> str | None:
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class _Sink:
+    """
+    Write-only file collecting encoded bytes until they are drained. tell()
+    keeps counting across drains so Parquet footer offsets stay correct.
+    """
+
+    closed = False
+
+    def __init__(self) -> None:
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _CsvWriter:
+    def __init__(self, columns: tuple) -> None:
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._writer.writerow(columns)
+
+    def write(self, rows: list[dict]) -> bytes:
+        self._writer.writerows(
+            [[_cell(row.get(column)) for column in self.columns] for row in rows]
+        )
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def close(self) -> bytes:
+        return self.write([])
+
+
+class _ArrowWriter:
+    def __init__(self, columns: tuple) -> None:
+        self.columns = columns
+        self.pyarrow = _pyarrow()
+        self.schema = self.pyarrow.schema(
+            [(column, self.pyarrow.string()) for column in columns]
+        )
+        self._sink = _Sink()
+        self._writer = self._open()
+
+    def _open(self):
+        return self.pyarrow.ipc.new_stream(self._sink, self.schema)
+
+    def write(self, rows: list[dict]) -> bytes:
+        self._writer.write_batch(
+            self.pyarrow.record_batch(
+                [[_cell(row.get(column)) for row in rows] for column in self.columns],
+                schema=self.schema,
+            )
+        )
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+class _ParquetWriter(_ArrowWriter):
+    def _open(self):
+        return self.pyarrow.parquet.ParquetWriter(self._sink, self.schema)
+
+
+WRITERS = {
+    CSV_MEDIA_TYPE: _CsvWriter,
+    ARROW_MEDIA_TYPE: _ArrowWriter,
+    PARQUET_MEDIA_TYPE: _ParquetWriter,
+}
+
+
+async def encode(answers, media_type: str):
+    """
+    Yield the answers encoded as media_type, one chunk per EXPORT_BATCH_SIZE
+    rows
+    """
+    writer, rows = WRITERS[media_type](columns()), []
+    async for answer in answers:
+        rows.append(flatten(answer))
+        if len(rows) >= settings.EXPORT_BATCH_SIZE:
+            yield await asyncio.to_thread(writer.write, rows)
+            rows = []
+
+    if rows:
+        yield await asyncio.to_thread(writer.write, rows)
+    yield await asyncio.to_thread(writer.close)
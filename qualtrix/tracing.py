@@ -0,0 +1,173 @@
+"""
+Lightweight span tracing with W3C trace context propagation.
+
+A server span is opened for every request, continuing the caller's trace when a
+traceparent header is sent. Stages of a request and every outbound Qualtrics
+call open child spans. Work that outlives the request (outbox tasks, export
+jobs) starts its own trace linked to the span that scheduled it.
+
+Finished spans are handed to the exporter selected by TRACE_EXPORTER: "none",
+"console" (one JSON line per span on stdout) or "file" (JSON lines appended to
+TRACE_FILE). Other exporters can be installed with set_exporter.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import re
+import secrets
+import sys
+import time
+
+import fastapi
+
+from qualtrix import settings
+
+log = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: str | None = None,
+        links: tuple = (),
+        attributes: dict | None = None,
+    ) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.links = list(links)
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.start = time.time()
+        self.end = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentId": self.parent_id,
+            "links": self.links,
+            "start": self.start,
+            "durationMs": round((self.end - self.start) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def parse_traceparent(value: str | None) -> tuple[str, str] | None:
+    """
+    (trace_id, parent span id) from a traceparent header, None if invalid
+    """
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if match is None or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    return match.group(1), match.group(2)
+
+
+def current() -> Span | None:
+    return _current.get()
+
+
+def current_traceparent() -> str | None:
+    span = _current.get()
+    return span.traceparent if span is not None else None
+
+
+@contextlib.contextmanager
+def span(name: str, remote: str | None = None, link: str | None = None, **attributes):
+    """
+    Open a child of the current span. remote continues the trace of a
+    traceparent received from a caller; link starts a new trace linked to the
+    traceparent of the work that scheduled this one.
+    """
+    parent = _current.get()
+    links = []
+    if link is not None and parse_traceparent(link) is not None:
+        trace_id, parent_id = secrets.token_hex(16), None
+        links.append(link)
+    elif remote is not None and parse_traceparent(remote) is not None:
+        trace_id, parent_id = parse_traceparent(remote)
+    elif parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+
+    new = Span(name, trace_id, parent_id, links, attributes)
+    token = _current.set(new)
+    try:
+        yield new
+    except BaseException as e:
+        new.status = "error"
+        new.set("error", repr(e))
+        raise
+    finally:
+        _current.reset(token)
+        new.end = time.time()
+        _export(new)
+
+
+async def middleware(request: fastapi.Request, call_next):
+    """
+    Trace each request as a server span continuing the caller's trace
+    """
+    with span(
+        f"{request.method} {request.url.path}",
+        remote=request.headers.get(TRACEPARENT_HEADER),
+        kind="server",
+    ) as server:
+        response = await call_next(request)
+        server.set("status", response.status_code)
+        if response.status_code >= 500:
+            server.status = "error"
+    response.headers[TRACEPARENT_HEADER] = server.traceparent
+    return response
+
+
+def _console(finished: Span) -> None:
+    sys.stdout.write(json.dumps(finished.to_dict(), default=str) + "\n")
+
+
+def _file(finished: Span) -> None:
+    with open(settings.TRACE_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(finished.to_dict(), default=str) + "\n")
+
+
+EXPORTERS = {"none": None, "console": _console, "file": _file}
+
+_exporter = EXPORTERS.get(settings.TRACE_EXPORTER)
+
+
+def set_exporter(exporter) -> None:
+    """
+    Send finished spans to exporter(span), or nowhere if exporter is None
+    """
+    global _exporter
+    _exporter = exporter
+
+
+def _export(finished: Span) -> None:
+    if _exporter is None:
+        return
+    try:
+        _exporter(finished)
+    except Exception as e:  # pylint: disable=broad-except
+        log.warning("Failed to export span %s: %s", finished.name, e)
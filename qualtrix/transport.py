@@ -0,0 +1,242 @@
+"""
+Shared outbound HTTP transport for Qualtrics API calls.
+
+All calls made by the client module go through one pooled AsyncClient so
+connections (and TLS sessions through the outbound proxy) are kept alive and
+reused instead of being re-established on every request.
+
+Every call first takes a token from its endpoint family's rate limit bucket.
+Retryable statuses are retried with exponential backoff and jitter, honoring
+Retry-After, up to RETRY_ATTEMPTS times. Requests that change state (POST) are
+only retried when Qualtrics rejected them unprocessed (429) or they never
+reached it.
+"""
+
+import asyncio
+import contextlib
+import email.utils
+import logging
+import random
+import time
+
+import httpx
+import orjson
+
+from qualtrix import deadline, error, metrics, ratelimit, settings, tracing
+
+log = logging.getLogger(__name__)
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the shared AsyncClient, creating it on first use
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        log.info(
+            "Creating Qualtrics HTTP client (http2=%s, max_connections=%s)",
+            settings.HTTP2,
+            settings.HTTP_MAX_CONNECTIONS,
+        )
+        _client = httpx.AsyncClient(
+            http2=settings.HTTP2,
+            timeout=settings.TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+async def close():
+    """
+    Close the shared AsyncClient and release pooled connections
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _drop_empty_headers(kwargs: dict) -> dict:
+    # requests silently skipped headers set to None (e.g. an unset API token),
+    # httpx rejects them
+    if kwargs.get("headers"):
+        kwargs["headers"] = {
+            k: v for k, v in kwargs["headers"].items() if v is not None
+        }
+    return kwargs
+
+
+def decode(response: httpx.Response):
+    """
+    Parse a JSON response body, like response.json() but faster
+    """
+    return orjson.loads(response.content)
+
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(
+            email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int) -> float:
+    """
+    Exponential backoff with jitter for the given (zero based) retry attempt
+    """
+    delay = min(settings.RETRY_BACKOFF * 2**attempt, settings.RETRY_MAX_WAIT)
+    return delay / 2 + random.uniform(0, delay / 2)  # nosec B311 jitter, not crypto
+
+
+async def request(
+    method: str, url: str, operation: str = "other", retry_on: tuple = (), **kwargs
+) -> httpx.Response:
+    """
+    Send a rate limited request, retrying retryable failures. operation is the
+    logical Qualtrics call used to label metrics. retry_on adds statuses that
+    are worth retrying for this call, e.g. 404 for a response that is still
+    being recorded.
+
+    The whole call, including waiting for a rate limit token and retries, is
+    cancelled when the current request deadline passes.
+    """
+    if deadline.expired():
+        raise error.DeadlineExceeded()
+    try:
+        async with asyncio.timeout_at(deadline.at()):
+            return await _request(method, url, operation, retry_on, **kwargs)
+    except TimeoutError as e:
+        if deadline.expired():
+            log.warning("%s %s cancelled, request deadline exceeded", method, url)
+            raise error.DeadlineExceeded() from e
+        raise
+
+
+async def _send(operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send one attempt, recording its latency and outcome
+    """
+    start_time = time.perf_counter()
+    with (
+        tracing.span(
+            f"qualtrics {operation}", method=method, path=httpx.URL(url).path
+        ) as span,
+        metrics.UPSTREAM_IN_FLIGHT.labels(operation).track_inprogress(),
+    ):
+        try:
+            response = await get_client().request(method, url, **kwargs)
+        except httpx.HTTPError:
+            metrics.UPSTREAM_RESPONSES.labels(operation, "error").inc()
+            raise
+        finally:
+            metrics.UPSTREAM_LATENCY.labels(operation).observe(
+                time.perf_counter() - start_time
+            )
+        span.set("status", response.status_code)
+        if response.status_code >= 400:
+            span.status = "error"
+    metrics.UPSTREAM_RESPONSES.labels(operation, response.status_code).inc()
+    return response
+
+
+async def _request(method: str, url: str, operation: str, retry_on: tuple, **kwargs):
+    kwargs = _drop_empty_headers(kwargs)
+    bucket = ratelimit.bucket(ratelimit.endpoint_family(httpx.URL(url).path))
+    interactive = ratelimit.is_interactive()
+    idempotent = method != "POST"
+
+    for attempt in range(settings.RETRY_ATTEMPTS):
+        last_attempt = attempt == settings.RETRY_ATTEMPTS - 1
+        await bucket.acquire(interactive)
+
+        try:
+            response = await _send(operation, method, url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+            # The request never reached Qualtrics, safe to retry
+            if last_attempt:
+                raise
+            delay = backoff(attempt)
+            log.warning(
+                "%s %s failed to connect, retrying in %.1fs", method, url, delay
+            )
+            metrics.UPSTREAM_RETRIES.labels(operation).inc()
+            await asyncio.sleep(delay)
+            continue
+
+        status = response.status_code
+        retryable = status == 429 or status in retry_on
+        retryable = retryable or (idempotent and status in RETRYABLE_STATUSES)
+        if not retryable or last_attempt:
+            return response
+
+        retry_after = _retry_after(response)
+        if status == 429 and retry_after is not None:
+            bucket.pause(retry_after)
+        delay = retry_after if retry_after is not None else backoff(attempt)
+        left = deadline.remaining()
+        if left is not None and delay >= left:
+            # Not worth waiting for a retry the caller will never see
+            return response
+        log.warning("%s %s returned %s, retrying in %.1fs", method, url, status, delay)
+        metrics.UPSTREAM_RETRIES.labels(operation).inc()
+        await asyncio.sleep(delay)
+
+    return response
+
+
+def stream(method: str, url: str, operation: str = "other", **kwargs):
+    """
+    Send a request whose response body is read incrementally. Use as an async
+    context manager.
+    """
+    return _rate_limited_stream(method, url, operation, **_drop_empty_headers(kwargs))
+
+
+@contextlib.asynccontextmanager
+async def _rate_limited_stream(method: str, url: str, operation: str, **kwargs):
+    bucket = ratelimit.bucket(ratelimit.endpoint_family(httpx.URL(url).path))
+    await bucket.acquire(ratelimit.is_interactive())
+    with (
+        tracing.span(
+            f"qualtrics {operation}", method=method, path=httpx.URL(url).path
+        ) as span,
+        metrics.UPSTREAM_IN_FLIGHT.labels(operation).track_inprogress(),
+    ):
+        start_time = time.perf_counter()
+        async with get_client().stream(method, url, **kwargs) as response:
+            metrics.UPSTREAM_RESPONSES.labels(operation, response.status_code).inc()
+            span.set("status", response.status_code)
+            yield response
+        metrics.UPSTREAM_LATENCY.labels(operation).observe(
+            time.perf_counter() - start_time
+        )
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+async def post(url: str, **kwargs) -> httpx.Response:
+    return await request("POST", url, **kwargs)
+
+
+async def put(url: str, **kwargs) -> httpx.Response:
+    return await request("PUT", url, **kwargs)
@@ -0,0 +1,52 @@
+"""
+Process pool for CPU-heavy export post-processing.
+
+EXPORT_WORKERS processes are started on first use, so work submitted with run()
+neither blocks the event loop nor competes with it for the GIL. With
+EXPORT_WORKERS set to 0 work runs in a thread instead. Functions and their
+arguments must be picklable.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+
+from qualtrix import settings
+
+log = logging.getLogger(__name__)
+
+_pool = None
+
+
+def _get_pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _pool  # pylint: disable=global-statement
+    if _pool is None:
+        # Forking would copy the event loop and the threads of this process
+        _pool = concurrent.futures.ProcessPoolExecutor(
+            settings.EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+        log.info("Started %s export worker processes", settings.EXPORT_WORKERS)
+    return _pool
+
+
+async def run(fn, *args):
+    """
+    Return fn(*args), computed in a worker process
+    """
+    if settings.EXPORT_WORKERS <= 0:
+        return await asyncio.to_thread(fn, *args)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    except concurrent.futures.process.BrokenProcessPool:
+        # A worker died, start a new pool for later work
+        log.error("Export worker pool broke, running %s in a thread", fn.__name__)
+        shutdown()
+        return await asyncio.to_thread(fn, *args)
+
+
+def shutdown() -> None:
+    global _pool  # pylint: disable=global-statement
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
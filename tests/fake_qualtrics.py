@@ -0,0 +1,476 @@
+"""
+In-memory stand-in for the Qualtrics v3 API endpoints used by qualtrix.client.
+
+Mount it in-process with httpx.ASGITransport, or serve it and point
+QUALTRIX_BASE_URL at http://<host>:<port>/API/v3:
+
+    python -m tests.fake_qualtrics --port 8001 --latency 0.05 --throttle-rate 0.01
+
+Every request waits for the configured latency (with jitter) and may then be
+answered with a 429 (throttle_rate) or a 503 (error_rate) instead. Distribution
+links only appear link_delay seconds after a distribution is created, and
+contact imports and exports complete import_duration and export_duration
+seconds after they are started, like the real API.
+
+Event subscriptions created with POST /eventsubscriptions receive synthetic
+events from publish(), posted form encoded like Qualtrics does. Served on its
+own, --publish-to subscribes a url and --event-rate posts completedResponse
+events to it every second:
+
+    python -m tests.fake_qualtrics --publish-to "http://localhost:8000/events?token=secret" \\
+        --event-rate 5
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import random
+import time
+import urllib.parse
+import zipfile
+
+import fastapi
+import httpx
+from fastapi.responses import JSONResponse, Response
+
+BASE_PATH = "/API/v3"
+OK = {"httpStatus": "200 - OK"}
+
+
+class FakeQualtrics:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.5,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        link_delay: float = 0.0,
+        export_duration: float = 0.5,
+        import_duration: float = 0.2,
+        export_size: int = 1000,
+        responses_per_distribution: int = 3,
+        seed: int | None = None,
+        event_client: httpx.AsyncClient | None = None,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.link_delay = link_delay
+        self.export_duration = export_duration
+        self.import_duration = import_duration
+        self.export_size = export_size
+        self.responses_per_distribution = responses_per_distribution
+        self.random = random.Random(seed)
+
+        self.ids = itertools.count(1)
+        self.contacts = {}
+        self.memberships = {}
+        self.distributions = {}
+        self.exports = {}
+        self.imports = {}
+        self.subscriptions = {}
+        # Response ids answered as not finished yet
+        self.unfinished = set()
+        self.event_client = event_client
+        self.requests = 0
+        self.injected = {429: 0, 503: 0}
+
+        self.app = fastapi.FastAPI()
+        self.app.middleware("http")(self._faults)
+        self.app.include_router(self._router(), prefix=BASE_PATH)
+
+    def _id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self.ids):08d}"
+
+    async def _faults(self, request: fastapi.Request, call_next):
+        self.requests += 1
+        if self.latency:
+            spread = self.latency * self.jitter
+            await asyncio.sleep(
+                max(self.latency + self.random.uniform(-spread, spread), 0)
+            )
+
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            self.injected[429] += 1
+            return JSONResponse(
+                {"meta": {"httpStatus": "429 - Too Many Requests"}},
+                status_code=429,
+                headers={"Retry-After": "0"},
+            )
+        if roll < self.throttle_rate + self.error_rate:
+            self.injected[503] += 1
+            return JSONResponse(
+                {"meta": {"httpStatus": "503 - Service Unavailable"}},
+                status_code=503,
+            )
+        return await call_next(request)
+
+    def response(self, response_id: str, survey_type: str | None = None) -> dict:
+        values = {
+            "finished": 0 if response_id in self.unfinished else 1,
+            "RulesConsentID": f"RC_{response_id}",
+            "QID15_TEXT": "34",
+            "QID37_1": "First",
+            "QID37_2": "Last",
+            "QID37_3": f"{response_id.lower()}@example.com",
+            "userLanguage": "EN",
+        }
+        labels = {"QID12": "Not Hispanic or Latino", "QID14": "Female"}
+        if survey_type is not None:
+            values.update({"survey_type": survey_type, "QID7": 1, "QID8": 2})
+            labels.update({"QID7": "Apple", "QID8": "iPhone 12"})
+        return {"responseId": response_id, "values": values, "labels": labels}
+
+    async def publish(
+        self,
+        survey_id: str,
+        response_id: str | None = None,
+        event: str = "completedResponse",
+    ) -> list[int]:
+        """
+        Post an event for a response to every matching subscription, returning
+        the status code of each callback
+        """
+        topic = f"surveyengine.{event}.{survey_id}"
+        fields = {
+            "Topic": topic,
+            "Status": "Complete",
+            "SurveyID": survey_id,
+            "ResponseID": response_id or self._id("R"),
+            "CompletedDate": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            "BrandID": "fake",
+        }
+        if self.event_client is None:
+            self.event_client = httpx.AsyncClient()
+        statuses = []
+        for subscription in self.subscriptions.values():
+            topics = subscription["topics"].split(",")
+            if topic in topics or f"surveyengine.{event}.*" in topics:
+                r = await self.event_client.post(
+                    subscription["publicationUrl"],
+                    content=urllib.parse.urlencode(fields),
+                    headers={"Content-Type": "application/x-www-form-urlencoded"},
+                )
+                statuses.append(r.status_code)
+        return statuses
+
+    def _export_file(self) -> bytes:
+        fileobj = io.BytesIO()
+        with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(
+                "Survey.json",
+                json.dumps(
+                    {
+                        "responses": [
+                            self.response(f"R_{i:08d}") for i in range(self.export_size)
+                        ]
+                    }
+                ),
+            )
+        return fileobj.getvalue()
+
+    def _router(self) -> fastapi.APIRouter:
+        router = fastapi.APIRouter()
+
+        @router.post("/directories/{directory_id}/mailinglists/{list_id}/contacts")
+        async def create_contact(directory_id: str, list_id: str, body: dict):
+            contact = {
+                "id": self._id("CID"),
+                "contactLookupId": self._id("CGC"),
+                "email": body.get("email"),
+                "firstName": body.get("firstName"),
+                "lastName": body.get("lastName"),
+            }
+            self.contacts[contact["id"]] = contact
+            self.memberships[contact["id"]] = list_id
+            return {"meta": OK, "result": contact}
+
+        @router.get("/directories/{directory_id}/mailinglists/{list_id}/contacts")
+        async def list_contacts(
+            directory_id: str, list_id: str, request: fastapi.Request, skip: int = 0
+        ):
+            contacts = list(self.contacts.values())
+            page = contacts[skip : skip + 100]
+            next_page = None
+            if skip + 100 < len(contacts):
+                next_page = str(request.url.include_query_params(skip=skip + 100))
+            return {
+                "meta": OK,
+                "result": {"elements": page, "nextPage": next_page},
+            }
+
+        @router.put(
+            "/directories/{directory_id}/mailinglists/{list_id}/contacts/{contact_id}"
+        )
+        async def update_contact(
+            directory_id: str, list_id: str, contact_id: str, body: dict
+        ):
+            if contact_id not in self.contacts:
+                return _not_found("Contact not found")
+            self.contacts[contact_id].update(body)
+            return {"meta": OK}
+
+        @router.post(
+            "/directories/{directory_id}/mailinglists/{list_id}/contactimports"
+        )
+        async def start_import(directory_id: str, list_id: str, body: dict):
+            imported = []
+            for row in body["contacts"]:
+                contact = {
+                    "id": self._id("CID"),
+                    "contactLookupId": self._id("CGC"),
+                    "email": row.get("email"),
+                    "firstName": row.get("firstName"),
+                    "lastName": row.get("lastName"),
+                    "embeddedData": row.get("embeddedData", {}),
+                }
+                self.contacts[contact["id"]] = contact
+                self.memberships[contact["id"]] = list_id
+                imported.append(contact)
+            import_id = self._id("CGI")
+            self.imports[import_id] = (time.monotonic(), imported)
+            return {"meta": OK, "result": {"id": import_id}}
+
+        @router.get(
+            "/directories/{directory_id}/mailinglists/{list_id}/contactimports/{import_id}"
+        )
+        async def import_progress(directory_id: str, list_id: str, import_id: str):
+            if import_id not in self.imports:
+                return _not_found("Import not found")
+            started, _ = self.imports[import_id]
+            done = time.monotonic() - started >= self.import_duration
+            return {
+                "meta": OK,
+                "result": {
+                    "status": "complete" if done else "inProgress",
+                    "percentComplete": 100.0 if done else 0.0,
+                },
+            }
+
+        @router.get(
+            "/directories/{directory_id}/mailinglists/{list_id}"
+            "/contactimports/{import_id}/summary"
+        )
+        async def import_summary(directory_id: str, list_id: str, import_id: str):
+            if import_id not in self.imports:
+                return _not_found("Import not found")
+            _, imported = self.imports[import_id]
+            return {"meta": OK, "result": {"contacts": imported, "nextPage": None}}
+
+        @router.post("/directories/{directory_id}/contacts/search")
+        async def search_contacts(directory_id: str, body: dict):
+            email = body["filter"]["value"]
+            return {
+                "meta": OK,
+                "result": {
+                    "elements": [
+                        c for c in self.contacts.values() if c["email"] == email
+                    ]
+                },
+            }
+
+        @router.get("/directories/{directory_id}/contacts/{contact_id}")
+        async def get_contact(directory_id: str, contact_id: str):
+            contact = self.contacts.get(contact_id)
+            if contact is None:
+                return {"meta": OK, "result": {"id": contact_id}}
+            list_id = self.memberships[contact_id]
+            return {
+                "meta": OK,
+                "result": {
+                    "contactId": contact_id,
+                    "email": contact["email"],
+                    "mailingListMembership": {
+                        list_id: {"contactLookupId": contact["contactLookupId"]}
+                    },
+                },
+            }
+
+        @router.get("/directories/{directory_id}/contacts/{contact_id}/history")
+        async def contact_history(directory_id: str, contact_id: str):
+            distributions = [
+                d for d in self.distributions.values() if d["contactId"] == contact_id
+            ] or [{"id": f"EMD_{contact_id}", "contactId": contact_id}]
+            return {
+                "meta": OK,
+                "result": {
+                    "elements": [
+                        {"distributionId": d["id"], "type": "Invite"}
+                        for d in distributions
+                    ]
+                },
+            }
+
+        @router.post("/distributions")
+        async def create_distribution(body: dict):
+            contact_id = body["recipients"]["contactId"]
+            distribution = {
+                "id": self._id("EMD"),
+                "contactId": contact_id,
+                "surveyId": body["surveyLink"]["surveyId"],
+                "created": time.monotonic(),
+            }
+            self.distributions[distribution["id"]] = distribution
+            return {"meta": OK, "result": {"id": distribution["id"]}}
+
+        @router.post("/distributions/{distribution_id}/reminders")
+        async def create_reminder(distribution_id: str, body: dict):
+            return {"meta": OK, "result": {"distributionId": self._id("EMD")}}
+
+        @router.get("/distributions/{distribution_id}/links")
+        async def distribution_links(distribution_id: str, surveyId: str):
+            distribution = self.distributions.get(distribution_id)
+            if distribution is None:
+                return _not_found("Distribution not found")
+            elements = []
+            if time.monotonic() - distribution["created"] >= self.link_delay:
+                elements.append(
+                    {
+                        "contactId": distribution["contactId"],
+                        "link": f"https://survey.example.com/{surveyId}/{distribution_id}",
+                    }
+                )
+            return {"meta": OK, "result": {"elements": elements}}
+
+        @router.get("/distributions/{distribution_id}/history")
+        async def distribution_history(distribution_id: str):
+            distribution = self.distributions.get(distribution_id, {})
+            contact_id = distribution.get("contactId", f"CID_{distribution_id}")
+            return {
+                "meta": OK,
+                "result": {
+                    "elements": [
+                        {
+                            "contactId": contact_id,
+                            "surveySessionId": f"FS_{distribution_id}{i}",
+                        }
+                        for i in range(self.responses_per_distribution)
+                    ]
+                },
+            }
+
+        @router.get("/surveys/{survey_id}/responses/{response_id}")
+        async def get_response(survey_id: str, response_id: str):
+            if not response_id.startswith("R_"):
+                return _not_found("Response not found")
+            return {"meta": OK, "result": self.response(response_id)}
+
+        @router.get("/surveys/{survey_id}/response-schema")
+        async def response_schema(survey_id: str):
+            return {"meta": OK, "result": {"title": survey_id, "properties": {}}}
+
+        @router.post("/surveys/{survey_id}/export-responses")
+        async def start_export(survey_id: str, body: dict):
+            progress_id = self._id("ES")
+            self.exports[progress_id] = time.monotonic()
+            return {"meta": OK, "result": {"progressId": progress_id}}
+
+        @router.get("/surveys/{survey_id}/export-responses/{progress_id}")
+        async def export_progress(survey_id: str, progress_id: str):
+            started = self.exports.get(progress_id)
+            if started is None:
+                return _not_found("Export not found")
+            elapsed = time.monotonic() - started
+            if elapsed < self.export_duration:
+                percent = round(100 * elapsed / self.export_duration, 1)
+                return {
+                    "meta": OK,
+                    "result": {"status": "inProgress", "percentComplete": percent},
+                }
+            return {
+                "meta": OK,
+                "result": {
+                    "status": "complete",
+                    "percentComplete": 100.0,
+                    "fileId": f"FILE_{progress_id}",
+                    "continuationToken": f"TOKEN_{progress_id}",
+                },
+            }
+
+        @router.get("/surveys/{survey_id}/export-responses/{file_id}/file")
+        async def export_file(survey_id: str, file_id: str):
+            content = await asyncio.to_thread(self._export_file)
+            return Response(content, media_type="application/zip")
+
+        @router.post("/eventsubscriptions")
+        async def create_subscription(body: dict):
+            subscription_id = self._id("SUB")
+            self.subscriptions[subscription_id] = {
+                "topics": body["topics"],
+                "publicationUrl": body["publicationUrl"],
+            }
+            return {"meta": OK, "result": {"id": subscription_id}}
+
+        @router.delete("/eventsubscriptions/{subscription_id}")
+        async def delete_subscription(subscription_id: str):
+            if self.subscriptions.pop(subscription_id, None) is None:
+                return _not_found("Subscription not found")
+            return {"meta": OK}
+
+        @router.post("/surveys/{survey_id}/sessions/{session_id}")
+        async def close_session(survey_id: str, session_id: str):
+            return {"meta": OK, "result": {"sessionId": session_id, "done": True}}
+
+        return router
+
+
+def _not_found(message: str) -> JSONResponse:
+    return JSONResponse(
+        {"meta": {"httpStatus": "404 - Not Found", "error": message}},
+        status_code=404,
+    )
+
+
+def main() -> None:
+    import uvicorn  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--link-delay", type=float, default=0.0)
+    parser.add_argument("--export-duration", type=float, default=0.5)
+    parser.add_argument("--export-size", type=int, default=1000)
+    parser.add_argument("--publish-to", help="callback url to post events to")
+    parser.add_argument("--event-survey", default="SV_1")
+    parser.add_argument("--event-rate", type=float, default=1.0)
+    args = parser.parse_args()
+
+    fake = FakeQualtrics(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        link_delay=args.link_delay,
+        export_duration=args.export_duration,
+        export_size=args.export_size,
+    )
+
+    if args.publish_to:
+        fake.subscriptions["SUB_cli"] = {
+            "topics": f"surveyengine.completedResponse.{args.event_survey}",
+            "publicationUrl": args.publish_to,
+        }
+
+        async def publish_events():
+            while True:
+                await asyncio.sleep(1 / args.event_rate)
+                try:
+                    await fake.publish(args.event_survey)
+                except httpx.HTTPError as e:
+                    print(f"Event not delivered: {e!r}")
+
+        @fake.app.on_event("startup")
+        async def start_publishing():
+            fake.publisher = asyncio.create_task(publish_events())
+
+    uvicorn.run(fake.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
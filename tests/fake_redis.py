@@ -0,0 +1,149 @@
+"""
+In-memory stand-in for the subset of the Redis protocol used by
+qualtrix.shared_cache (PING, AUTH, SELECT, GET, MGET, SET with NX/PX/EX, DEL, and EVAL of the
+lock release script).
+
+Start it on the running event loop with `await FakeRedis().start()`, or serve
+it and point CACHE_REDIS_URL at redis://<host>:<port>/0:
+
+    python -m tests.fake_redis --port 6380
+"""
+
+import argparse
+import asyncio
+import time
+
+from qualtrix import shared_cache
+
+
+class FakeRedis:
+    def __init__(self, password: str | None = None) -> None:
+        self.password = password
+        self.entries = {}
+        self.commands = 0
+        self.server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Start serving, returning the redis:// url of the server
+        """
+        self.server = await asyncio.start_server(self._serve, host, port)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _get(self, key: bytes) -> bytes | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        return value
+
+    async def _serve(self, reader, writer) -> None:
+        authenticated = self.password is None
+        try:
+            while True:
+                command = await _read_command(reader)
+                if command is None:
+                    break
+                self.commands += 1
+                name = command[0].upper()
+                if name == b"AUTH":
+                    authenticated = command[-1].decode() == self.password
+                    reply = b"+OK\r\n" if authenticated else b"-WRONGPASS\r\n"
+                elif not authenticated:
+                    reply = b"-NOAUTH Authentication required.\r\n"
+                else:
+                    reply = self._execute(name, command[1:])
+                writer.write(reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _execute(self, name: bytes, args: list[bytes]) -> bytes:
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"SELECT":
+            return b"+OK\r\n"
+        if name == b"GET":
+            return _bulk(self._get(args[0]))
+        if name == b"MGET":
+            return b"*%d\r\n" % len(args) + b"".join(
+                _bulk(self._get(key)) for key in args
+            )
+        if name == b"DEL":
+            deleted = sum(self.entries.pop(key, None) is not None for key in args)
+            return b":%d\r\n" % deleted
+        if name == b"SET":
+            return self._set(args)
+        if name == b"EVAL":
+            return self._eval(args)
+        return b"-ERR unknown command '%s'\r\n" % name
+
+    def _set(self, args: list[bytes]) -> bytes:
+        key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+        expires_at = None
+        for unit, scale in ((b"PX", 1000), (b"EX", 1)):
+            if unit in options:
+                expires_at = (
+                    time.monotonic() + int(args[options.index(unit) + 3]) / scale
+                )
+        if b"NX" in options and self._get(key) is not None:
+            return b"$-1\r\n"
+        self.entries[key] = (value, expires_at)
+        return b"+OK\r\n"
+
+    def _eval(self, args: list[bytes]) -> bytes:
+        # No Lua here, only the scripts qualtrix sends are understood
+        if args[0].decode() != shared_cache.RELEASE_SCRIPT:
+            return b"-NOSCRIPT Unknown script\r\n"
+        key, value = args[2], args[3]
+        if self._get(key) != value:
+            return b":0\r\n"
+        del self.entries[key]
+        return b":1\r\n"
+
+
+def _bulk(value: bytes | None) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def _read_command(reader) -> list[bytes] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    count = int(line[1:-2])
+    args = []
+    for _ in range(count):
+        length = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    async def serve():
+        fake = FakeRedis(args.password)
+        print(await fake.start(args.host, args.port))
+        await fake.server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,72 @@
+import asyncio
+import datetime
+import logging
 import sys
 import json
-from unittest.mock import MagicMock
+import time
+from unittest.mock import AsyncMock, Mock
 
+import pytest
 from fastapi import testclient
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 
 # pylint: disable=wrong-import-position
-sys.modules["qualtrix.client"] = MagicMock()
-from qualtrix import main
+sys.modules["qualtrix.client"] = AsyncMock()
+from qualtrix import main, shared_cache, storage
 
 client = testclient.TestClient(main.app)
 
 
+@pytest.fixture(autouse=True)
+def local_databases(tmp_path, monkeypatch):
+    for module in (main.api.outbox, main.api.contacts):
+        monkeypatch.setattr(
+            module,
+            "db",
+            storage.Database(str(tmp_path / f"{module.__name__}.db"), module.SCHEMA),
+        )
+    monkeypatch.setattr(
+        main.api.contacts,
+        "contact_cache",
+        shared_cache.Cache("contacts", 100, shared_cache.MemoryBackend(100)),
+    )
+    monkeypatch.setattr(main.settings, "CONTACT_INDEX_WARM", False)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """a new client mock, and no export jobs or replayable redirects, per test"""
+    client_mock = AsyncMock()
+    # Plain functions of the client
+    client_mock.modify_prefix = Mock(side_effect=lambda old, new, s: s)
+    client_mock.participant_embedded_data = Mock(return_value={})
+    for module in (main.api, main.api.jobs, main.api.contacts):
+        monkeypatch.setattr(module, "client", client_mock)
+    monkeypatch.setattr(main.api.jobs, "_jobs", {})
+    monkeypatch.setattr(
+        main.api.jobs,
+        "job_cache",
+        shared_cache.Cache("export_jobs", 100, shared_cache.MemoryBackend(100)),
+    )
+    monkeypatch.setattr(
+        main.api.idempotency,
+        "_results",
+        shared_cache.Cache("idempotency", 100, shared_cache.MemoryBackend(100)),
+    )
+
+
+def _async_iter(items: list):
+    async def iterate(*_):
+        for item in items:
+            yield item
+
+    return iterate
+
+
 def test_session_delete() -> None:
     """test upload endpoint"""
+    main.api.client.delete_session.return_value = {}
 
     response = client.post(
         "/delete-session",
@@ -20,3 +74,517 @@ def test_session_delete() -> None:
     )
 
     assert response.status_code == 200
+
+
+def test_bulk_responses_job(monkeypatch) -> None:
+    """test export job submission, status and result"""
+    main.api.client.start_export.return_value = "ES_1234"
+    main.api.client.wait_for_export.return_value = "FILE_1234"
+    monkeypatch.setattr(
+        main.api.client, "iter_export_file", _async_iter([{"rules_consent_id": "R_1"}])
+    )
+
+    with testclient.TestClient(main.app) as job_client:
+        response = job_client.post("/bulk-responses", json={"surveyId": "1234"})
+        assert response.status_code == 202
+        job_id = response.json()["jobId"]
+
+        for _ in range(50):
+            response = job_client.get(f"/bulk-responses/{job_id}")
+            assert response.status_code == 200
+            if response.json()["status"] != "inProgress":
+                break
+            time.sleep(0.01)
+        assert response.json()["status"] == "complete"
+
+        response = job_client.get(f"/bulk-responses/{job_id}/result")
+        assert response.json() == [{"rules_consent_id": "R_1"}]
+
+
+def test_bulk_responses_unknown_job() -> None:
+    response = client.get("/bulk-responses/missing")
+
+    assert response.status_code == 404
+
+
+def test_bulk_responses_ndjson(monkeypatch) -> None:
+    """test export results stream as ndjson"""
+
+    job = main.api.jobs.ExportJob("1234")
+    job.status = main.api.jobs.COMPLETE
+    monkeypatch.setitem(main.api.jobs._jobs, job.id, job)
+    monkeypatch.setattr(
+        main.api.client,
+        "iter_export_file",
+        _async_iter([{"rules_consent_id": f"R_{i}"} for i in range(3)]),
+    )
+
+    response = client.get(
+        f"/bulk-responses/{job.id}/result",
+        headers={"Accept": "application/x-ndjson"},
+    )
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"rules_consent_id": f"R_{i}"} for i in range(3)
+    ]
+
+
+def test_bulk_responses_report(monkeypatch) -> None:
+    """test the status report counts the export file once it has been read"""
+
+    async def iter_export_file(_survey_id, _file_id, report):
+        report.update(responses=3, malformed=1)
+        for i in range(2):
+            yield {"rules_consent_id": f"R_{i}"}
+
+    job = main.api.jobs.ExportJob("1234")
+    job.status = main.api.jobs.COMPLETE
+    monkeypatch.setitem(main.api.jobs._jobs, job.id, job)
+    monkeypatch.setattr(main.api.client, "iter_export_file", iter_export_file)
+
+    assert client.get(f"/bulk-responses/{job.id}").json()["report"] is None
+    for _ in range(2):
+        assert len(client.get(f"/bulk-responses/{job.id}/result").json()) == 2
+
+    report = {"responses": 3, "malformed": 1, "skipped": 0}
+    assert client.get(f"/bulk-responses/{job.id}").json()["report"] == report
+    # Other instances see the published counts, and older states without any
+    state = asyncio.run(main.api.jobs.job_cache.get(job.id))
+    assert main.api.jobs.ExportJob.from_state(state).report == report
+    del state["report"]
+    assert main.api.jobs.ExportJob.from_state(state).report is None
+
+
+def test_bulk_responses_incremental_elsewhere() -> None:
+    """test incremental jobs run by another instance report their status only"""
+    job = main.api.jobs.ExportJob("1234", incremental=True)
+    job.status = main.api.jobs.COMPLETE
+    asyncio.run(main.api.jobs._publish(job))
+
+    response = client.get(f"/bulk-responses/{job.id}")
+    assert response.json()["status"] == "complete"
+    assert response.json()["incremental"]
+
+    response = client.get(f"/bulk-responses/{job.id}/result")
+    assert response.status_code == 404
+    assert "instance that ran the job" in response.json()["detail"]
+
+
+def test_response_ids_partial() -> None:
+    """test partial responseId lookups are flagged"""
+    main.api.client.get_responseIds_by_contact.return_value = {
+        "responseIds": ["R_1"],
+        "partial": True,
+        "failedDistributions": ["EMD_2"],
+    }
+
+    response = client.get("/contact/CID_1/responseIds")
+
+    assert response.json() == ["R_1"]
+    assert response.headers["X-Partial-Results"] == "true"
+
+
+def test_responses_batch(monkeypatch) -> None:
+    """test batched responses report a status per item in request order"""
+
+    async def get_response(survey_id, response_id, _raw):
+        if response_id == "R_missing":
+            raise main.api.error.QualtricsError("Response not found")
+        await asyncio.sleep(0.01 if response_id == "R_1" else 0)
+        return {"status": "Complete", "response": {"id": response_id}}
+
+    monkeypatch.setattr(main.api.client, "get_response", get_response)
+    batch = {
+        "responses": [
+            {"surveyId": "SV_1", "responseId": response_id}
+            for response_id in ("R_1", "R_missing", "R_2")
+        ]
+    }
+
+    response = client.post("/responses", json=batch)
+
+    assert [(item["responseId"], item["status"]) for item in response.json()] == [
+        ("R_1", 200),
+        ("R_missing", 400),
+        ("R_2", 200),
+    ]
+    assert response.json()[2]["response"]["response"] == {"id": "R_2"}
+
+    streamed = client.post(
+        "/responses", json=batch, headers={"Accept": "application/x-ndjson"}
+    )
+
+    items = [json.loads(line) for line in streamed.text.splitlines()]
+    assert items[-1]["responseId"] == "R_1"
+    assert len(items) == 3
+
+
+def test_responses_batch_unexpected_error(monkeypatch) -> None:
+    """test an unexpected failure only fails its own item"""
+
+    async def get_response(survey_id, response_id, _raw):
+        if response_id == "R_broken":
+            raise KeyError("result")
+        return {"status": "Complete", "response": {"id": response_id}}
+
+    monkeypatch.setattr(main.api.client, "get_response", get_response)
+    batch = {
+        "responses": [
+            {"surveyId": "SV_1", "responseId": response_id}
+            for response_id in ("R_1", "R_broken")
+        ]
+    }
+
+    response = client.post("/responses", json=batch)
+    streamed = client.post(
+        "/responses", json=batch, headers={"Accept": "application/x-ndjson"}
+    )
+
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()] == [200, 502]
+    assert sorted(
+        json.loads(line)["status"] for line in streamed.text.splitlines()
+    ) == [
+        200,
+        502,
+    ]
+
+
+REDIRECT_REQUEST = {
+    "surveyId": "SV_1",
+    "targetSurveyId": "SV_2",
+    "RulesConsentID": "FS_1",
+    "SurveyswapID": "1",
+    "SurveyswapGroup": "A",
+    "utm_campaign": "campaign",
+    "utm_medium": "medium",
+    "utm_source": "source",
+    "email": "participant@example.com",
+    "firstName": "First",
+    "lastName": "Last",
+}
+
+
+def test_redirect(monkeypatch) -> None:
+    """test redirect returns the link and queues one task per reminder"""
+    monkeypatch.setattr(main.api.settings, "REMINDER_OFFSETS_DAYS", [1, 3, 7])
+    main.api.client.create_directory_entry.return_value = {
+        "id": "CID_1",
+        "contactLookupId": "CGC_1",
+    }
+    main.api.client.create_email_distribution.return_value = {"id": "EMD_1"}
+    main.api.client.get_link.return_value = {"link": "https://survey/link"}
+
+    response = client.post("/redirect", json=REDIRECT_REQUEST)
+
+    assert response.status_code == 200
+    assert response.json() == {"link": "https://survey/link"}
+
+    kinds = asyncio.run(
+        main.api.outbox.db.fetchall("SELECT kind FROM outbox ORDER BY id")
+    )
+    assert [kind for (kind,) in kinds] == [
+        "create_reminder_distribution",
+        "create_reminder_distribution",
+        "create_reminder_distribution",
+        "add_user_to_contact_list",
+    ]
+
+
+def test_redirect_idempotent_replay() -> None:
+    """test retried redirects replay the first link"""
+    main.api.client.create_directory_entry.return_value = {
+        "id": "CID_1",
+        "contactLookupId": "CGC_1",
+    }
+    main.api.client.create_email_distribution.return_value = {"id": "EMD_1"}
+    main.api.client.get_link.return_value = {"link": "https://survey/link"}
+    calls = main.api.client.create_directory_entry.await_count
+
+    headers = {"Idempotency-Key": "retry-1234"}
+    first = client.post("/redirect", json=REDIRECT_REQUEST, headers=headers)
+    second = client.post("/redirect", json=REDIRECT_REQUEST, headers=headers)
+
+    assert first.json() == second.json() == {"link": "https://survey/link"}
+    assert "Idempotent-Replayed" not in first.headers
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert main.api.client.create_directory_entry.await_count == calls + 1
+
+
+def test_redirect_idempotency_key_reused() -> None:
+    """test a key reused for another participant does not replay their link"""
+    main.api.client.create_directory_entry.return_value = {
+        "id": "CID_1",
+        "contactLookupId": "CGC_1",
+    }
+    main.api.client.create_email_distribution.return_value = {"id": "EMD_1"}
+    main.api.client.get_link.return_value = {"link": "https://survey/first"}
+
+    headers = {"Idempotency-Key": "reused-1234"}
+    first = client.post("/redirect", json=REDIRECT_REQUEST, headers=headers)
+    second = client.post(
+        "/redirect",
+        json={**REDIRECT_REQUEST, "email": "someone.else@example.com"},
+        headers=headers,
+    )
+
+    assert first.status_code == 200
+    assert second.status_code == 422
+    assert "first" not in second.text
+
+
+def test_redirect_returning_participant() -> None:
+    """test indexed participants skip contact creation"""
+    asyncio.run(main.api.contacts.remember("Returning@example.com", "CID_2", "CGC_2"))
+    main.api.client.create_email_distribution.return_value = {"id": "EMD_2"}
+    main.api.client.get_link.return_value = {"link": "https://survey/link"}
+    calls = main.api.client.create_directory_entry.await_count
+
+    response = client.post(
+        "/redirect", json={**REDIRECT_REQUEST, "email": "returning@example.com"}
+    )
+
+    assert response.status_code == 200
+    assert main.api.client.create_directory_entry.await_count == calls
+    assert main.api.client.create_email_distribution.await_args.args[0] == "CGC_2"
+
+
+def test_contact_lookup_indexed(monkeypatch) -> None:
+    """test contacts fetched by id are added to the contact index"""
+    monkeypatch.setattr(main.settings, "MAILING_LIST_ID", "CG_1")
+    main.api.client.get_contact_by_id.return_value = {
+        "meta": {"httpStatus": "200 - OK"},
+        "result": {
+            "contactId": "CID_5",
+            "email": "Found@example.com",
+            "mailingListMembership": {"CG_1": {"contactLookupId": "CGC_5"}},
+        },
+    }
+
+    response = client.get("/contact/CID_5")
+
+    assert response.json()["result"]["contactId"] == "CID_5"
+    assert asyncio.run(main.api.contacts.lookup("found@example.com")) == {
+        "id": "CID_5",
+        "contactLookupId": "CGC_5",
+    }
+
+
+def test_contact_index_warm_skipped_when_fresh(monkeypatch) -> None:
+    """test startup warm-ups only page the mailing list once per interval"""
+    monkeypatch.setattr(main.settings, "MAILING_LIST_ID", "CG_1")
+    pages = []
+
+    async def iter_mailing_list_contacts(*_):
+        pages.append(1)
+        yield [{"email": "a@example.com", "id": "CID_1", "contactLookupId": "CGC_1"}]
+
+    monkeypatch.setattr(
+        main.api.contacts.client,
+        "iter_mailing_list_contacts",
+        iter_mailing_list_contacts,
+    )
+
+    for _ in range(2):
+        asyncio.run(main.api.contacts.warm())
+    assert len(pages) == 1
+    assert asyncio.run(main.api.contacts.lookup("a@example.com"))["id"] == "CID_1"
+
+    monkeypatch.setattr(main.settings, "CONTACT_INDEX_WARM_INTERVAL", 0)
+    asyncio.run(main.api.contacts.warm())
+    assert len(pages) == 2
+
+
+def test_redirect_batch(monkeypatch) -> None:
+    """test batch intake imports and invites each participant once and reports each"""
+    asyncio.run(main.api.contacts.remember("known@example.com", "CID_0", "CGC_0"))
+    emails = [
+        "known@example.com",
+        "new@example.com",
+        "New@example.com",
+        "bad@example.com",
+        "broken@example.com",
+    ]
+    main.api.client.import_contacts.return_value = [
+        {"email": "new@example.com", "id": "CID_1", "contactLookupId": "CGC_1"},
+        {"email": "bad@example.com", "id": "CID_2", "contactLookupId": "CGC_2"},
+        {"email": "broken@example.com", "id": "CID_3", "contactLookupId": "CGC_3"},
+    ]
+    distributions = []
+
+    async def create_email_distribution(contact_lookup_id, *_):
+        distributions.append(contact_lookup_id)
+        if contact_lookup_id == "CGC_2":
+            raise main.api.error.QualtricsError("Invalid recipient")
+        if contact_lookup_id == "CGC_3":
+            raise TypeError("unexpected payload")
+        return {"id": f"EMD_{contact_lookup_id}"}
+
+    async def get_link(_survey_id, distribution_id):
+        return {"link": f"https://survey/{distribution_id}"}
+
+    monkeypatch.setattr(
+        main.api.client, "create_email_distribution", create_email_distribution
+    )
+    monkeypatch.setattr(main.api.client, "get_link", get_link)
+
+    response = client.post(
+        "/redirect-batch",
+        json={"participants": [{**REDIRECT_REQUEST, "email": e} for e in emails]},
+    )
+
+    assert [(r["status"], r.get("link")) for r in response.json()] == [
+        (200, "https://survey/EMD_CGC_0"),
+        (200, "https://survey/EMD_CGC_1"),
+        (422, None),
+        (422, None),
+        (502, None),
+    ]
+    assert "Duplicate" in response.json()[2]["detail"]
+    # One invite per participant, none for the duplicate
+    assert sorted(distributions) == ["CGC_0", "CGC_1", "CGC_2", "CGC_3"]
+    (_, _, rows), _ = main.api.client.import_contacts.await_args
+    assert [row["email"] for row in rows] == [
+        "new@example.com",
+        "bad@example.com",
+        "broken@example.com",
+    ]
+    assert asyncio.run(main.api.contacts.lookup("NEW@example.com"))["id"] == "CID_1"
+
+
+def test_redirect_traced(monkeypatch) -> None:
+    """test redirect stages continue the caller's trace and link outbox tasks"""
+    spans = []
+    monkeypatch.setattr(main.api.tracing, "_exporter", spans.append)
+    main.api.client.create_directory_entry.return_value = {
+        "id": "CID_1",
+        "contactLookupId": "CGC_1",
+    }
+    main.api.client.create_email_distribution.return_value = {"id": "EMD_1"}
+    main.api.client.get_link.return_value = {"link": "https://survey/link"}
+    trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+    response = client.post(
+        "/redirect",
+        json=REDIRECT_REQUEST,
+        headers={
+            "traceparent": f"00-{trace_id}-{parent_id}-01",
+            "Idempotency-Key": "traced-1234",
+        },
+    )
+
+    assert response.status_code == 200
+    by_name = {span.name: span for span in spans}
+    server = by_name["POST /redirect"]
+    assert server.trace_id == trace_id
+    assert server.parent_id == parent_id
+    assert response.headers["traceparent"] == server.traceparent
+    for stage in ("contact_lookup", "contact", "distribution", "link", "enqueue"):
+        assert by_name[f"redirect.{stage}"].trace_id == trace_id
+
+    traceparents = asyncio.run(
+        main.api.outbox.db.fetchall("SELECT traceparent FROM outbox")
+    )
+    assert {tp for (tp,) in traceparents} == {by_name["redirect.enqueue"].traceparent}
+
+
+def test_response_serialized_like_json_response(monkeypatch) -> None:
+    """test orjson bodies match the standard encoder's for unusual values"""
+    answers = {
+        "status": "Complete",
+        "response": {
+            1: "non-str key",
+            "recorded": datetime.datetime(2024, 5, 1, 12, 30, 5, 250, datetime.UTC),
+            "started": datetime.datetime(2024, 5, 1, 12, 0),
+            "big": 2**70,
+        },
+    }
+
+    async def get_response(*_):
+        return answers
+
+    monkeypatch.setattr(main.api.client, "get_response", get_response)
+
+    response = client.post("/response", json={"surveyId": "SV_1", "responseId": "R_1"})
+
+    assert response.content == JSONResponse(jsonable_encoder(answers)).body
+    del answers["response"]["big"]
+    assert main.api.FastJSONResponse(answers).body == (
+        JSONResponse(jsonable_encoder(answers)).body
+    )
+
+
+def test_response_deadline_header(monkeypatch) -> None:
+    """test the caller's timeout header shortens the request deadline"""
+
+    async def get_response(*_):
+        return {"remaining": main.api.deadline.remaining()}
+
+    monkeypatch.setattr(main.api.client, "get_response", get_response)
+
+    response = client.post(
+        "/response",
+        json={"surveyId": "SV_1", "responseId": "R_1"},
+        headers={"X-Request-Timeout": "2"},
+    )
+
+    assert 0 < response.json()["remaining"] <= 2
+
+
+def test_response_deadline_exceeded(monkeypatch) -> None:
+    """test requests past their deadline fail with a 504"""
+    monkeypatch.setattr(
+        main.api.client,
+        "get_response",
+        AsyncMock(side_effect=main.error.DeadlineExceeded()),
+    )
+
+    response = client.post("/response", json={"surveyId": "SV_1", "responseId": "R_1"})
+
+    assert response.status_code == 504
+
+
+def test_events(monkeypatch) -> None:
+    """test verified completedResponse events queue the response to be stored"""
+    monkeypatch.setattr(main.settings, "EVENT_SECRET", "secret")
+    event = {
+        "Topic": "surveyengine.completedResponse.SV_1",
+        "Status": "Complete",
+        "SurveyID": "SV_1",
+        "ResponseID": "R_1",
+    }
+
+    forged = client.post("/events?token=guess", data=event)
+    ignored = client.post(
+        "/events?token=secret",
+        data={**event, "Topic": "surveyengine.partialResponse.SV_1"},
+    )
+    accepted = client.post("/events?token=secret", data=event)
+
+    assert forged.status_code == 403
+    assert ignored.json() == {"accepted": False}
+    assert accepted.status_code == 202
+    assert accepted.json() == {"accepted": True}
+    tasks = asyncio.run(main.api.outbox.db.fetchall("SELECT kind, payload FROM outbox"))
+    assert tasks == [
+        ("store_response", json.dumps({"survey_id": "SV_1", "response_id": "R_1"}))
+    ]
+
+
+def test_event_token_not_logged() -> None:
+    """test the event secret is redacted from uvicorn access log lines"""
+    record = logging.LogRecord(
+        "uvicorn.access",
+        logging.INFO,
+        __file__,
+        0,
+        '%s - "%s %s HTTP/%s" %d',
+        ("127.0.0.1:5000", "POST", "/events?token=secret&x=1", "1.1", 202),
+        None,
+    )
+
+    assert logging.getLogger("uvicorn.access").filter(record)
+    assert record.getMessage() == (
+        '127.0.0.1:5000 - "POST /events?token=[redacted]&x=1 HTTP/1.1" 202'
+    )
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import pytest
+
+from qualtrix import cache, deadline, error
+
+
+def test_ttl_cache_expiry() -> None:
+    """test entries expire after their own ttl"""
+    ttl_cache = cache.TTLCache("test", 10)
+    ttl_cache.set("short", 1, 0.01)
+    ttl_cache.set("long", 2, 60)
+
+    time.sleep(0.02)
+
+    assert ttl_cache.get("short") is cache.MISSING
+    assert ttl_cache.get("long") == 2
+
+
+def test_ttl_cache_lru_eviction() -> None:
+    """test the least recently used entry is evicted first"""
+    ttl_cache = cache.TTLCache("test", 2)
+    ttl_cache.set("a", 1, 60)
+    ttl_cache.set("b", 2, 60)
+    ttl_cache.get("a")
+    ttl_cache.set("c", 3, 60)
+
+    assert ttl_cache.get("b") is cache.MISSING
+    assert ttl_cache.get("a") == 1
+    assert ttl_cache.get("c") == 3
+
+
+def test_single_flight_coalesces() -> None:
+    """test concurrent calls for one key share a single call"""
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def run():
+        flight = cache.SingleFlight()
+        return await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+
+    assert asyncio.run(run()) == [1] * 5
+    assert len(calls) == 1
+
+
+def test_single_flight_caller_deadlines() -> None:
+    """test a caller's deadline only ends its own wait, not the shared call"""
+
+    async def fetch():
+        # Like transport calls, bounded by the deadline of the current task
+        async with asyncio.timeout_at(deadline.at()):
+            await asyncio.sleep(0.05)
+        return "value"
+
+    async def call(flight, timeout):
+        deadline._deadline.set(asyncio.get_running_loop().time() + timeout)
+        return await flight.do("key", fetch)
+
+    async def run():
+        flight = cache.SingleFlight()
+        leader = asyncio.create_task(call(flight, 0.01))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(call(flight, 1))
+        with pytest.raises(error.DeadlineExceeded):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "value"
@@ -0,0 +1,337 @@
+import asyncio
+import importlib.machinery
+import importlib.util
+import time
+
+import fastapi
+import httpx
+import pytest
+from fastapi.responses import JSONResponse
+from prometheus_client import REGISTRY
+
+import qualtrix
+from qualtrix import (
+    api,
+    deadline,
+    error,
+    ratelimit,
+    settings,
+    shared_cache,
+    transport,
+)
+from tests.fake_qualtrics import BASE_PATH, FakeQualtrics
+
+BASE_URL = "http://qualtrics.test" + BASE_PATH
+LINK = {"contactId": "CID_1", "link": "https://survey.example.com/SV_2/EMD_1"}
+
+
+def _load_client():
+    # test_api replaces qualtrix.client in sys.modules with a mock
+    spec = importlib.machinery.PathFinder.find_spec(
+        "qualtrix.client", qualtrix.__path__
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+client = _load_client()
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """FakeQualtrics with a distribution EMD_1 created just now"""
+    qualtrics = FakeQualtrics()
+    qualtrics.distributions["EMD_1"] = {
+        "id": "EMD_1",
+        "contactId": "CID_1",
+        "surveyId": "SV_2",
+        "created": time.monotonic(),
+    }
+    monkeypatch.setattr(
+        transport,
+        "_client",
+        httpx.AsyncClient(transport=httpx.ASGITransport(app=qualtrics.app)),
+    )
+    monkeypatch.setattr(settings, "BASE_URL", BASE_URL)
+    monkeypatch.setattr(settings, "DIRECTORY_ID", "POOL_1")
+    monkeypatch.setattr(settings, "RETRY_BACKOFF", 0.001)
+    monkeypatch.setattr(settings, "LINK_POLL_MIN_WAIT", 0.02)
+    monkeypatch.setattr(settings, "LINK_POLL_MAX_WAIT", 0.02)
+    monkeypatch.setattr(ratelimit, "_buckets", {})
+    return qualtrics
+
+
+def _sample(name: str) -> float:
+    return REGISTRY.get_sample_value(name) or 0.0
+
+
+def test_link_ready_after_polls(fake) -> None:
+    """test the link is polled until populated and the wait is observed"""
+    fake.link_delay = 0.1
+    observed = _sample("qualtrix_link_ready_seconds_count")
+    waited = _sample("qualtrix_link_ready_seconds_sum")
+
+    link = asyncio.run(client.get_link("SV_2", "EMD_1"))
+
+    assert link == LINK
+    assert fake.requests > 1
+    assert _sample("qualtrix_link_ready_seconds_count") == observed + 1
+    assert _sample("qualtrix_link_ready_seconds_sum") - waited >= 0.05
+
+
+def test_link_ready_budget_exhausted(fake, monkeypatch) -> None:
+    """test polling gives up after LINK_READY_BUDGET seconds"""
+    fake.link_delay = 60
+    monkeypatch.setattr(settings, "LINK_READY_BUDGET", 0.05)
+    timeouts = _sample("qualtrix_link_ready_timeouts_total")
+
+    with pytest.raises(error.QualtricsError):
+        asyncio.run(client.get_link("SV_2", "EMD_1"))
+
+    assert fake.requests > 1
+    assert _sample("qualtrix_link_ready_timeouts_total") == timeouts + 1
+
+
+def test_link_poll_shared(fake) -> None:
+    """test concurrent waiters for one distribution share a poll loop"""
+    fake.link_delay = 0.05
+    observed = _sample("qualtrix_link_ready_seconds_count")
+
+    async def wait_twice():
+        return await asyncio.gather(
+            client.get_link("SV_2", "EMD_1"), client.get_link("SV_2", "EMD_1")
+        )
+
+    links = asyncio.run(wait_twice())
+
+    assert links == [LINK, LINK]
+    assert _sample("qualtrix_link_ready_seconds_count") == observed + 1
+    assert ("SV_2", "EMD_1") not in client._link_flight
+
+
+def _delay(fake: FakeQualtrics, path: str, seconds: float) -> None:
+    @fake.app.middleware("http")
+    async def delay(request: fastapi.Request, call_next):
+        if request.url.path.endswith(path):
+            await asyncio.sleep(seconds)
+        return await call_next(request)
+
+
+def test_response_ids_partial(fake) -> None:
+    """test slow and failing distributions are skipped at the deadline"""
+    for distribution_id in ("EMD_slow", "EMD_broken"):
+        fake.distributions[distribution_id] = {
+            "id": distribution_id,
+            "contactId": "CID_1",
+        }
+    _delay(fake, "/distributions/EMD_slow/history", 5)
+
+    @fake.app.middleware("http")
+    async def broken(request: fastapi.Request, call_next):
+        if request.url.path.endswith("/distributions/EMD_broken/history"):
+            return JSONResponse({"meta": {"error": "Broken"}}, status_code=400)
+        return await call_next(request)
+
+    async def response_ids():
+        loop = asyncio.get_running_loop()
+        return await client.get_responseIds_by_contact("CID_1", loop.time() + 0.2)
+
+    start_time = time.monotonic()
+    result = asyncio.run(response_ids())
+
+    assert time.monotonic() - start_time < 1
+    # Only EMD_1 answered, with the fake's three responses
+    assert len(result["responseIds"]) == 3
+    assert result["partial"]
+    assert result["failedDistributions"] == ["EMD_slow", "EMD_broken"]
+
+
+def test_response_ids_contact_history_deadline(fake, monkeypatch) -> None:
+    """test a slow contact history is bounded by the deadline too"""
+    monkeypatch.setattr(settings, "RESPONSE_IDS_DEADLINE", 0.1)
+    _delay(fake, "/contacts/CID_1/history", 5)
+
+    start_time = time.monotonic()
+    with pytest.raises(error.DeadlineExceeded):
+        asyncio.run(client.get_responseIds_by_contact("CID_1"))
+
+    assert time.monotonic() - start_time < 1
+
+
+def test_stored_response_served_from_cache(monkeypatch) -> None:
+    """test the store_response handler warms both raw variants of a response"""
+    fetched = []
+
+    async def get_response(survey_id, response_id, raw):
+        fetched.append((survey_id, response_id, raw))
+        return {"status": "Complete", "response": {"id": response_id}, "raw": {}}
+
+    monkeypatch.setattr(client, "_get_response", get_response)
+    monkeypatch.setattr(
+        client,
+        "response_cache",
+        shared_cache.Cache("responses", 100, shared_cache.MemoryBackend(100)),
+    )
+    monkeypatch.setattr(api, "client", client)
+
+    async def store_and_get():
+        assert await api.store_response(survey_id="SV_1", response_id="R_1")
+        return [
+            await client.get_response("SV_1", "R_1", raw=False),
+            await client.get_response("SV_1", "R_1", raw=True),
+        ]
+
+    answers = asyncio.run(store_and_get())
+
+    assert fetched == [("SV_1", "R_1", True)]
+    assert answers == [
+        {"status": "Complete", "response": {"id": "R_1"}},
+        {"status": "Complete", "response": {"id": "R_1"}, "raw": {}},
+    ]
+
+
+@pytest.fixture
+def schemas(fake, monkeypatch):
+    """an empty schema cache, schemas go stale at once and expire after 0.1s"""
+    monkeypatch.setattr(
+        client,
+        "schema_cache",
+        shared_cache.Cache("schemas", 100, shared_cache.MemoryBackend(100)),
+    )
+    monkeypatch.setattr(client, "_schema_refreshes", {})
+    monkeypatch.setattr(settings, "SCHEMA_CACHE_TTL", 0)
+    monkeypatch.setattr(settings, "SCHEMA_CACHE_STALE_TTL", 0.1)
+    return client.schema_cache
+
+
+def test_stale_schema_served_while_refreshed(fake, schemas) -> None:
+    """test stale schemas are served while one background refresh runs"""
+    schema = {
+        "meta": {"httpStatus": "200 - OK"},
+        "result": {"title": "SV_1", "properties": {}},
+    }
+
+    async def get_stale():
+        await client.get_survey_schema("SV_1")
+        [(fetched_at, _)] = await schemas.get_many(["SV_1"])
+        fake.latency, fake.jitter = 0.05, 0
+        # Shorter than the refresh, which must not inherit it
+        deadline._deadline.set(asyncio.get_running_loop().time() + 0.01)
+        served = await asyncio.gather(
+            *[client.get_survey_schema("SV_1") for _ in range(3)]
+        )
+        refreshes = list(client._schema_refreshes.values())
+        await asyncio.gather(*refreshes)
+        return served, len(refreshes), fetched_at, (await schemas.get("SV_1"))[0]
+
+    served, refreshes, fetched_at, refreshed_at = asyncio.run(get_stale())
+
+    assert served == [schema] * 3
+    assert refreshes == 1
+    assert fake.requests == 2
+    assert refreshed_at > fetched_at
+
+
+def test_schema_dropped_after_stale_ttl(fake, schemas) -> None:
+    """test schemas past SCHEMA_CACHE_STALE_TTL are fetched before serving"""
+
+    async def get_expired():
+        await client.get_survey_schema("SV_1")
+        await asyncio.sleep(0.15)
+        assert await schemas.get("SV_1") is shared_cache.MISSING
+        await client.get_survey_schema("SV_1")
+        return dict(client._schema_refreshes)
+
+    assert not asyncio.run(get_expired())
+    assert fake.requests == 2
+
+
+def test_schema_invalidated(fake, schemas, monkeypatch) -> None:
+    """test POST /survey-schema/invalidate drops the cached schema"""
+    monkeypatch.setattr(settings, "SCHEMA_CACHE_TTL", 60)
+    monkeypatch.setattr(api, "client", client)
+
+    async def invalidate():
+        await client.get_survey_schema("SV_1")
+        await client.get_survey_schema("SV_1")
+        await api.invalidate_schema(api.SurveyModel(surveyId="SV_1"))
+        assert await schemas.get("SV_1") is shared_cache.MISSING
+        await client.get_survey_schema("SV_1")
+
+    asyncio.run(invalidate())
+
+    assert fake.requests == 2
+
+
+class _Clock:
+    """time for the shared cache, advanced by hand"""
+
+    def __init__(self) -> None:
+        self.offset = 0
+
+    def monotonic(self) -> float:
+        return time.monotonic() + self.offset
+
+    def time(self) -> float:
+        return time.time() + self.offset
+
+
+@pytest.fixture
+def responses(fake, monkeypatch):
+    """an empty response cache, its clock, and the upstream requests per get"""
+    clock = _Clock()
+    monkeypatch.setattr(shared_cache, "time", clock)
+    monkeypatch.setattr(
+        client,
+        "response_cache",
+        shared_cache.Cache("responses", 100, shared_cache.MemoryBackend(100)),
+    )
+
+    def requests_for(response_id: str, raw: bool = False) -> int:
+        before = fake.requests
+        try:
+            asyncio.run(client.get_response("SV_1", response_id, raw))
+        except error.QualtricsError:
+            pass
+        return fake.requests - before
+
+    return clock, requests_for
+
+
+def test_finished_response_cached(responses) -> None:
+    """test finished responses are cached long term, raw and not separately"""
+    clock, requests_for = responses
+
+    assert requests_for("R_1") == 1
+    assert requests_for("R_1") == 0
+    assert requests_for("R_1", raw=True) == 1
+    assert requests_for("R_1", raw=True) == 0
+
+    clock.offset += settings.RESPONSE_CACHE_IN_PROGRESS_TTL + 1
+    assert requests_for("R_1") == 0
+    clock.offset += settings.RESPONSE_CACHE_FINISHED_TTL
+    assert requests_for("R_1") == 1
+
+
+def test_in_progress_response_cached_briefly(fake, responses) -> None:
+    """test unfinished responses expire after RESPONSE_CACHE_IN_PROGRESS_TTL"""
+    clock, requests_for = responses
+    fake.unfinished.add("R_2")
+
+    assert requests_for("R_2") == 1
+    assert requests_for("R_2") == 0
+
+    clock.offset += settings.RESPONSE_CACHE_IN_PROGRESS_TTL + 1
+    assert requests_for("R_2") == 1
+
+
+def test_missing_response_cached_briefly(responses) -> None:
+    """test not found responses are cached for RESPONSE_CACHE_MISS_TTL"""
+    clock, requests_for = responses
+
+    assert requests_for("X_1") > 0
+    assert requests_for("X_1") == 0
+
+    clock.offset += settings.RESPONSE_CACHE_MISS_TTL + 1
+    assert requests_for("X_1") > 0
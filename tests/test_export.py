@@ -0,0 +1,40 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from qualtrix import export
+
+
+def _zipped(document: dict) -> io.BytesIO:
+    fileobj = io.BytesIO()
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("Survey.json", json.dumps(document))
+    fileobj.seek(0)
+    return fileobj
+
+
+def test_iter_responses() -> None:
+    """test responses are decoded across chunk boundaries"""
+    responses = [
+        {"responseId": f"R_{i}", "values": {"text": "x" * i, "list": [1, 2]}}
+        for i in range(50)
+    ]
+
+    result = list(
+        export.iter_responses(_zipped({"responses": responses}), chunk_size=7)
+    )
+
+    assert result == responses
+
+
+def test_iter_responses_empty() -> None:
+    assert not list(export.iter_responses(_zipped({"responses": []})))
+
+
+def test_iter_json_array_truncated() -> None:
+    with pytest.raises(ValueError):
+        list(
+            export.iter_json_array(io.StringIO('{"responses": [{"a": 1},'), "responses")
+        )
@@ -0,0 +1,30 @@
+import asyncio
+
+from qualtrix import export_cache, storage
+
+
+def _collect(survey_id: str) -> list:
+    async def collect():
+        return [answer async for answer in export_cache.iter_answers(survey_id, 2)]
+
+    return asyncio.run(collect())
+
+
+def test_merge_and_token(tmp_path, monkeypatch) -> None:
+    """test incremental merges replace modified answers and keep the cursor"""
+    monkeypatch.setattr(
+        export_cache,
+        "db",
+        storage.Database(str(tmp_path / "exports.db"), export_cache.SCHEMA),
+    )
+
+    asyncio.run(export_cache.merge("SV_1", [("R_1", {"a": 1}), ("R_2", {"a": 2})]))
+    asyncio.run(export_cache.set_token("SV_1", "token-1"))
+    asyncio.run(export_cache.merge("SV_1", [("R_1", {"a": 3}), ("R_3", {"a": 4})]))
+
+    assert asyncio.run(export_cache.get_token("SV_1")) == "token-1"
+    assert _collect("SV_1") == [{"a": 2}, {"a": 3}, {"a": 4}]
+
+    asyncio.run(export_cache.clear("SV_1"))
+    assert asyncio.run(export_cache.get_token("SV_1")) is None
+    assert not _collect("SV_1")
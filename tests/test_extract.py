@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+from qualtrix import extract, settings, workers
+
+QUALITY_TEST = {
+    "values": {
+        "survey_type": "quality_test",
+        "QID4": [1, 3],
+        "QID4_1_TEXT": "cropped",
+        "QID7": 2,
+        "QID7_2_TEXT": "ignored",
+        "QID9": 5,
+        "QID9_5_TEXT": "Galaxy S9",
+        "QID18": 1,
+    },
+    "labels": {"QID1": "T_1", "QID4": ["Cropped", "Blurred"], "QID7": "Samsung"},
+}
+
+
+def test_quality_test_answer() -> None:
+    """test quality test answers pick the device model of the device group"""
+    answer = extract.extract(QUALITY_TEST)
+
+    assert answer["tester_id"] == "T_1"
+    assert answer["document_modification"] == {
+        "modifications": ["Cropped", "Blurred"],
+        "descriptions": ["cropped"],
+    }
+    assert answer["device"] == {
+        "device_group": "Samsung",
+        "device_model": None,
+        "device_details": "Galaxy S9",
+    }
+    assert answer["mask"] == {"type": None, "description": None}
+
+
+def test_extract_batch_skips_malformed() -> None:
+    """test batches use the default mapping and mark results without labels"""
+    results = [
+        QUALITY_TEST,
+        {"values": {"RulesConsentID": "RC_1"}, "labels": {"QID14": "Female"}},
+        {"values": {}},
+    ]
+
+    answers = extract.extract_batch(results)
+
+    assert answers[0] == extract.extract(QUALITY_TEST)
+    assert answers[1]["rules_consent_id"] == "RC_1"
+    assert answers[1]["gender"] == "Female"
+    assert answers[2] is None
+
+
+def test_extract_batch_in_worker_process(monkeypatch) -> None:
+    """test batches extract in a worker process and mark malformed results"""
+    monkeypatch.setattr(settings, "EXPORT_WORKERS", 1)
+    results = [QUALITY_TEST, "not a result", {"values": [], "labels": {}}]
+
+    async def run():
+        try:
+            return await workers.run(extract.extract_batch, results)
+        finally:
+            workers.shutdown()
+
+    assert asyncio.run(run()) == [extract.extract(QUALITY_TEST), None, None]
+
+
+def test_mappings_from_config(tmp_path, monkeypatch) -> None:
+    """test survey types can be added from the mappings file"""
+    path = tmp_path / "mappings.json"
+    path.write_text(
+        json.dumps(
+            {
+                "exit_survey": {
+                    "device": {
+                        "switch": "QID3",
+                        "cases": {"1": {"label": "QID4"}},
+                        "default": {"text": "QID3"},
+                    }
+                }
+            }
+        )
+    )
+    monkeypatch.setattr(settings, "ANSWER_MAPPINGS_PATH", str(path))
+    extract.clear()
+    try:
+        answers = extract.extract_batch(
+            [
+                {
+                    "values": {"survey_type": "exit_survey", "QID3": 1},
+                    "labels": {"QID4": "Pixel"},
+                },
+                {
+                    "values": {
+                        "survey_type": "exit_survey",
+                        "QID3": 2,
+                        "QID3_2_TEXT": "Fairphone",
+                    },
+                    "labels": {},
+                },
+            ]
+        )
+    finally:
+        extract.clear()
+
+    assert answers[0] == {"device": "Pixel"}
+    assert answers[1] == {"device": "Fairphone"}
@@ -0,0 +1,99 @@
+import asyncio
+import urllib.parse
+
+import fastapi
+import httpx
+
+from qualtrix import ratelimit, settings, transport
+from tests.fake_qualtrics import BASE_PATH, FakeQualtrics
+
+BASE_URL = "http://qualtrics.test" + BASE_PATH
+
+
+def _use(fake: FakeQualtrics, monkeypatch) -> None:
+    monkeypatch.setattr(
+        transport,
+        "_client",
+        httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app)),
+    )
+    monkeypatch.setattr(settings, "RETRY_BACKOFF", 0.001)
+    monkeypatch.setattr(ratelimit, "_buckets", {})
+
+
+def test_throttled_calls_retried(monkeypatch) -> None:
+    """test injected 429s are absorbed by transport retries"""
+    fake = FakeQualtrics(throttle_rate=0.3, seed=7)
+    _use(fake, monkeypatch)
+
+    async def fetch_all():
+        return await asyncio.gather(
+            *[
+                transport.get(f"{BASE_URL}/surveys/SV_1/responses/R_{i}")
+                for i in range(10)
+            ]
+        )
+
+    responses = asyncio.run(fetch_all())
+
+    assert [r.status_code for r in responses] == [200] * 10
+    assert fake.injected[429] > 0
+    assert fake.requests == 10 + fake.injected[429]
+
+
+def test_link_populated_after_delay(monkeypatch) -> None:
+    """test distribution links only appear after link_delay"""
+    fake = FakeQualtrics(link_delay=60)
+    _use(fake, monkeypatch)
+
+    async def create_and_link():
+        created = await transport.post(
+            f"{BASE_URL}/distributions",
+            json={
+                "recipients": {"contactId": "CID_1"},
+                "surveyLink": {"surveyId": "SV_2"},
+            },
+        )
+        distribution_id = created.json()["result"]["id"]
+        return await transport.get(
+            f"{BASE_URL}/distributions/{distribution_id}/links",
+            params={"surveyId": "SV_2"},
+        )
+
+    links = asyncio.run(create_and_link())
+
+    assert links.json()["result"]["elements"] == []
+
+
+def test_events_published_to_subscribers() -> None:
+    """test synthetic events are posted form encoded to matching subscriptions"""
+    received = []
+    subscriber = fastapi.FastAPI()
+
+    @subscriber.post("/events")
+    async def receive(request: fastapi.Request):
+        received.append(dict(urllib.parse.parse_qsl((await request.body()).decode())))
+
+    fake = FakeQualtrics(
+        event_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=subscriber))
+    )
+
+    async def subscribe_and_publish():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=fake.app)
+        ) as api:
+            await api.post(
+                BASE_URL + "/eventsubscriptions",
+                json={
+                    "topics": "surveyengine.completedResponse.SV_1",
+                    "publicationUrl": "http://qualtrix.test/events?token=secret",
+                },
+            )
+        return [
+            await fake.publish("SV_1", "R_1"),
+            await fake.publish("SV_2", "R_2"),
+        ]
+
+    assert asyncio.run(subscribe_and_publish()) == [[200], []]
+    assert [(event["SurveyID"], event["ResponseID"]) for event in received] == [
+        ("SV_1", "R_1")
+    ]
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from qualtrix import outbox, settings, storage
+
+
+@pytest.fixture(autouse=True)
+def outbox_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        outbox, "db", storage.Database(str(tmp_path / "outbox.db"), outbox.SCHEMA)
+    )
+    monkeypatch.setattr(settings, "OUTBOX_BACKOFF", 0.01)
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "OUTBOX_POLL_INTERVAL", 0.01)
+
+
+def _statuses() -> list:
+    async def run():
+        await outbox.start()
+        for attempts_needed in (2, 5):
+            await outbox.enqueue("flaky", {"attempts_needed": attempts_needed})
+        await asyncio.sleep(0.3)
+        await outbox.stop()
+        return await outbox.db.fetchall(
+            "SELECT status, attempts, result FROM outbox ORDER BY id"
+        )
+
+    return asyncio.run(run())
+
+
+def test_outbox_retry_and_dead_letter() -> None:
+    """test failed tasks are retried and dead-lettered after max attempts"""
+    calls = {}
+
+    @outbox.handler("flaky")
+    async def flaky(attempts_needed: int):
+        calls[attempts_needed] = calls.get(attempts_needed, 0) + 1
+        if calls[attempts_needed] < attempts_needed:
+            raise RuntimeError("try again")
+        return "ok"
+
+    assert _statuses() == [("done", 2, '"ok"'), ("dead", 3, None)]
@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from qualtrix import idempotency, shared_cache
+from tests.fake_redis import FakeRedis
+
+
+@contextlib.asynccontextmanager
+async def _backend(kind: str, tmp_path):
+    if kind == "memory":
+        yield shared_cache.MemoryBackend(100)
+    elif kind == "sqlite":
+        backend = shared_cache.SQLiteBackend(str(tmp_path / "cache.db"))
+        yield backend
+        await backend.close()
+    else:
+        fake = FakeRedis(password="secret")
+        url = await fake.start()
+        backend = shared_cache.RedisBackend(url.replace("//", "//:secret@"))
+        yield backend
+        await backend.close()
+        await fake.stop()
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite", "redis"])
+def test_backend_ttl_and_lock(kind, tmp_path) -> None:
+    """test every backend expires entries and takes locks the same way"""
+
+    async def run():
+        async with _backend(kind, tmp_path) as backend:
+            ttl_cache = shared_cache.Cache("test", 100, backend)
+            await ttl_cache.set(("SV_1", "R_1"), {"a": [1, 2]}, 0.05)
+            await ttl_cache.set_many([("b", "x"), ("c", None)], 60)
+            assert await ttl_cache.get_many([("SV_1", "R_1"), "b", "d"]) == [
+                {"a": [1, 2]},
+                "x",
+                shared_cache.MISSING,
+            ]
+            assert await ttl_cache.get("c") is None
+
+            assert await backend.add("lock", b"1", 0.05)
+            assert not await backend.add("lock", b"2", 60)
+
+            await asyncio.sleep(0.1)
+            assert await ttl_cache.get(("SV_1", "R_1")) is shared_cache.MISSING
+            assert await backend.add("lock", b"3", 60)
+
+            await ttl_cache.delete("b")
+            assert await ttl_cache.get("b") is shared_cache.MISSING
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite", "redis"])
+def test_expired_lock_is_not_released(kind, tmp_path, monkeypatch) -> None:
+    """test a load outliving its lock leaves the next holder's lock alone"""
+    monkeypatch.setattr(shared_cache.settings, "CACHE_LOCK_TTL", 0.05)
+
+    async def run():
+        async with _backend(kind, tmp_path) as backend:
+            slow_cache = shared_cache.Cache("test", 100, backend)
+            lock_key = slow_cache._key("SV_1") + ":lock"
+
+            async def load():
+                await asyncio.sleep(0.1)
+                # Another instance takes the lock once ours has expired
+                assert await backend.add(lock_key, b"other", 60)
+                return "x", 60
+
+            assert await slow_cache.fetch("SV_1", load) == "x"
+            assert await backend.get_many([lock_key]) == [b"other"]
+
+    asyncio.run(run())
+
+
+def test_fetch_stampede_across_instances(monkeypatch) -> None:
+    """test concurrent fetches from two instances load the value once"""
+    monkeypatch.setattr(shared_cache.settings, "CACHE_LOCK_POLL", 0.01)
+    loads = []
+
+    async def load():
+        loads.append(1)
+        await asyncio.sleep(0.05)
+        return {"schema": len(loads)}, 60
+
+    async def run():
+        fake = FakeRedis()
+        url = await fake.start()
+        instances = [
+            shared_cache.Cache("schemas", 100, shared_cache.RedisBackend(url))
+            for _ in range(2)
+        ]
+        values = await asyncio.gather(
+            *(instance.fetch("SV_1", load) for instance in instances for _ in range(5))
+        )
+        for instance in instances:
+            await instance.store.close()
+        await fake.stop()
+        return values
+
+    assert asyncio.run(run()) == [{"schema": 1}] * 10
+    assert len(loads) == 1
+
+
+def test_idempotent_replay_across_instances(monkeypatch) -> None:
+    """test a retry sent to another instance replays the first result"""
+    calls = []
+
+    async def redirect():
+        calls.append(1)
+        return {"link": "https://survey.example.com/SV_1"}
+
+    async def run():
+        fake = FakeRedis()
+        url = await fake.start()
+        results = []
+        for _ in range(2):
+            instance = shared_cache.Cache(
+                "idempotency", 100, shared_cache.RedisBackend(url)
+            )
+            monkeypatch.setattr(idempotency, "_results", instance)
+            results.append(await idempotency.run("key", redirect, "fingerprint"))
+            await instance.store.close()
+        await fake.stop()
+        return results
+
+    assert asyncio.run(run()) == [
+        ({"link": "https://survey.example.com/SV_1"}, False),
+        ({"link": "https://survey.example.com/SV_1"}, True),
+    ]
+    assert len(calls) == 1
+
+
+def test_unreachable_backend_is_a_miss() -> None:
+    """test loads still succeed while the shared cache is down"""
+
+    async def run():
+        # Nothing listens on port 1
+        unreachable = shared_cache.Cache(
+            "responses", 100, shared_cache.RedisBackend("redis://127.0.0.1:1/0")
+        )
+        assert await unreachable.get("R_1") is shared_cache.MISSING
+        return await unreachable.fetch("R_1", lambda: asyncio.sleep(0, ("x", 60)))
+
+    assert asyncio.run(run()) == "x"
@@ -0,0 +1,106 @@
+import asyncio
+import csv
+import io
+import subprocess
+import sys
+
+import pyarrow.ipc
+import pyarrow.parquet
+
+from qualtrix import extract, settings, tabular
+
+ANSWERS = [
+    {
+        "rules_consent_id": f"RC_{i}",
+        "ethnicity": None,
+        "race": ["Asian", "White"],
+        "gender": "Female",
+        "age": "33",
+        "income": None,
+        "education": None,
+        "skin_tone": None,
+        "image_redacted_request": None,
+        "comments": None,
+    }
+    for i in range(5)
+]
+
+
+def _encode(answers: list, media_type: str) -> bytes:
+    async def iterate():
+        for answer in answers:
+            yield answer
+
+    async def collect():
+        return b"".join(
+            [chunk async for chunk in tabular.encode(iterate(), media_type)]
+        )
+
+    return asyncio.run(collect())
+
+
+def test_negotiate() -> None:
+    """test the first columnar type in Accept is chosen, JSON otherwise"""
+    assert tabular.negotiate("application/json") is None
+    assert tabular.negotiate("text/csv;q=0.5, application/json") == "text/csv"
+
+
+def test_negotiate_without_pyarrow(monkeypatch) -> None:
+    """test Arrow and Parquet fall back to CSV without pyarrow"""
+    monkeypatch.setattr(tabular, "HAS_PYARROW", False)
+
+    assert tabular.negotiate(tabular.PARQUET_MEDIA_TYPE) == tabular.CSV_MEDIA_TYPE
+
+
+def test_pyarrow_imported_lazily() -> None:
+    """test the app starts without importing pyarrow"""
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, qualtrix.main; assert 'pyarrow' not in sys.modules",
+        ],
+        check=True,
+    )
+
+
+def test_csv() -> None:
+    """test answers are flattened into the extractor's columns"""
+    rows = list(csv.reader(io.StringIO(_encode(ANSWERS, "text/csv").decode())))
+
+    assert tuple(rows[0]) == tabular.columns()
+    default = extract.fields()[extract.DEFAULT]
+    assert tuple(rows[0][: len(default)]) == default
+    assert rows[1][:4] == ["RC_0", "", '["Asian", "White"]', "Female"]
+    assert len(rows) == 6
+
+
+def test_parquet_row_groups(monkeypatch) -> None:
+    """test Parquet is written in row groups of EXPORT_BATCH_SIZE"""
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+
+    data = _encode(ANSWERS, tabular.PARQUET_MEDIA_TYPE)
+
+    table = pyarrow.parquet.ParquetFile(io.BytesIO(data))
+    assert table.metadata.num_row_groups == 3
+    assert table.read().column("rules_consent_id").to_pylist() == [
+        f"RC_{i}" for i in range(5)
+    ]
+
+
+def test_arrow_mixed_survey_types() -> None:
+    """test answers of every survey type keep their nested fields as columns"""
+    answer = extract.extract(
+        {
+            "values": {"survey_type": "quality_test", "QID7": 1},
+            "labels": {"QID7": "Apple", "QID8": "iPhone 12"},
+        }
+    )
+
+    table = pyarrow.ipc.open_stream(
+        _encode([ANSWERS[0], answer], tabular.ARROW_MEDIA_TYPE)
+    ).read_all()
+
+    assert set(table.column_names) >= set(extract.fields()["quality_test"])
+    assert table.column("rules_consent_id").to_pylist() == ["RC_0", None]
+    assert table.column("device.device_model").to_pylist() == [None, "iPhone 12"]
@@ -0,0 +1,156 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+
+from qualtrix import deadline, error, ratelimit, settings, transport
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    """queue of (status, headers) returned by the mocked Qualtrics API"""
+    queue = []
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        status, headers = queue.pop(0)
+        return httpx.Response(status, headers=headers, json={})
+
+    monkeypatch.setattr(
+        transport, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    monkeypatch.setattr(settings, "RETRY_BACKOFF", 0.001)
+    monkeypatch.setattr(ratelimit, "_buckets", {})
+    return queue, requests
+
+
+def test_retry_after_honored(responses) -> None:
+    """test 429 responses are retried after Retry-After"""
+    queue, requests = responses
+    queue.extend([(429, {"Retry-After": "0"}), (200, {})])
+
+    response = asyncio.run(transport.post("https://qualtrics/API/v3/distributions"))
+
+    assert response.status_code == 200
+    assert len(requests) == 2
+
+
+def test_post_not_retried_on_server_error(responses) -> None:
+    """test state changing requests are not replayed after a 5xx"""
+    queue, requests = responses
+    queue.extend([(503, {}), (200, {})])
+
+    response = asyncio.run(transport.post("https://qualtrics/API/v3/distributions"))
+
+    assert response.status_code == 503
+    assert len(requests) == 1
+
+
+def test_get_retried_on_extra_status(responses) -> None:
+    """test calls can opt in to retrying additional statuses"""
+    queue, requests = responses
+    queue.extend([(404, {}), (503, {}), (200, {})])
+
+    response = asyncio.run(
+        transport.get(
+            "https://qualtrics/API/v3/surveys/SV_1/responses/R_1", retry_on=(404,)
+        )
+    )
+
+    assert response.status_code == 200
+    assert len(requests) == 3
+
+
+def test_interactive_calls_take_priority() -> None:
+    """test background callers wait while interactive callers are queued"""
+    order = []
+
+    async def call(bucket, name: str, interactive: bool):
+        await bucket.acquire(interactive)
+        order.append(name)
+
+    async def run():
+        bucket = ratelimit.TokenBucket(rate=100, capacity=1)
+        bucket.tokens = 0
+        await asyncio.gather(
+            call(bucket, "background", False),
+            call(bucket, "interactive-1", True),
+            call(bucket, "interactive-2", True),
+        )
+
+    asyncio.run(run())
+
+    assert order[-1] == "background"
+
+
+def test_deadline_cancels_call(monkeypatch) -> None:
+    """test outbound calls are cancelled once the request deadline passes"""
+
+    async def slow(_request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(1)
+        return httpx.Response(200, json={})
+
+    monkeypatch.setattr(
+        transport, "_client", httpx.AsyncClient(transport=httpx.MockTransport(slow))
+    )
+
+    async def run():
+        deadline._deadline.set(asyncio.get_running_loop().time() + 0.05)
+        await transport.get("https://qualtrics/API/v3/surveys/SV_1/responses/R_1")
+
+    with pytest.raises(error.DeadlineExceeded):
+        asyncio.run(run())
+
+
+def test_upstream_metrics_recorded(responses) -> None:
+    """test each attempt is counted by operation and status, and retries counted"""
+    queue, _ = responses
+    queue.extend([(429, {"Retry-After": "0"}), (200, {})])
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    before = {
+        "throttled": sample(
+            "qualtrix_upstream_responses_total", operation="probe", status="429"
+        ),
+        "ok": sample(
+            "qualtrix_upstream_responses_total", operation="probe", status="200"
+        ),
+        "retries": sample("qualtrix_upstream_retries_total", operation="probe"),
+        "attempts": sample(
+            "qualtrix_upstream_request_seconds_count", operation="probe"
+        ),
+    }
+
+    asyncio.run(
+        transport.get("https://qualtrics/API/v3/distributions", operation="probe")
+    )
+
+    assert (
+        sample("qualtrix_upstream_responses_total", operation="probe", status="429")
+        == before["throttled"] + 1
+    )
+    assert (
+        sample("qualtrix_upstream_responses_total", operation="probe", status="200")
+        == before["ok"] + 1
+    )
+    assert (
+        sample("qualtrix_upstream_retries_total", operation="probe")
+        == before["retries"] + 1
+    )
+    assert (
+        sample("qualtrix_upstream_request_seconds_count", operation="probe")
+        == before["attempts"] + 2
+    )
+    assert sample("qualtrix_upstream_requests_in_flight", operation="probe") == 0
+
+
+@pytest.mark.parametrize("content", [b"", b"<html>Bad Gateway</html>"])
+def test_decode_invalid_body(content) -> None:
+    """test bodies that are not JSON raise like Response.json()"""
+    with pytest.raises(json.JSONDecodeError):
+        transport.decode(httpx.Response(502, content=content))